@@ -19,8 +19,8 @@ DELAY = .1  # 10Hz
 USE_API = False
 
 
-def read_uhf_ids(node, method_id, val):
-    return read_uhf(node, method_id, val)
+def read_uhf_ids(call):
+    return read_uhf(call)
 
 
 def read_card(reader, token):
@@ -249,13 +249,13 @@ def uhf_thread():
     readings = []
     sleep(5)
 
-    client, node, method_id, val = prepare_uhf()
+    client, call = prepare_uhf()
 
     try:
         while not DO_STOP:
             sleep(DELAY)
 
-            ids = read_uhf_ids(node, method_id, val)
+            ids = read_uhf_ids(call)
             for v in ids:
                 if v not in [id_ for (id_, _) in readings]:
                     id_entered(v)
@@ -0,0 +1,61 @@
+"""
+Contention benchmark of the server address space:
+read throughput of a few reader threads while writer threads are added
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+import threading
+
+
+from opcua import ua, Server
+
+
+DURATION = 2
+READERS = 4
+NB_VARS = 100
+
+
+def run(aspace, nodeids, nb_writers):
+    stop = threading.Event()
+    counts = [0] * (READERS + nb_writers)
+
+    def reader(idx):
+        while not stop.is_set():
+            for nodeid in nodeids:
+                aspace.get_attribute_value(nodeid, ua.AttributeIds.Value)
+            counts[idx] += len(nodeids)
+
+    def writer(idx):
+        val = 0
+        while not stop.is_set():
+            val += 1
+            for nodeid in nodeids:
+                aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, ua.DataValue(ua.Variant(val, ua.VariantType.Int64)))
+            counts[idx] += len(nodeids)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(READERS + i,)) for i in range(nb_writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts[:READERS]) / DURATION, sum(counts[READERS:]) / DURATION
+
+
+def mymain():
+    server = Server()
+    idx = server.register_namespace("http://examples.freeopcua.github.io")
+    myobj = server.get_objects_node().add_object(idx, "MyObject")
+    nodeids = [myobj.add_variable(idx, "MyVariable{0}".format(i), 0).nodeid for i in range(NB_VARS)]
+    aspace = server.iserver.aspace
+
+    for nb_writers in (0, 1, 2, 4, 8):
+        reads, writes = run(aspace, nodeids, nb_writers)
+        print("{0} writers: {1:10.0f} reads/s {2:10.0f} writes/s".format(nb_writers, reads, writes))
+
+
+if __name__ == "__main__":
+    mymain()
@@ -0,0 +1,75 @@
+"""
+Benchmark of data change fan-out on the server: time of a write to a variable
+monitored by many subscriptions, and total CPU time per write including the
+notifications made at the publish ticks. With disjoint watch sets, each
+subscription monitors its own variable and the writes go round robin over them
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+
+from opcua import ua, Server
+from opcua.common.utils import ThreadLoop
+
+
+NB_WRITES = 20000
+COUNTS = (1, 50, 200)
+
+
+def bench(server, variables, nb):
+    service = server.iserver.subscription_service
+    loop = ThreadLoop()
+    loop.start()
+    service.set_loop(loop)
+    notifications = [0]
+
+    def callback(result):
+        for notif in result.NotificationMessage.NotificationData:
+            notifications[0] += len(getattr(notif, "MonitoredItems", []))
+
+    params = ua.CreateSubscriptionParameters()
+    params.RequestedPublishingInterval = 100
+    params.RequestedLifetimeCount = 1000000000
+    params.RequestedMaxKeepAliveCount = 1000
+    ids = []
+    for i in range(nb):
+        subid = service.create_subscription(params, callback).SubscriptionId
+        ids.append(subid)
+        mparams = ua.CreateMonitoredItemsParameters()
+        mparams.SubscriptionId = subid
+        item = ua.MonitoredItemCreateRequest()
+        item.ItemToMonitor.NodeId = variables[i % len(variables)].nodeid
+        item.ItemToMonitor.AttributeId = ua.AttributeIds.Value
+        item.MonitoringMode = ua.MonitoringMode.Reporting
+        item.RequestedParameters.ClientHandle = 1
+        item.RequestedParameters.QueueSize = 1
+        mparams.ItemsToCreate = [item]
+        service.create_monitored_items(mparams)
+    time.sleep(0.3)
+    start, cpu = time.time(), time.process_time()
+    for val in range(NB_WRITES):
+        variables[val % len(variables)].set_value(val, ua.VariantType.Int64)
+    write = time.time() - start
+    time.sleep(0.3)
+    cpu = time.process_time() - cpu
+    service.delete_subscriptions(ids)
+    service.set_loop(None)
+    loop.stop()
+    print("{0:4} subscriptions, {1:4} variables: {2:6.1f} us per write {3:6.1f} us CPU per write {4:8} notifications".format(
+        nb, len(variables), write / NB_WRITES * 1e6, cpu / NB_WRITES * 1e6, notifications[0]))
+
+
+def mymain():
+    server = Server()
+    objects = server.get_objects_node()
+    var = objects.add_variable(2, "FanOutVariable", 0, ua.VariantType.Int64)
+    for nb in COUNTS:
+        bench(server, [var], nb)
+    for nb in COUNTS:
+        variables = [objects.add_variable(2, "DisjointVariable{0}".format(i), 0, ua.VariantType.Int64) for i in range(nb)]
+        bench(server, variables, nb)
+
+
+if __name__ == "__main__":
+    mymain()
@@ -0,0 +1,90 @@
+"""
+Benchmark of event filtering on the server: events triggered per second with
+subscriptions to events whose EventFilter keeps the events of a type with a
+Severity of at least 500, half of the triggered events
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+
+from opcua import ua, Server
+
+
+NB_EVENTS = 5000
+COUNTS = (1, 10, 50)
+
+
+class Handler(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def event_notification(self, event):
+        self.count += 1
+
+
+def make_filter(server):
+    evfilter = ua.EventFilter()
+    for name in ("EventId", "EventType", "SourceNode", "SourceName", "Time", "Message", "Severity"):
+        op = ua.SimpleAttributeOperand()
+        op.AttributeId = ua.AttributeIds.Value
+        op.BrowsePath = [ua.QualifiedName(name, 0)]
+        evfilter.SelectClauses.append(op)
+
+    def operand(cls, **kwargs):
+        op = cls()
+        for name, value in kwargs.items():
+            setattr(op, name, value)
+        return op
+
+    elements = []
+    for operator, operands in (
+            (ua.FilterOperator.And, [operand(ua.ElementOperand, Index=1), operand(ua.ElementOperand, Index=2)]),
+            (ua.FilterOperator.InList, [operand(ua.SimpleAttributeOperand, BrowsePath=[ua.QualifiedName("EventType", 0)]),
+                                        operand(ua.LiteralOperand, Value=ua.Variant(ua.NodeId(ua.ObjectIds.BaseEventType)))]),
+            (ua.FilterOperator.GreaterThanOrEqual, [operand(ua.SimpleAttributeOperand, BrowsePath=[ua.QualifiedName("Severity", 0)]),
+                                                    operand(ua.LiteralOperand, Value=ua.Variant(500))])):
+        el = ua.ContentFilterElement()
+        el.FilterOperator = operator
+        el.FilterOperands = operands
+        elements.append(el)
+    evfilter.WhereClause.Elements = elements
+    return evfilter
+
+
+def bench(server, nb):
+    evfilter = make_filter(server)
+    subs = []
+    handler = Handler()
+    for _ in range(nb):
+        sub = server.create_subscription(100, handler)
+        sub.subscribe_events(evfilter=evfilter)
+        subs.append(sub)
+    evgen = server.get_event_generator()
+    evgen.event.SourceName = "Benchmark"
+    time.sleep(0.3)
+    start = time.time()
+    for i in range(NB_EVENTS):
+        evgen.event.Severity = 300 if i % 2 else 700
+        evgen.trigger(message="Event")
+    duration = time.time() - start
+    time.sleep(0.5)
+    for sub in subs:
+        sub.delete()
+    print("{0:4} subscriptions: {1:8.0f} events/s triggered, {2:6.1f} us per event per subscription, {3} notified".format(
+        nb, NB_EVENTS / duration, duration / NB_EVENTS / nb * 1e6, handler.count))
+
+
+def mymain():
+    server = Server()
+    server.start()
+    try:
+        for nb in COUNTS:
+            bench(server, nb)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    mymain()
@@ -0,0 +1,42 @@
+"""
+Cold start import time of the library, each import in a new interpreter.
+Run it twice, the first run may compile bytecode.
+The client-only path (from opcua import Client, as used by the ua* tools)
+should stay below TARGET_CLIENT_MS
+"""
+import os
+import subprocess
+import sys
+
+
+RUNS = 5
+TARGET_CLIENT_MS = 150
+
+IMPORTS = (
+    "import opcua",
+    "from opcua import ua",
+    "from opcua import Client",
+    "import opcua.tools",
+    "from opcua import Server",
+)
+
+
+def measure(statement):
+    code = "import time; t = time.perf_counter(); {0}; print(time.perf_counter() - t)".format(statement)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([".."] + sys.path))
+    times = []
+    for _ in range(RUNS):
+        out = subprocess.check_output([sys.executable, "-W", "ignore", "-c", code], env=env)
+        times.append(float(out) * 1000)
+    return sorted(times)[RUNS // 2]
+
+
+def mymain():
+    for statement in IMPORTS:
+        print("{0:30} {1:8.1f} ms".format(statement, measure(statement)))
+    client = measure("from opcua import Client")
+    print("client target {0} ms: {1}".format(TARGET_CLIENT_MS, "OK" if client < TARGET_CLIENT_MS else "MISSED"))
+
+
+if __name__ == "__main__":
+    mymain()
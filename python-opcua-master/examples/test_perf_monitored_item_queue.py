@@ -0,0 +1,54 @@
+"""
+Benchmark of the notification queues of monitored items: time to queue
+notifications of 10 monitored items with a full queue, and to drain the
+queues into a publish result
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+
+from opcua import ua, Server
+
+
+NB_ITEMS = 10
+NB_NOTIFICATIONS = 200000
+QUEUE_SIZES = (10, 1000, 10000)
+
+
+def bench(server, size):
+    service = server.iserver.subscription_service
+    params = ua.CreateSubscriptionParameters()
+    params.RequestedPublishingInterval = 100000
+    params.RequestedLifetimeCount = 1000000000
+    params.RequestedMaxKeepAliveCount = 1000
+    subid = service.create_subscription(params, lambda result: None).SubscriptionId
+    isub = service.subscriptions[subid]
+    notifs = []
+    for i in range(NB_NOTIFICATIONS):
+        notif = ua.MonitoredItemNotification()
+        notif.ClientHandle = i % NB_ITEMS
+        notif.Value = ua.DataValue(ua.Variant(i, ua.VariantType.Int64))
+        notifs.append(notif)
+    start = time.time()
+    for notif in notifs:
+        isub.enqueue_datachange_event(notif.ClientHandle, notif, size)
+    enqueue = time.time() - start
+    start = time.time()
+    with isub._lock:
+        result = isub._pop_publish_result()
+    drain = time.time() - start
+    nb = len(result.NotificationMessage.NotificationData[0].MonitoredItems)
+    service.delete_subscriptions([subid])
+    print("queue size {0:6}: {1:6.2f} us per notification queued, {2:8.2f} ms to drain {3} notifications".format(
+        size, enqueue / NB_NOTIFICATIONS * 1e6, drain * 1e3, nb))
+
+
+def mymain():
+    server = Server()
+    for size in QUEUE_SIZES:
+        bench(server, size)
+
+
+if __name__ == "__main__":
+    mymain()
@@ -0,0 +1,59 @@
+"""
+Benchmark of the publish cycle timers of server subscriptions: CPU time used
+by the server for each publish cycle with 1k and 10k subscriptions publishing
+every 50 to 100 ms, when there is nothing to notify
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+
+from opcua import ua, Server
+from opcua.common.utils import ThreadLoop
+
+
+DURATION = 3
+COUNTS = (1000, 10000)
+
+
+def bench(server, nb):
+    service = server.iserver.subscription_service
+    loop = ThreadLoop()
+    loop.start()
+    service.set_loop(loop)
+    cycles = [0]
+
+    def callback(result):
+        cycles[0] += 1
+
+    params = ua.CreateSubscriptionParameters()
+    params.RequestedLifetimeCount = 1000000000
+    # a keep alive is published every second cycle
+    params.RequestedMaxKeepAliveCount = 0
+    ids = []
+    for i in range(nb):
+        params.RequestedPublishingInterval = 50 + i % 6 * 10
+        ids.append(service.create_subscription(params, callback).SubscriptionId)
+    time.sleep(0.5)
+    cycles[0] = 0
+    start, cpu = time.time(), time.process_time()
+    time.sleep(DURATION)
+    cpu = time.process_time() - cpu
+    nb_cycles = cycles[0] * 2
+    duration = time.time() - start
+    service.delete_subscriptions(ids)
+    service.set_loop(None)
+    loop.stop()
+    expected = sum(1000.0 / (50 + i % 6 * 10) for i in range(nb)) * duration
+    print("{0:6} subscriptions: {1:8.0f} cycles/s ({2:3.0f}% of expected) {3:6.1f} us CPU per cycle".format(
+        nb, nb_cycles / duration, 100.0 * nb_cycles / expected, cpu / nb_cycles * 1e6))
+
+
+def mymain():
+    server = Server()
+    for nb in COUNTS:
+        bench(server, nb)
+
+
+if __name__ == "__main__":
+    mymain()
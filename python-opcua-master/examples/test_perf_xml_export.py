@@ -0,0 +1,87 @@
+"""
+Benchmark of XmlExporter on a generated namespace: time and peak python
+memory of the streaming export_xml against build_etree followed by write_xml
+"""
+import sys
+sys.path.insert(0, "..")
+import os
+import time
+import tempfile
+import tracemalloc
+
+
+from opcua import ua, Server
+from opcua.common.xmlexporter import XmlExporter
+
+
+NB_OBJECTS = 10000
+VARS_PER_OBJECT = 9
+
+
+def add_nodes(server, idx):
+    items = []
+    nid = 1
+    for obj in range(NB_OBJECTS):
+        item = ua.AddNodesItem()
+        item.RequestedNewNodeId = ua.NodeId(nid, idx)
+        item.BrowseName = ua.QualifiedName("Object{0}".format(obj), idx)
+        item.NodeClass = ua.NodeClass.Object
+        item.ParentNodeId = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+        item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+        item.TypeDefinition = ua.NodeId(ua.ObjectIds.BaseObjectType)
+        attrs = ua.ObjectAttributes()
+        attrs.DisplayName = ua.LocalizedText(item.BrowseName.Name)
+        item.NodeAttributes = attrs
+        items.append(item)
+        parent = item.RequestedNewNodeId
+        nid += 1
+        for var in range(VARS_PER_OBJECT):
+            item = ua.AddNodesItem()
+            item.RequestedNewNodeId = ua.NodeId(nid, idx)
+            item.BrowseName = ua.QualifiedName("Variable{0}".format(var), idx)
+            item.NodeClass = ua.NodeClass.Variable
+            item.ParentNodeId = parent
+            item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasComponent)
+            item.TypeDefinition = ua.NodeId(ua.ObjectIds.BaseDataVariableType)
+            attrs = ua.VariableAttributes()
+            attrs.DisplayName = ua.LocalizedText(item.BrowseName.Name)
+            attrs.DataType = ua.NodeId(ua.ObjectIds.Double)
+            attrs.Value = ua.Variant(1.5, ua.VariantType.Double)
+            item.NodeAttributes = attrs
+            items.append(item)
+            nid += 1
+    server.iserver.isession.add_nodes(items, bulk=True)
+    return [item.RequestedNewNodeId for item in items]
+
+
+def bench(name, func):
+    tracemalloc.start()
+    start = time.time()
+    func()
+    duration = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{0:20} {1:8.2f} s {2:8.1f} MB peak".format(name, duration, peak / 1e6))
+
+
+def mymain():
+    server = Server()
+    idx = server.register_namespace("http://examples.freeopcua.github.io/perf")
+    nodeids = add_nodes(server, idx)
+    print("{0} nodes".format(len(nodeids)))
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    try:
+        def etree():
+            exp = XmlExporter(server)
+            exp.build_etree(nodeids)
+            exp.write_xml(path)
+
+        bench("build_etree", etree)
+        bench("export_xml", lambda: XmlExporter(server).export_xml(nodeids, path))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    mymain()
@@ -0,0 +1,81 @@
+"""
+Benchmark of XmlImporter on the companion specifications shipped in schemas
+and on a generated model, in which children are written before their parent
+"""
+import sys
+sys.path.insert(0, "..")
+import os
+import time
+import tempfile
+
+
+from opcua import Server
+
+
+NB_OBJECTS = 5000
+VARS_PER_OBJECT = 9
+
+HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<UANodeSet xmlns="http://opcfoundation.org/UA/2011/03/UANodeSet.xsd">
+  <NamespaceUris><Uri>http://examples.freeopcua.github.io/perf</Uri></NamespaceUris>
+  <Aliases><Alias Alias="Double">i=11</Alias></Aliases>
+"""
+
+OBJECT = """  <UAObject NodeId="ns=1;i={0}" BrowseName="1:Object{0}">
+    <DisplayName>Object{0}</DisplayName>
+    <References>
+      <Reference ReferenceType="HasTypeDefinition">i=58</Reference>
+      <Reference ReferenceType="Organizes" IsForward="false">{1}</Reference>
+    </References>
+  </UAObject>
+"""
+
+VARIABLE = """  <UAVariable NodeId="ns=1;i={0}" BrowseName="1:Variable{0}" DataType="Double">
+    <DisplayName>Variable{0}</DisplayName>
+    <References>
+      <Reference ReferenceType="HasTypeDefinition">i=63</Reference>
+      <Reference ReferenceType="HasComponent" IsForward="false">ns=1;i={1}</Reference>
+    </References>
+    <Value><Double xmlns="http://opcfoundation.org/UA/2008/02/Types.xsd">1.5</Double></Value>
+  </UAVariable>
+"""
+
+
+def make_model(path):
+    with open(path, "w") as f:
+        f.write(HEADER)
+        nid = NB_OBJECTS * (VARS_PER_OBJECT + 1)
+        # reversed so that children come before their parent
+        for obj in range(NB_OBJECTS, 0, -1):
+            for var in range(VARS_PER_OBJECT):
+                f.write(VARIABLE.format(nid, obj))
+                nid -= 1
+            parent = "i=85" if obj == 1 else "ns=1;i={0}".format(obj - 1)
+            f.write(OBJECT.format(obj, parent))
+        f.write("</UANodeSet>\n")
+
+
+def bench(name, paths):
+    server = Server()
+    start = time.time()
+    nb = 0
+    for path in paths:
+        nb += len(server.import_xml(path))
+    print("{0:20} {1:6} nodes {2:8.2f} s".format(name, nb, time.time() - start))
+
+
+def mymain():
+    schemas = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "schemas")
+    bench("Di", [os.path.join(schemas, "Opc.Ua.Di.NodeSet2.xml")])
+    bench("Di + Adi", [os.path.join(schemas, "Opc.Ua.Di.NodeSet2.xml"), os.path.join(schemas, "Opc.Ua.Adi.NodeSet2.xml")])
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    try:
+        make_model(path)
+        bench("generated", [path])
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    mymain()
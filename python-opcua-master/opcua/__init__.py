@@ -1,16 +1,42 @@
 """
 Pure Python OPC-UA library
 """
+import importlib
+import sys
 
-from my_opcua.common.node import Node
+# names are imported from their module when first accessed (PEP 562), so
+# a client does not pay for importing the server and the other way around
+_lazy_names = {
+    "Node": "my_opcua.common.node",
+    "uamethod": "my_opcua.common.methods",
+    "Subscription": "my_opcua.common.subscription",
+    "Client": "my_opcua.client.client",
+    "Server": "my_opcua.server.server",
+    "EventGenerator": "my_opcua.server.event_generator",
+    "instantiate": "my_opcua.common.instantiate",
+    "copy_node": "my_opcua.common.copy_node",
+}
 
-from my_opcua.common.methods import uamethod
-from my_opcua.common.subscription import Subscription
-from my_opcua.client.client import Client
-from my_opcua.server.server import Server
-from my_opcua.server.event_generator import EventGenerator
-from my_opcua.common.instantiate import instantiate
-from my_opcua.common.copy_node import copy_node
 
+def __getattr__(name):
+    if name not in _lazy_names:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_lazy_names[name]), name)
+    globals()[name] = value
+    return value
 
 
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names))
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported
+    from my_opcua.common.node import Node
+    from my_opcua.common.methods import uamethod
+    from my_opcua.common.subscription import Subscription
+    from my_opcua.client.client import Client
+    from my_opcua.server.server import Server
+    from my_opcua.server.event_generator import EventGenerator
+    from my_opcua.common.instantiate import instantiate
+    from my_opcua.common.copy_node import copy_node
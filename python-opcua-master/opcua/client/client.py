@@ -9,21 +9,15 @@ except ImportError:  # support for python2
 
 from my_opcua import ua
 from my_opcua.client.ua_client import UaClient
-from my_opcua.common.xmlimporter import XmlImporter
-from my_opcua.common.xmlexporter import XmlExporter
 from my_opcua.common.node import Node
 from my_opcua.common.manage_nodes import delete_nodes
 from my_opcua.common.subscription import Subscription
 from my_opcua.common import utils
 from my_opcua.crypto import security_policies
 from my_opcua.common.shortcuts import Shortcuts
-from my_opcua.common.structures import load_type_definitions, load_enums
-use_crypto = True
-try:
-    from my_opcua.crypto import uacrypto
-except ImportError:
-    #logging.getLogger(__name__).warning("cryptography is not installed, use of crypto disabled")
-    use_crypto = False
+
+use_crypto = security_policies.CRYPTOGRAPHY_AVAILABLE
+uacrypto = security_policies.uacrypto
 
 
 class KeepAlive(Thread):
@@ -530,6 +524,7 @@ class Client(object):
         """
         Import nodes defined in xml
         """
+        from my_opcua.common.xmlimporter import XmlImporter
         importer = XmlImporter(self)
         return importer.import_xml(path, xmlstring)
 
@@ -537,9 +532,9 @@ class Client(object):
         """
         Export defined nodes to xml
         """
+        from my_opcua.common.xmlexporter import XmlExporter
         exp = XmlExporter(self)
-        exp.build_etree(nodes)
-        return exp.write_xml(path)
+        return exp.export_xml(nodes, path)
 
     def register_namespace(self, uri):
         """
@@ -560,6 +555,7 @@ class Client(object):
         Generate Python classes for custom structures/extension objects defined in server
         These classes will available in ua module
         """
+        from my_opcua.common.structures import load_type_definitions
         return load_type_definitions(self, nodes)
 
     def load_enums(self):
@@ -567,4 +563,5 @@ class Client(object):
         generate Python enums for custom enums on server.
         This enums will be available in ua module
         """
+        from my_opcua.common.structures import load_enums
         return load_enums(self)
@@ -5,14 +5,52 @@ Low level binary client
 import logging
 import socket
 import errno
+import struct
+from datetime import datetime
 from threading import Thread, Lock
 from concurrent.futures import Future
 from functools import partial
 
 from my_opcua import ua
 from my_opcua.ua.ua_binary import struct_from_binary, uatcp_to_binary, struct_to_binary, nodeid_from_binary
+from my_opcua.ua.ua_binary import nodeid_to_binary
 from my_opcua.ua.uaerrors import UaError, BadTimeout, BadNoSubscription, BadSessionClosed
 from my_opcua.common.connection import SecureConnection
+from my_opcua.common.utils import Writer
+
+
+class PreparedRequest(object):
+    """
+    A request encoded once, to be sent many times with
+    UASocketClient.send_prepared. Only the RequestHeader fields
+    changing between sends (authentication token, timestamp and
+    request handle) are encoded again, the rest is copied as is
+    """
+    _stamp_struct = struct.Struct("<qI")
+
+    def __init__(self, request, timeout=1000):
+        self.request = request
+        request.RequestHeader = ua.RequestHeader()
+        request.RequestHeader.TimeoutHint = timeout
+        data = struct_to_binary(request)
+        self._typeid = nodeid_to_binary(request.TypeId)
+        self._token = request.RequestHeader.AuthenticationToken
+        self._token_binary = nodeid_to_binary(self._token)
+        self._tail = data[len(self._typeid) + len(self._token_binary) + self._stamp_struct.size:]
+
+    def to_binary(self, authentication_token, request_handle):
+        """
+        return the encoded request stamped with the given header values
+        """
+        if authentication_token != self._token:
+            self._token = authentication_token
+            self._token_binary = nodeid_to_binary(authentication_token)
+        writer = Writer(len(self._typeid) + len(self._token_binary) + self._stamp_struct.size + len(self._tail))
+        writer.write(self._typeid)
+        writer.write(self._token_binary)
+        writer.pack(self._stamp_struct, ua.datetime_to_win_epoch(datetime.utcnow()), request_handle)
+        writer.write(self._tail)
+        return writer.view()
 
 
 class UASocketClient(object):
@@ -58,15 +96,33 @@ class UASocketClient(object):
                 # see self._create_request_header
                 self._request_handle -= 1
                 raise
-            self._request_id += 1
-            future = Future()
-            if callback:
-                future.add_done_callback(callback)
-            self._callbackmap[self._request_id] = future
-            msg = self._connection.message_to_binary(binreq, message_type=message_type, request_id=self._request_id)
-            self._socket.write(msg)
+            return self._send_binary(binreq, callback, message_type)
+
+    def _send_binary(self, binreq, callback, message_type):
+        # must be called with self._lock held
+        self._request_id += 1
+        future = Future()
+        if callback:
+            future.add_done_callback(callback)
+        self._callbackmap[self._request_id] = future
+        buffers = self._connection.message_to_buffers(binreq, message_type=message_type, request_id=self._request_id)
+        self._socket.writelines(buffers)
         return future
 
+    def send_prepared(self, prepared, callback=None, message_type=ua.MessageType.SecureMessage):
+        """
+        send a PreparedRequest to server, only its header is encoded again.
+        returns response object if no callback is provided
+        """
+        with self._lock:
+            self._request_handle += 1
+            binreq = prepared.to_binary(self.authentication_token, self._request_handle)
+            future = self._send_binary(binreq, callback, message_type)
+        if not callback:
+            data = future.result(self.timeout)
+            self.check_answer(data, " in response to prepared " + prepared.request.__class__.__name__)
+            return data
+
     def send_request(self, request, callback=None, timeout=1000, message_type=ua.MessageType.SecureMessage):
         """
         send request to server.
@@ -571,6 +627,21 @@ class UaClient(object):
         response.ResponseHeader.ServiceResult.check()
         return response.Results
 
+    def prepare_call(self, methodstocall):
+        """
+        encode a CallRequest once, to be sent with call_prepared
+        """
+        request = ua.CallRequest()
+        request.Parameters.MethodsToCall = methodstocall
+        return PreparedRequest(request)
+
+    def call_prepared(self, prepared):
+        data = self._uasocket.send_prepared(prepared)
+        response = struct_from_binary(ua.CallResponse, data)
+        self.logger.debug(response)
+        response.ResponseHeader.ServiceResult.check()
+        return response.Results
+
     def history_read(self, params):
         self.logger.info("history_read")
         request = ua.HistoryReadRequest()
@@ -3,6 +3,7 @@ from datetime import datetime
 import logging
 
 from my_opcua.ua.ua_binary import struct_from_binary, struct_to_binary, header_from_binary, header_to_binary
+from my_opcua.ua.ua_binary import struct_to_writer, header_to_writer
 from my_opcua import ua
 
 
@@ -55,7 +56,7 @@ class MessageChunk(ua.FrozenClass):
             crypto.verify(header_to_binary(obj.MessageHeader) + struct_to_binary(obj.SecurityHeader) + decrypted, signature)
         data = ua.utils.Buffer(crypto.remove_padding(decrypted))
         obj.SequenceHeader = struct_from_binary(ua.SequenceHeader, data)
-        obj.Body = data.read(len(data))
+        obj.Body = data.read_view(len(data))
         return obj
 
     def encrypted_size(self, plain_size):
@@ -67,13 +68,48 @@ class MessageChunk(ua.FrozenClass):
         return size // pbs * self.security_policy.encrypted_block_size()
 
     def to_binary(self):
-        security = struct_to_binary(self.SecurityHeader)
-        encrypted_part = struct_to_binary(self.SequenceHeader) + self.Body
-        encrypted_part += self.security_policy.padding(len(encrypted_part))
-        self.MessageHeader.body_size = len(security) + self.encrypted_size(len(encrypted_part))
-        header = header_to_binary(self.MessageHeader)
-        encrypted_part += self.security_policy.signature(header + security + encrypted_part)
-        return header + security + self.security_policy.encrypt(encrypted_part)
+        writer = ua.utils.Writer()
+        self.to_writer(writer)
+        return writer.getvalue()
+
+    def to_buffers(self):
+        """
+        return chunk as a list of buffers to be sent with scatter-gather io.
+        Without signature and encryption the body is returned as is, after
+        a buffer holding the headers
+        """
+        if self.security_policy.signature_size() > 0:
+            return [self.to_binary()]
+        writer = ua.utils.Writer(64)
+        header_to_writer(writer, self.MessageHeader)
+        header_end = writer.tell()
+        struct_to_writer(writer, self.SecurityHeader)
+        struct_to_writer(writer, self.SequenceHeader)
+        self.MessageHeader.body_size = writer.tell() - header_end + len(self.Body)
+        writer.write_at(0, header_to_binary(self.MessageHeader))
+        return [writer.getvalue(), self.Body]
+
+    def to_writer(self, writer):
+        """
+        write chunk into writer. Headers and body are written in place,
+        the message header is patched once the size is known
+        """
+        start = writer.tell()
+        header_to_writer(writer, self.MessageHeader)
+        header_end = writer.tell()
+        struct_to_writer(writer, self.SecurityHeader)
+        encrypted_start = writer.tell()
+        struct_to_writer(writer, self.SequenceHeader)
+        writer.write(self.Body)
+        writer.write(self.security_policy.padding(writer.tell() - encrypted_start))
+        encrypted_size = self.encrypted_size(writer.tell() - encrypted_start)
+        self.MessageHeader.body_size = encrypted_start - header_end + encrypted_size
+        writer.write_at(start, header_to_binary(self.MessageHeader))
+        if self.security_policy.signature_size() > 0:
+            writer.write(self.security_policy.signature(writer.getvalue(start)))
+            encrypted = self.security_policy.encrypt(writer.getvalue(encrypted_start))
+            writer.truncate(encrypted_start)
+            writer.write(encrypted)
 
     @staticmethod
     def max_body_size(crypto, max_chunk_size):
@@ -85,7 +121,8 @@ class MessageChunk(ua.FrozenClass):
     def message_to_chunks(security_policy, body, max_chunk_size,
                           message_type=ua.MessageType.SecureMessage, channel_id=1, request_id=1, token_id=1):
         """
-        Pack message body (as binary string) into one or more chunks.
+        Pack message body (as binary string or memoryview) into one or more chunks.
+        Chunk bodies are memoryviews into body, they are not copied.
         Size of each chunk will not exceed max_chunk_size.
         Returns a list of MessageChunks. SequenceNumber is not initialized here,
         it must be set by Secure Channel driver.
@@ -107,6 +144,7 @@ class MessageChunk(ua.FrozenClass):
         max_size = MessageChunk.max_body_size(crypto, max_chunk_size)
 
         chunks = []
+        body = memoryview(body)
         for i in range(0, len(body), max_size):
             part = body[i:i + max_size]
             if i + max_size >= len(body):
@@ -202,6 +240,15 @@ class SecureConnection(object):
         The only supported types are SecureOpen, SecureMessage, SecureClose
         if message_type is SecureMessage, the AlgoritmHeader should be passed as arg
         """
+        return b"".join(self.message_to_buffers(message, message_type, request_id, algohdr))
+
+    def message_to_buffers(self, message, message_type=ua.MessageType.SecureMessage, request_id=0, algohdr=None):
+        """
+        Convert OPC UA secure message to a list of buffers, to be sent with
+        socket.sendmsg or transport.writelines, see message_to_binary.
+        Without security the message is not copied, chunk bodies are
+        memoryviews into it
+        """
         if algohdr is None:
             token_id = self.channel.SecurityToken.TokenId
         else:
@@ -218,7 +265,10 @@ class SecureConnection(object):
                 logger.debug("Wrapping sequence number: %d -> 1", self._sequence_number)
                 self._sequence_number = 1
             chunk.SequenceHeader.SequenceNumber = self._sequence_number
-        return b"".join([chunk.to_binary() for chunk in chunks])
+        buffers = []
+        for chunk in chunks:
+            buffers.extend(chunk.to_buffers())
+        return buffers
 
 
     def _check_incoming_chunk(self, chunk):
@@ -304,7 +354,7 @@ class SecureConnection(object):
         logger.debug("Waiting for header")
         header = header_from_binary(socket)
         logger.info("received header: %s", header)
-        body = socket.read(header.body_size)
+        body = socket.read_view(header.body_size)
         if len(body) != header.body_size:
             raise ua.UaError("{0} bytes expected, {1} available".format(header.body_size, len(body)))
         return self.receive_from_header_and_body(header, ua.utils.Buffer(body))
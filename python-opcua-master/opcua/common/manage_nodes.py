@@ -378,7 +378,9 @@ def delete_nodes(server, nodes, recursive=False, delete_target_references=True):
     downward hierachic references to the node
     """
     nodestodelete = []
-    if recursive:
+    # server side, whole trees are deleted in one pass
+    subtrees = recursive and hasattr(server, "delete_subtrees")
+    if recursive and not subtrees:
         nodes = _add_childs(nodes)
     for mynode in nodes:
         it = ua.DeleteNodesItem()
@@ -387,6 +389,8 @@ def delete_nodes(server, nodes, recursive=False, delete_target_references=True):
         nodestodelete.append(it)
     params = ua.DeleteNodesParameters()
     params.NodesToDelete = nodestodelete
+    if subtrees:
+        return server.delete_subtrees(params)
     return server.delete_nodes(params)
 
 
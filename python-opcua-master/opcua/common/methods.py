@@ -11,17 +11,21 @@ def call_method(parent, methodid, *args):
     Call an OPC-UA method. methodid is browse name of child method or the
     nodeid of method as a NodeId object
     arguments are variants or python object convertible to variants.
-    which may be of different types
+    which may be of different types. A ua.ExtensionObject with a Body
+    is sent as is, use it to pass arguments which are already encoded
     returns a list of values or a single value depending on the output of the method
     """
     result = call_method_full(parent, methodid, *args)
+    return _output_arguments(result.OutputArguments)
+
 
-    if len(result.OutputArguments) == 0:
+def _output_arguments(args):
+    if len(args) == 0:
         return None
-    elif len(result.OutputArguments) == 1:
-        return result.OutputArguments[0]
+    elif len(args) == 1:
+        return args[0]
     else:
-        return result.OutputArguments
+        return args
 
 
 def call_method_full(parent, methodid, *args):
@@ -32,24 +36,63 @@ def call_method_full(parent, methodid, *args):
     which may be of different types
     returns a CallMethodResult object with converted OutputArguments
     """
-    if isinstance(methodid, (str, ua.uatypes.QualifiedName)):
-        methodid = parent.get_child(methodid).nodeid
-    elif isinstance(methodid, node.Node):
-        methodid = methodid.nodeid
-
+    methodid = _method_nodeid(parent, methodid)
     result = _call_method(parent.server, parent.nodeid, methodid, to_variant(*args))
     result.OutputArguments = [var.Value for var in result.OutputArguments]
     return result
 
 
-def _call_method(server, parentnodeid, methodid, arguments):
+def prepare_call_method(parent, methodid, *args):
+    """
+    Prepare a call of an OPC-UA method, see call_method.
+    The CallRequest is encoded once, only its header is encoded again
+    each time PreparedCall.call() is called.
+    Only available on client side
+    """
+    methodid = _method_nodeid(parent, methodid)
+    prepared = parent.server.prepare_call([_call_method_request(parent.nodeid, methodid, to_variant(*args))])
+    return PreparedCall(parent.server, prepared)
+
+
+class PreparedCall(object):
+    """
+    An OPC-UA method call encoded once and sent many times,
+    see prepare_call_method
+    """
+
+    def __init__(self, server, prepared):
+        self.server = server
+        self.prepared = prepared
+
+    def call(self):
+        """
+        call method, returns a list of values or a single value
+        depending on the output of the method, like call_method
+        """
+        res = self.server.call_prepared(self.prepared)[0]
+        res.StatusCode.check()
+        return _output_arguments([var.Value for var in res.OutputArguments])
+
+
+def _method_nodeid(parent, methodid):
+    if isinstance(methodid, (str, ua.uatypes.QualifiedName)):
+        return parent.get_child(methodid).nodeid
+    elif isinstance(methodid, node.Node):
+        return methodid.nodeid
+    return methodid
+
+
+def _call_method_request(parentnodeid, methodid, arguments):
     request = ua.CallMethodRequest()
     request.ObjectId = parentnodeid
     request.MethodId = methodid
     request.InputArguments = arguments
-    methodstocall = [request]
+    return request
+
+
+def _call_method(server, parentnodeid, methodid, arguments):
+    methodstocall = [_call_method_request(parentnodeid, methodid, arguments)]
     results = server.call(methodstocall)
-    #print(results)
     res = results[0]
     res.StatusCode.check()
     return res
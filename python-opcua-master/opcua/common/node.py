@@ -671,4 +671,9 @@ class Node(object):
         return my_opcua.common.manage_nodes.create_reference_type(self, nodeid, bname, symmetric, inversename)
 
     def call_method(self, methodid, *args):
-        return my_opcua.common.methods.call_method(self, methodid, *args)
+        from my_opcua.common import methods
+        return methods.call_method(self, methodid, *args)
+
+    def prepare_call_method(self, methodid, *args):
+        from my_opcua.common import methods
+        return methods.prepare_call_method(self, methodid, *args)
@@ -4,7 +4,10 @@ high level interface to subscriptions
 import time
 import logging
 from threading import Lock
-import collections
+try:
+    from collections.abc import Iterable
+except ImportError:  # Python 2
+    from collections import Iterable
 
 from my_opcua import ua
 from my_opcua.common import events
@@ -199,7 +202,7 @@ class Subscription(object):
 
     def _subscribe(self, nodes, attr, mfilter=None, queuesize=0):
         is_list = True
-        if isinstance(nodes, collections.Iterable):
+        if isinstance(nodes, Iterable):
             nodes = list(nodes)
         else:
             nodes = [nodes]
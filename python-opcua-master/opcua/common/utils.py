@@ -5,20 +5,38 @@ Helper function and classes depending on ua object are in ua_utils.py
 
 import logging
 import os
+import sys
+import importlib
 from concurrent.futures import Future
 import functools
 import threading
 from socket import error as SocketError
 
-try:
-    import asyncio
-except ImportError:
-    import trollius as asyncio
-
 
 from my_opcua.ua.uaerrors import UaError
 
 
+class LazyModule(object):
+    """
+    stand-in for a module which is only imported when one of its
+    attributes is first accessed, for modules which are slow to import
+    and not needed by every user of the importing module
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attr)
+
+
+# only needed by ThreadLoop, i.e. by the server
+asyncio = LazyModule("asyncio" if sys.version_info[0] >= 3 else "trollius")
+
+
 class ServiceError(UaError):
     def __init__(self, code):
         super(ServiceError, self).__init__('UA Service Error')
@@ -33,6 +51,13 @@ class SocketClosedException(UaError):
     pass
 
 
+# Buffer accesses its data through a memoryview, thus reading structures,
+# copying and skipping do not copy the underlying bytes.
+# Set PYOPCUA_BUFFER_COPY to slice the raw data instead, which makes the data
+# show up as plain bytes when debugging
+USE_MEMORYVIEW = "PYOPCUA_BUFFER_COPY" not in os.environ
+
+
 class Buffer(object):
 
     """
@@ -42,6 +67,11 @@ class Buffer(object):
 
     def __init__(self, data, start_pos=0, size=-1):
         # self.logger = logging.getLogger(__name__)
+        if USE_MEMORYVIEW:
+            if not isinstance(data, memoryview):
+                data = memoryview(data)
+        elif isinstance(data, memoryview):
+            data = data.tobytes()
         self._data = data
         self._cur_pos = start_pos
         if size == -1:
@@ -51,7 +81,7 @@ class Buffer(object):
     def __str__(self):
         return "Buffer(size:{0}, data:{1})".format(
             self._size,
-            self._data[self._cur_pos:self._cur_pos + self._size])
+            bytes(self._data[self._cur_pos:self._cur_pos + self._size]))
     __repr__ = __str__
 
     def __len__(self):
@@ -61,6 +91,17 @@ class Buffer(object):
         """
         read and pop number of bytes for buffer
         """
+        data = self.read_view(size)
+        if USE_MEMORYVIEW:
+            return data.tobytes()
+        return data
+
+    def read_view(self, size):
+        """
+        read and pop number of bytes for buffer, without copying them
+        if possible. The returned object supports the buffer protocol but
+        is only guaranteed to be valid as long as the underlying data is
+        """
         if size > self._size:
             raise NotEnoughData("Not enough data left in buffer, request for {0}, we have {1}".format(size, self))
         # self.logger.debug("Request for %s bytes, from %s", size, self)
@@ -71,6 +112,21 @@ class Buffer(object):
         # self.logger.debug("Returning: %s ", data)
         return data
 
+    def unpack(self, st):
+        """
+        read and pop st.size bytes from buffer, unpacked with the
+        precompiled struct.Struct st
+        """
+        if not USE_MEMORYVIEW:
+            return st.unpack(self.read(st.size))
+        size = st.size
+        if size > self._size:
+            raise NotEnoughData("Not enough data left in buffer, request for {0}, we have {1}".format(size, self))
+        pos = self._cur_pos
+        self._size -= size
+        self._cur_pos += size
+        return st.unpack_from(self._data, pos)
+
     def copy(self, size=-1):
         """
         return a shadow copy, optionnaly only copy 'size' bytes
@@ -89,34 +145,176 @@ class Buffer(object):
         self._cur_pos += size
 
 
+class Writer(object):
+
+    """
+    counterpart of Buffer used when encoding.
+    Everything is written into one growing bytearray, structures are packed
+    in place with struct.Struct.pack_into, so nested structures are not
+    copied once per nesting level
+    """
+
+    def __init__(self, size=256):
+        self._data = bytearray(size)
+        self._pos = 0
+
+    def __str__(self):
+        return "Writer(size:{0}, data:{1})".format(self._pos, bytes(self._data[:self._pos]))
+    __repr__ = __str__
+
+    def __len__(self):
+        return self._pos
+
+    def tell(self):
+        """
+        return current write position
+        """
+        return self._pos
+
+    def _reserve(self, size):
+        pos = self._pos
+        end = pos + size
+        if end > len(self._data):
+            self._data.extend(bytearray(max(end, 2 * len(self._data)) - len(self._data)))
+        self._pos = end
+        return pos
+
+    def write(self, data):
+        """
+        append bytes, or any object supporting the buffer protocol
+        """
+        size = len(data)
+        pos = self._reserve(size)
+        self._data[pos:pos + size] = data
+
+    def pack(self, st, *args):
+        """
+        append args packed with the precompiled struct.Struct st
+        """
+        st.pack_into(self._data, self._reserve(st.size), *args)
+
+    def pack_at(self, pos, st, *args):
+        """
+        overwrite already written data at pos with args packed with st,
+        typically to back-patch a length prefix
+        """
+        if pos + st.size > self._pos:
+            raise NotEnoughData("Cannot pack {0} bytes at {1}, we have {2}".format(st.size, pos, self))
+        st.pack_into(self._data, pos, *args)
+
+    def write_at(self, pos, data):
+        """
+        overwrite already written data at pos with data
+        """
+        if pos + len(data) > self._pos:
+            raise NotEnoughData("Cannot write {0} bytes at {1}, we have {2}".format(len(data), pos, self))
+        self._data[pos:pos + len(data)] = data
+
+    def truncate(self, pos):
+        """
+        drop everything written after pos
+        """
+        self._pos = min(pos, self._pos)
+
+    def view(self, start=0):
+        """
+        return a memoryview of written data, without copying it.
+        The writer cannot grow while the view is alive
+        """
+        return memoryview(self._data)[start:self._pos]
+
+    def getvalue(self, start=0):
+        """
+        return a bytes copy of written data
+        """
+        return bytes(self._data[start:self._pos])
+
+
+# maximum number of buffers passed to one sendmsg call
+_IOV_MAX = 1024
+
+
 class SocketWrapper(object):
     """
     wrapper to make it possible to have same api for
     normal sockets, socket from asyncio, StringIO, etc....
+    Data is received with recv_into into a reusable bytearray, as much as
+    available, so reading many small messages or one large message neither
+    costs a syscall per read nor quadratic copying
     """
 
-    def __init__(self, sock):
+    def __init__(self, sock, buffer_size=65536):
         self.socket = sock
+        self._buffer_size = buffer_size
+        self._buffer = bytearray(buffer_size)
+        self._start = 0  # start of data not read yet
+        self._end = 0  # end of received data
 
-    def read(self, size):
+    def _fill(self, size):
         """
-        Receive up to size bytes from socket
+        receive until at least size bytes are available in buffer
         """
-        data = b''
-        while size > 0:
+        while self._end - self._start < size:
+            if self._start + size > len(self._buffer):
+                # views into data already read may still be alive, so the
+                # tail is moved to a new buffer instead of compacting in place
+                available = self._end - self._start
+                buf = bytearray(max(self._buffer_size, size))
+                buf[:available] = memoryview(self._buffer)[self._start:self._end]
+                self._buffer = buf
+                self._start = 0
+                self._end = available
             try:
-                chunk = self.socket.recv(size)
+                received = self.socket.recv_into(memoryview(self._buffer)[self._end:])
             except (OSError, SocketError) as ex:
                 raise SocketClosedException("Server socket has closed", ex)
-            if not chunk:
+            if not received:
                 raise SocketClosedException("Server socket has closed")
-            data += chunk
-            size -= len(chunk)
-        return data
+            self._end += received
+
+    def read(self, size):
+        """
+        Receive up to size bytes from socket
+        """
+        return bytes(self.read_view(size))
+
+    def read_view(self, size):
+        """
+        Receive size bytes from socket and return them as a memoryview
+        into the receive buffer, without copying them. Received data is
+        never overwritten, so the view stays valid
+        """
+        self._fill(size)
+        pos = self._start
+        self._start += size
+        return memoryview(self._buffer)[pos:self._start]
 
     def write(self, data):
         self.socket.sendall(data)
 
+    def writelines(self, buffers):
+        """
+        send a list of buffers, with a single sendmsg call if possible
+        instead of concatenating them first
+        """
+        if not hasattr(self.socket, "sendmsg"):
+            # Python 2 str.join does not accept memoryviews
+            self.socket.sendall(b"".join(memoryview(buf).tobytes() for buf in buffers))
+            return
+        buffers = [memoryview(buf) for buf in buffers]
+        idx = 0
+        while idx < len(buffers):
+            try:
+                sent = self.socket.sendmsg(buffers[idx:idx + _IOV_MAX])
+            except (OSError, SocketError) as ex:
+                raise SocketClosedException("Server socket has closed", ex)
+            # skip what was sent, the last buffer may have been partially sent
+            while idx < len(buffers) and sent >= len(buffers[idx]):
+                sent -= len(buffers[idx])
+                idx += 1
+            if sent:
+                buffers[idx] = buffers[idx][sent:]
+
 
 def create_nonce(size=32):
     return os.urandom(size)
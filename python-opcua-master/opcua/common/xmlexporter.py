@@ -2,10 +2,10 @@
 from a list of nodes in the address space, build an XML file
 format is the one from opc-ua specification
 """
+import io
 import logging
 from collections import OrderedDict
 import xml.etree.ElementTree as Et
-from copy import copy
 import base64
 
 from my_opcua import ua
@@ -14,6 +14,71 @@ from my_opcua.common.ua_utils import get_base_data_type
 from my_opcua.ua.uatypes import extension_object_ids
 
 
+# attributes read for each node class, the node class, names and description
+# are read for all nodes
+_common_attributes = (ua.AttributeIds.NodeClass, ua.AttributeIds.BrowseName,
+                      ua.AttributeIds.DisplayName, ua.AttributeIds.Description)
+_class_attributes = {
+    ua.NodeClass.Object: (ua.AttributeIds.EventNotifier,),
+    ua.NodeClass.ObjectType: (ua.AttributeIds.IsAbstract,),
+    ua.NodeClass.Variable: (ua.AttributeIds.DataType, ua.AttributeIds.ValueRank, ua.AttributeIds.ArrayDimensions,
+                            ua.AttributeIds.Value, ua.AttributeIds.AccessLevel, ua.AttributeIds.UserAccessLevel,
+                            ua.AttributeIds.MinimumSamplingInterval, ua.AttributeIds.Historizing),
+    ua.NodeClass.VariableType: (ua.AttributeIds.DataType, ua.AttributeIds.ValueRank,
+                                ua.AttributeIds.ArrayDimensions, ua.AttributeIds.Value, ua.AttributeIds.IsAbstract),
+    ua.NodeClass.Method: (ua.AttributeIds.Executable, ua.AttributeIds.UserExecutable),
+    ua.NodeClass.ReferenceType: (ua.AttributeIds.InverseName,),
+}
+
+
+class NodeRecord(object):
+    """
+    Attributes and references of a node, read once in a batch.
+    It has the subset of the Node API used by the exporter, so the
+    add_etree_* methods accept a NodeRecord instead of a Node
+    """
+
+    def __init__(self, nodeid):
+        self.nodeid = nodeid
+        self.attributes = {}
+        self.references = []
+        self.parent = None
+
+    def get_attribute(self, attr):
+        dv = self.attributes.get(attr)
+        if dv is None:
+            raise ua.UaStatusCodeError(ua.StatusCodes.BadAttributeIdInvalid)
+        dv.StatusCode.check()
+        return dv
+
+    def get_node_class(self):
+        return self.get_attribute(ua.AttributeIds.NodeClass).Value.Value
+
+    def get_browse_name(self):
+        return self.get_attribute(ua.AttributeIds.BrowseName).Value.Value
+
+    def get_display_name(self):
+        return self.get_attribute(ua.AttributeIds.DisplayName).Value.Value
+
+    def get_description(self):
+        return self.get_attribute(ua.AttributeIds.Description).Value.Value
+
+    def get_data_type(self):
+        return self.get_attribute(ua.AttributeIds.DataType).Value.Value
+
+    def get_value_rank(self):
+        return self.get_attribute(ua.AttributeIds.ValueRank).Value.Value
+
+    def get_data_value(self):
+        return self.get_attribute(ua.AttributeIds.Value)
+
+    def get_parent(self):
+        return self.parent
+
+    def get_references(self):
+        return self.references
+
+
 class XmlExporter(object):
 
     ''' If it is required that for _extobj_to_etree members to the value should be written in a certain
@@ -27,11 +92,15 @@ class XmlExporter(object):
                                             'Description']
         }
 
+    # number of nodes whose attributes and references are read at once
+    batch_size = 1000
+
     def __init__(self, server):
         self.logger = logging.getLogger(__name__)
         self.server = server
         self.aliases = {}
         self._addr_idx_to_xml_idx = {}
+        self._base_data_types = {}
 
         node_set_attributes = OrderedDict()
         node_set_attributes['xmlns:xsi'] = 'http://www.w3.org/2001/XMLSchema-instance'
@@ -40,28 +109,192 @@ class XmlExporter(object):
         node_set_attributes['xmlns'] = 'http://opcfoundation.org/UA/2011/03/UANodeSet.xsd'
 
         self.etree = Et.ElementTree(Et.Element('UANodeSet', node_set_attributes))
+        self._nodes_el = self.etree.getroot()
 
     def build_etree(self, node_list, uris=None):
         """
         Create an XML etree object from a list of nodes; custom namespace uris are optional
         Namespaces used by nodes are always exported for consistency.
         Args:
-            node_list: list of Node objects for export
+            node_list: list of Node objects or NodeIds for export
             uris: list of namespace uri strings
 
         Returns:
         """
         self.logger.info('Building XML etree')
+        nodeids = [getattr(node, "nodeid", node) for node in node_list]
 
-        self._add_namespaces(node_list, uris)
+        self._add_namespaces(self._iter_records(nodeids, full=False), uris)
 
         # add all nodes in the list to the XML etree
-        for node in node_list:
-            self.node_to_etree(node)
+        for record in self._iter_records(nodeids):
+            self.node_to_etree(record)
 
         # add aliases to the XML etree
         self._add_alias_els()
 
+    def export_xml(self, node_list, xmlpath, uris=None, pretty=True):
+        """
+        Write a list of nodes to an XML file without building the etree of the
+        whole file: nodes are read batch_size at a time and the elements of a
+        batch are written to the file before the next batch is read
+        Args:
+            node_list: list of Node objects or NodeIds for export
+            xmlpath: string representing the path/file name
+            uris: list of namespace uri strings
+
+        Returns:
+        """
+        self.logger.info('Exporting XML file to %s', xmlpath)
+        nodeids = [getattr(node, "nodeid", node) for node in node_list]
+
+        # namespaces and aliases are written before the nodes, a first pass
+        # reading only names and references finds them
+        self._add_namespaces(self._iter_records(nodeids, full=False), uris)
+        self._add_alias_els()
+        root = self.etree.getroot()
+        if pretty:
+            indent(root)
+        # utf-8 bytes, encoding="unicode" does not exist in Python 2
+        header = Et.tostring(root, encoding="utf-8")
+        # children are written between the start and end tags of the root element
+        header = header[:header.rindex(b"</UANodeSet>")]
+
+        with io.open(xmlpath, "wb") as f:
+            f.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+            f.write(header)
+            batch_el = self._nodes_el = Et.Element('UANodeSet')
+            try:
+                for nb, record in enumerate(self._iter_records(nodeids), 1):
+                    self.node_to_etree(record)
+                    if nb % self.batch_size == 0 or nb == len(nodeids):
+                        self._write_batch(f, batch_el, pretty)
+            finally:
+                self._nodes_el = root
+            f.write(b"</UANodeSet>" + (root.tail or "").encode("utf-8"))
+
+    def _write_batch(self, f, batch_el, pretty):
+        """
+        write the node elements of batch_el to f and remove them from batch_el
+        """
+        if len(batch_el):
+            if pretty:
+                indent(batch_el)
+                batch_el.text = "  "
+                batch_el.tail = None
+            batch = Et.tostring(batch_el, encoding="utf-8")
+            # strip the start and end tags of batch_el
+            f.write(batch[len(b"<UANodeSet>"):-len(b"</UANodeSet>")])
+        batch_el.clear()
+
+    def _is_server(self):
+        return hasattr(self.server, "iserver")
+
+    def _iter_records(self, nodeids, full=True):
+        """
+        yield a NodeRecord for each node id, attributes and references are
+        read batch_size nodes at a time.
+        If full is False only the attributes needed to find namespaces and
+        aliases are read
+        """
+        for start in range(0, len(nodeids), self.batch_size):
+            records = [NodeRecord(nodeid) for nodeid in nodeids[start:start + self.batch_size]]
+            if self._is_server():
+                self._read_records_aspace(records, full)
+            else:
+                self._read_records_client(records, full)
+            for record in records:
+                yield record
+
+    def _record_attributes(self, record, full):
+        if not full:
+            return (ua.AttributeIds.BrowseName, ua.AttributeIds.DataType)
+        nodeclass = record.attributes[ua.AttributeIds.NodeClass].Value.Value
+        return _class_attributes.get(nodeclass, ())
+
+    def _read_records_aspace(self, records, full):
+        """
+        read records directly from the address space of the server,
+        bypassing the read and browse services
+        """
+        aspace = self.server.iserver.aspace
+        all_reftypes = aspace.get_reference_subtypes(ua.NodeId(ua.ObjectIds.References))
+        hierarchical = aspace.get_reference_subtypes(ua.NodeId(ua.ObjectIds.HierarchicalReferences))
+        for record in records:
+            if full:
+                for attr in _common_attributes:
+                    record.attributes[attr] = aspace.get_attribute_value(record.nodeid, attr)
+            for attr in self._record_attributes(record, full):
+                record.attributes[attr] = aspace.get_attribute_value(record.nodeid, attr)
+            nodedata = aspace.get(record.nodeid)
+            if nodedata is None:
+                continue
+            record.references = nodedata.get_references(all_reftypes, ua.BrowseDirection.Both)
+            if full:
+                parents = nodedata.get_references(hierarchical, ua.BrowseDirection.Inverse)
+                if parents:
+                    record.parent = parents[0].NodeId
+
+    def _read_records_client(self, records, full):
+        """
+        read records with one read request for the attributes of all records
+        (two when the node classes must be known first) and one browse request
+        """
+        uaclient = self.server.uaclient
+        if full:
+            self._read_attributes(uaclient, [(record, attr) for record in records for attr in _common_attributes])
+        self._read_attributes(uaclient, [(record, attr) for record in records
+                                         for attr in self._record_attributes(record, full)])
+
+        params = ua.BrowseParameters()
+        params.View.Timestamp = ua.get_win_epoch()
+        params.RequestedMaxReferencesPerNode = 0
+        for record in records:
+            params.NodesToBrowse.append(self._browse_description(record.nodeid, ua.ObjectIds.References,
+                                                                 ua.BrowseDirection.Both))
+            if full:
+                params.NodesToBrowse.append(self._browse_description(record.nodeid,
+                                                                     ua.ObjectIds.HierarchicalReferences,
+                                                                     ua.BrowseDirection.Inverse))
+        results = uaclient.browse(params)
+        pending = [res for res in results if res.ContinuationPoint]
+        while pending:
+            next_params = ua.BrowseNextParameters()
+            next_params.ContinuationPoints = [res.ContinuationPoint for res in pending]
+            next_params.ReleaseContinuationPoints = False
+            for res, next_res in zip(pending, uaclient.browse_next(next_params)):
+                res.References.extend(next_res.References)
+                res.ContinuationPoint = next_res.ContinuationPoint
+            pending = [res for res in pending if res.ContinuationPoint]
+
+        step = 2 if full else 1
+        for i, record in enumerate(records):
+            record.references = results[i * step].References
+            if full and results[i * step + 1].References:
+                record.parent = results[i * step + 1].References[0].NodeId
+
+    def _read_attributes(self, uaclient, items):
+        if not items:
+            return
+        params = ua.ReadParameters()
+        for record, attr in items:
+            rv = ua.ReadValueId()
+            rv.NodeId = record.nodeid
+            rv.AttributeId = attr
+            params.NodesToRead.append(rv)
+        for (record, attr), dv in zip(items, uaclient.read(params)):
+            record.attributes[attr] = dv
+
+    def _browse_description(self, nodeid, reftype, direction):
+        desc = ua.BrowseDescription()
+        desc.NodeId = nodeid
+        desc.BrowseDirection = direction
+        desc.ReferenceTypeId = ua.NodeId(reftype)
+        desc.IncludeSubtypes = True
+        desc.NodeClassMask = ua.NodeClass.Unspecified
+        desc.ResultMask = ua.BrowseResultMask.All
+        return desc
+
     def _add_namespaces(self, nodes, uris):
         idxs = self._get_ns_idxs_of_nodes(nodes)
 
@@ -90,16 +323,24 @@ class XmlExporter(object):
     def _get_ns_idxs_of_nodes(self, nodes):
         """
         get a list of all indexes used or references by nodes
+        The aliases of the reference types and data types used by nodes are collected too
         """
         idxs = []
         for node in nodes:
             node_idxs = [node.nodeid.NamespaceIndex]
             node_idxs.append(node.get_browse_name().NamespaceIndex)
-            node_idxs.extend(ref.NodeId.NamespaceIndex for ref in node.get_references())
+            refs = node.get_references()
+            node_idxs.extend(ref.NodeId.NamespaceIndex for ref in refs)
             node_idxs = list(set(node_idxs))  # remove duplicates
             for i in node_idxs:
                 if i != 0 and i not in idxs:
                     idxs.append(i)
+            for ref in refs:
+                self.aliases[ref.ReferenceTypeId] = self._ref_name(ref.ReferenceTypeId)
+            if isinstance(node, NodeRecord):
+                dtype = node.attributes.get(ua.AttributeIds.DataType)
+                if dtype is not None and dtype.StatusCode.is_good():
+                    self._dtype_name(dtype.Value.Value)
         return idxs
 
     def _add_idxs_from_uris(self, idxs, uris, ns_array):
@@ -179,14 +420,17 @@ class XmlExporter(object):
             nodeid = nodeid.nodeid
 
         if nodeid.NamespaceIndex in self._addr_idx_to_xml_idx:
-            nodeid = copy(nodeid)
-            nodeid.NamespaceIndex = self._addr_idx_to_xml_idx[nodeid.NamespaceIndex]
+            # a new object, copy() would add a __dict__ to nodeids of the address space
+            xml_nodeid = ua.NodeId(nodeid.Identifier, self._addr_idx_to_xml_idx[nodeid.NamespaceIndex],
+                                   nodeid.NodeIdType)
+            xml_nodeid.NamespaceUri = nodeid.NamespaceUri
+            xml_nodeid.ServerIndex = nodeid.ServerIndex
+            nodeid = xml_nodeid
         return nodeid.to_string()
 
     def _bname_to_string(self, bname):
         if bname.NamespaceIndex in self._addr_idx_to_xml_idx:
-            bname = copy(bname)
-            bname.NamespaceIndex = self._addr_idx_to_xml_idx[bname.NamespaceIndex]
+            bname = ua.QualifiedName(bname.Name, self._addr_idx_to_xml_idx[bname.NamespaceIndex])
         return bname.to_string()
 
     def _add_node_common(self, nodetype, node):
@@ -195,7 +439,7 @@ class XmlExporter(object):
         parent = node.get_parent()
         displayname = node.get_display_name().Text
         desc = node.get_description().Text
-        node_el = Et.SubElement(self.etree.getroot(), nodetype)
+        node_el = Et.SubElement(self._nodes_el, nodetype)
         node_el.attrib["NodeId"] = self._node_to_string(nodeid)
         node_el.attrib["BrowseName"] = self._bname_to_string(browsename)
         if parent is not None:
@@ -230,11 +474,7 @@ class XmlExporter(object):
 
     def add_variable_common(self, node, el):
         dtype = node.get_data_type()
-        if dtype.NamespaceIndex == 0 and dtype.Identifier in o_ids.ObjectIdNames:
-            dtype_name = o_ids.ObjectIdNames[dtype.Identifier]
-            self.aliases[dtype] = dtype_name
-        else:
-            dtype_name = dtype.to_string()
+        dtype_name = self._dtype_name(dtype)
         rank = node.get_value_rank()
         if rank != -1:
             el.attrib["ValueRank"] = str(int(rank))
@@ -308,6 +548,19 @@ class XmlExporter(object):
         obj_el = self._add_node_common("UADataType", obj)
         self._add_ref_els(obj_el, obj)
 
+    def _dtype_name(self, dtype):
+        if dtype.NamespaceIndex == 0 and dtype.Identifier in o_ids.ObjectIdNames:
+            dtype_name = o_ids.ObjectIdNames[dtype.Identifier]
+            self.aliases[dtype] = dtype_name
+        else:
+            dtype_name = dtype.to_string()
+        return dtype_name
+
+    def _ref_name(self, reftype):
+        if reftype.Identifier in o_ids.ObjectIdNames:
+            return o_ids.ObjectIdNames[reftype.Identifier]
+        return reftype.to_string()
+
     def _add_namespace_uri_els(self, uris):
         nuris_el = Et.Element('NamespaceUris')
 
@@ -334,10 +587,7 @@ class XmlExporter(object):
         refs_el = Et.SubElement(parent_el, 'References')
 
         for ref in refs:
-            if ref.ReferenceTypeId.Identifier in o_ids.ObjectIdNames:
-                ref_name = o_ids.ObjectIdNames[ref.ReferenceTypeId.Identifier]
-            else:
-                ref_name = ref.ReferenceTypeId.to_string()
+            ref_name = self._ref_name(ref.ReferenceTypeId)
             ref_el = Et.SubElement(refs_el, 'Reference')
             ref_el.attrib['ReferenceType'] = ref_name
             if not ref.IsForward:
@@ -402,8 +652,10 @@ class XmlExporter(object):
             for nval in val:
                 self._value_to_etree(list_el, type_name, dtype, nval)
         else:
-            dtype_base = get_base_data_type(self.server.get_node(dtype))
-            dtype_base = dtype_base.nodeid
+            dtype_base = self._base_data_types.get(dtype)
+            if dtype_base is None:
+                dtype_base = get_base_data_type(self.server.get_node(dtype)).nodeid
+                self._base_data_types[dtype] = dtype_base
 
             if dtype_base == ua.NodeId(ua.ObjectIds.Enumeration):
                 dtype_base = ua.NodeId(ua.ObjectIds.Int32)
@@ -6,7 +6,6 @@ import logging
 import uuid
 from copy import copy
 
-import my_opcua as opcua
 from my_opcua import ua
 from my_opcua.common import xmlparser
 from my_opcua.ua.uaerrors import UaError
@@ -17,6 +16,12 @@ if sys.version_info.major > 2:
     unicode = str
 
 class XmlImporter(object):
+    """
+    Nodes are parsed as a stream, ordered so that parents are added before
+    their children, then added by batches of batch_size nodes, followed by
+    the references of the batch; on a server in bulk mode
+    """
+    batch_size = 1000
 
     def __init__(self, server):
         self.logger = logging.getLogger(__name__)
@@ -52,23 +57,19 @@ class XmlImporter(object):
         """
         self.logger.info("Importing XML file %s", xmlpath)
         self.parser = xmlparser.XMLParser(xmlpath, xmlstring)
+        try:
+            self.namespaces = self._map_namespaces(self.parser.get_used_namespaces())
+            self.aliases = self._map_aliases(self.parser.get_aliases())
+            self.refs = []
 
-        self.namespaces = self._map_namespaces(self.parser.get_used_namespaces())
-        self.aliases = self._map_aliases(self.parser.get_aliases())
-        self.refs = []
-
-        dnodes = self.parser.get_node_datas()
-        dnodes = self.make_objects(dnodes)
-        nodes_parsed = self._sort_nodes_by_parentid(dnodes)
+            dnodes = self.make_objects(self.parser.iter_node_datas())
+            nodes_parsed = self._sort_nodes_by_parentid(dnodes)
+        finally:
+            self.parser.close()
 
         nodes = []
-        for nodedata in nodes_parsed:  # self.parser:
-            try:
-                node = self._add_node_data(nodedata)
-            except Exception:
-                self.logger.warning("failure adding node %s", nodedata)
-                raise
-            nodes.append(node)
+        for idx in range(0, len(nodes_parsed), self.batch_size):
+            nodes.extend(self._add_node_datas(nodes_parsed[idx:idx + self.batch_size]))
 
         self.refs, remaining_refs = [], self.refs
         self._add_references(remaining_refs)
@@ -77,34 +78,86 @@ class XmlImporter(object):
 
         return nodes
 
-    def _add_node_data(self, nodedata):
+    def _add_node_datas(self, nodedatas):
+        """
+        add nodes with one call then their references with another one.
+        When a node fails, the import stops there as when adding nodes one by one:
+        the nodes before it get their references, the following ones are deleted
+        """
+        items, added = [], []
+        for nodedata in nodedatas:
+            item = self._make_node_item(nodedata)
+            if item is not None:
+                items.append(item)
+                added.append(nodedata)
+        results = self._add_nodes(items)
+        failed = None
+        for idx, (nodedata, res) in enumerate(zip(added, results)):
+            if not res.StatusCode.is_good():
+                self.logger.warning("failure adding node %s", nodedata)
+                failed = idx
+                break
+        if failed is not None:
+            self._delete_nodes([res.AddedNodeId for res in results[failed + 1:] if res.StatusCode.is_good()])
+            added = added[:failed]
+        refs = []
+        for nodedata in added:
+            refs.extend(self._make_refs(nodedata))
+        if refs:
+            self._add_references(refs)
+        if failed is not None:
+            results[failed].StatusCode.check()
+        return [res.AddedNodeId for res in results]
+
+    def _make_node_item(self, nodedata):
         if nodedata.nodetype == 'UAObject':
-            node = self.add_object(nodedata)
+            return self._make_object(nodedata)
         elif nodedata.nodetype == 'UAObjectType':
-            node = self.add_object_type(nodedata)
+            return self._make_object_type(nodedata)
         elif nodedata.nodetype == 'UAVariable':
-            node = self.add_variable(nodedata)
+            return self._make_variable(nodedata)
         elif nodedata.nodetype == 'UAVariableType':
-            node = self.add_variable_type(nodedata)
+            return self._make_variable_type(nodedata)
         elif nodedata.nodetype == 'UAReferenceType':
-            node = self.add_reference_type(nodedata)
+            return self._make_reference_type(nodedata)
         elif nodedata.nodetype == 'UADataType':
-            node = self.add_datatype(nodedata)
+            return self._make_datatype(nodedata)
         elif nodedata.nodetype == 'UAMethod':
-            node = self.add_method(nodedata)
+            return self._make_method(nodedata)
         else:
             self.logger.warning("Not implemented node type: %s ", nodedata.nodetype)
-        return node
+            return None
+
+    def _is_server(self):
+        # the server module is not imported by clients, so no isinstance check
+        return hasattr(self.server, "iserver")
+
+    def _add_nodes(self, nodes):
+        if self._is_server():
+            return self.server.iserver.isession.add_nodes(nodes, bulk=True)
+        else:
+            return self.server.uaclient.add_nodes(nodes)
 
     def _add_node(self, node):
-        if isinstance(self.server, opcua.server.server.Server):
-            return self.server.iserver.isession.add_nodes([node])
+        return self._add_nodes([node])
+
+    def _delete_nodes(self, nodeids):
+        if not nodeids:
+            return
+        params = ua.DeleteNodesParameters()
+        for nodeid in nodeids:
+            item = ua.DeleteNodesItem()
+            item.NodeId = nodeid
+            item.DeleteTargetReferences = True
+            params.NodesToDelete.append(item)
+        if self._is_server():
+            self.server.iserver.isession.delete_nodes(params)
         else:
-            return self.server.uaclient.add_nodes([node])
+            self.server.uaclient.delete_nodes(params)
 
     def _add_references(self, refs):
-        if isinstance(self.server, opcua.server.server.Server):
-            res = self.server.iserver.isession.add_references(refs)
+        if self._is_server():
+            res = self.server.iserver.isession.add_references(refs, bulk=True)
         else:
             res = self.server.uaclient.add_references(refs)
 
@@ -171,6 +224,9 @@ class XmlImporter(object):
         return self._migrate_ns(self._to_nodeid(nodeid))
 
     def add_object(self, obj):
+        return self._add_node_item(obj, self._make_object(obj))
+
+    def _make_object(self, obj):
         node = self._get_node(obj)
         attrs = ua.ObjectAttributes()
         if obj.desc:
@@ -178,12 +234,12 @@ class XmlImporter(object):
         attrs.DisplayName = ua.LocalizedText(obj.displayname)
         attrs.EventNotifier = obj.eventnotifier
         node.NodeAttributes = attrs
-        res = self._add_node(node)
-        self._add_refs(obj)
-        res[0].StatusCode.check()
-        return res[0].AddedNodeId
+        return node
 
     def add_object_type(self, obj):
+        return self._add_node_item(obj, self._make_object_type(obj))
+
+    def _make_object_type(self, obj):
         node = self._get_node(obj)
         attrs = ua.ObjectTypeAttributes()
         if obj.desc:
@@ -191,12 +247,12 @@ class XmlImporter(object):
         attrs.DisplayName = ua.LocalizedText(obj.displayname)
         attrs.IsAbstract = obj.abstract
         node.NodeAttributes = attrs
-        res = self._add_node(node)
-        self._add_refs(obj)
-        res[0].StatusCode.check()
-        return res[0].AddedNodeId
+        return node
 
     def add_variable(self, obj):
+        return self._add_node_item(obj, self._make_variable(obj))
+
+    def _make_variable(self, obj):
         node = self._get_node(obj)
         attrs = ua.VariableAttributes()
         if obj.desc:
@@ -216,10 +272,7 @@ class XmlImporter(object):
         if obj.dimensions:
             attrs.ArrayDimensions = obj.dimensions
         node.NodeAttributes = attrs
-        res = self._add_node(node)
-        self._add_refs(obj)
-        res[0].StatusCode.check()
-        return res[0].AddedNodeId
+        return node
 
     def _get_ext_class(self, name):
         if hasattr(ua, name):
@@ -320,6 +373,9 @@ class XmlImporter(object):
             return ua.Variant(obj.value, getattr(ua.VariantType, obj.valuetype))
 
     def add_variable_type(self, obj):
+        return self._add_node_item(obj, self._make_variable_type(obj))
+
+    def _make_variable_type(self, obj):
         node = self._get_node(obj)
         attrs = ua.VariableTypeAttributes()
         if obj.desc:
@@ -335,12 +391,12 @@ class XmlImporter(object):
         if obj.dimensions:
             attrs.ArrayDimensions = obj.dimensions
         node.NodeAttributes = attrs
-        res = self._add_node(node)
-        self._add_refs(obj)
-        res[0].StatusCode.check()
-        return res[0].AddedNodeId
+        return node
 
     def add_method(self, obj):
+        return self._add_node_item(obj, self._make_method(obj))
+
+    def _make_method(self, obj):
         node = self._get_node(obj)
         attrs = ua.MethodAttributes()
         if obj.desc:
@@ -355,12 +411,12 @@ class XmlImporter(object):
         if obj.dimensions:
             attrs.ArrayDimensions = obj.dimensions
         node.NodeAttributes = attrs
-        res = self._add_node(node)
-        self._add_refs(obj)
-        res[0].StatusCode.check()
-        return res[0].AddedNodeId
+        return node
 
     def add_reference_type(self, obj):
+        return self._add_node_item(obj, self._make_reference_type(obj))
+
+    def _make_reference_type(self, obj):
         node = self._get_node(obj)
         attrs = ua.ReferenceTypeAttributes()
         if obj.desc:
@@ -373,12 +429,12 @@ class XmlImporter(object):
         if obj.symmetric:
             attrs.Symmetric = obj.symmetric
         node.NodeAttributes = attrs
-        res = self._add_node(node)
-        self._add_refs(obj)
-        res[0].StatusCode.check()
-        return res[0].AddedNodeId
+        return node
 
     def add_datatype(self, obj):
+        return self._add_node_item(obj, self._make_datatype(obj))
+
+    def _make_datatype(self, obj):
         node = self._get_node(obj)
         attrs = ua.DataTypeAttributes()
         if obj.desc:
@@ -387,14 +443,20 @@ class XmlImporter(object):
         if obj.abstract:
             attrs.IsAbstract = obj.abstract
         node.NodeAttributes = attrs
+        return node
+
+    def _add_node_item(self, obj, node):
         res = self._add_node(node)
         self._add_refs(obj)
         res[0].StatusCode.check()
         return res[0].AddedNodeId
 
     def _add_refs(self, obj):
-        if not obj.refs:
-            return
+        refs = self._make_refs(obj)
+        if refs:
+            self._add_references(refs)
+
+    def _make_refs(self, obj):
         refs = []
         for data in obj.refs:
             ref = ua.AddReferencesItem()
@@ -403,47 +465,41 @@ class XmlImporter(object):
             ref.SourceNodeId = self._migrate_ns(obj.nodeid)
             ref.TargetNodeId = self.to_nodeid(data.target)
             refs.append(ref)
-        self._add_references(refs)
+        return refs
 
     def _sort_nodes_by_parentid(self, ndatas):
         """
         Sort the list of nodes according their parent node in order to respect
-        the dependency between nodes.
+        the dependency between nodes. Nodes keep their order in the file, except
+        that nodes whose parent comes later are moved right after it.
+        Nodes whose parent is not in the file are assumed to have their parent
+        already known to the server.
 
         :param nodes: list of NodeDataObjects
         :returns: list of sorted nodes
         """
-        _ndatas = list(ndatas)
-        # list of node ids that are already sorted / inserted
-        sorted_nodes_ids = []
-        # list of sorted nodes (i.e. XML Elements)
+        ndatas = list(ndatas)
+        all_node_ids = set(ndata.nodeid for ndata in ndatas)
         sorted_ndatas = []
-        all_node_ids = [data.nodeid for data in ndatas]
-        # list of namespace indexes that are relevant for this import
-        # we can only respect ordering nodes for namespaces indexes that
-        # are defined in the xml file itself. Thus we assume that all other
-        # references namespaces are already known to the server and should
-        # not create any dependency problems (like "NodeNotFound")
-        while len(_ndatas) > 0:
-            pop_nodes = []
-            for ndata in _ndatas:
-                # Insert nodes that
-                #   (1) have no parent / parent_ns is None (e.g. namespace 0)
-                #   (2) ns is not in list of relevant namespaces
-                if ndata.nodeid.NamespaceIndex not in self.namespaces or \
-                        ndata.parent is None or \
-                        ndata.parent not in all_node_ids:
-                    sorted_ndatas.append(ndata)
-                    sorted_nodes_ids.append(ndata.nodeid)
-                    pop_nodes.append(ndata)
-                else:
-                    # Check if the nodes parent is already in the list of
-                    # inserted nodes
-                    if ndata.parent in sorted_nodes_ids:
-                        sorted_ndatas.append(ndata)
-                        sorted_nodes_ids.append(ndata.nodeid)
-                        pop_nodes.append(ndata)
-            # Remove inserted nodes from the list
-            for ndata in pop_nodes:
-                _ndatas.pop(_ndatas.index(ndata))
+        sorted_nodes_ids = set()
+        # parent node id -> nodes waiting for it
+        waiting = {}
+        for ndata in ndatas:
+            parent = ndata.parent
+            if parent is not None and parent in all_node_ids and parent not in sorted_nodes_ids:
+                waiting.setdefault(parent, []).append(ndata)
+                continue
+            stack = [ndata]
+            while stack:
+                ready = stack.pop()
+                sorted_ndatas.append(ready)
+                sorted_nodes_ids.add(ready.nodeid)
+                # reversed so that children are added in file order
+                stack.extend(reversed(waiting.pop(ready.nodeid, [])))
+        if waiting:
+            # circular parent references, nothing better to do than keep file order
+            remaining = [ndata for children in waiting.values() for ndata in children]
+            self.logger.warning("Could not order nodes by parent, cycle between %s",
+                                [ndata.nodeid for ndata in remaining])
+            sorted_ndatas.extend(remaining)
         return sorted_ndatas
@@ -1,6 +1,7 @@
 """
 parse xml file from my_opcua-spec
 """
+import io
 import logging
 from pytz import utc
 import uuid
@@ -88,6 +89,14 @@ class ExtObj(object):
 
 
 class XMLParser(object):
+    """
+    Parse a NodeSet file incrementally with iterparse: top level elements
+    are cleared once parsed, so memory does not grow with the file size.
+    NamespaceUris and Aliases come before nodes in NodeSet files, they are
+    read when first requested; nodes are then returned as they are parsed.
+    A parser reads its source once: nodes can only be requested once, and the
+    source is closed when they are all read or when close() is called
+    """
 
     def __init__(self, xmlpath=None, xmlstring=None):
         self.logger = logging.getLogger(__name__)
@@ -95,9 +104,16 @@ class XMLParser(object):
         self.path = xmlpath
 
         if xmlstring:
-            self.root = ET.fromstring(xmlstring)
+            source = io.StringIO(xmlstring) if isinstance(xmlstring, str) else io.BytesIO(xmlstring)
         else:
-            self.root = ET.parse(xmlpath).getroot()
+            source = open(xmlpath, "rb")
+        self._source = source
+        self._elements = self._iter_elements(source)
+        self._nodes_read = False
+        self._namespaces_uris = []
+        self._aliases = {}
+        self._first_node = None  # first node element, read with the header
+        self._header_read = False
 
         # FIXME: hard to get these xml namespaces with ElementTree, we may have to shift to lxml
         self.ns = {
@@ -107,39 +123,89 @@ class XMLParser(object):
             'xsi': "http://www.w3.org/2001/XMLSchema-instance"
         }
 
-    def get_used_namespaces(self):
+    def _iter_elements(self, source):
         """
-        Return the used namespace uris in this import file
+        yield complete top level elements, they are cleared when the next one is requested
         """
-        namespaces_uris = []
-        for child in self.root:
-            tag = self._retag.match(child.tag).groups()[1]
+        depth = 0
+        root = None
+        try:
+            for event, el in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if root is None:
+                        root = el
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth == 1:
+                    yield el
+                    root.clear()
+        finally:
+            source.close()
+
+    def close(self):
+        """
+        close the source, nodes not read yet are not parsed
+        """
+        self._elements.close()
+        self._source.close()
+
+    def _tag(self, el):
+        return self._retag.match(el.tag).groups()[1]
+
+    def _read_header(self):
+        if self._header_read:
+            return
+        self._header_read = True
+        for el in self._elements:
+            tag = self._tag(el)
             if tag == 'NamespaceUris':
-                namespaces_uris = [ns_element.text for ns_element in child]
+                self._namespaces_uris = [ns_element.text for ns_element in el]
+            elif tag == 'Aliases':
+                for alias in el:
+                    self._aliases[alias.attrib["Alias"]] = alias.text
+            elif tag not in ("Extensions", "Models"):
+                self._first_node = (tag, el)
                 break
-        return namespaces_uris
+
+    def get_used_namespaces(self):
+        """
+        Return the used namespace uris in this import file
+        """
+        self._read_header()
+        return self._namespaces_uris
 
     def get_aliases(self):
         """
         Return the used node aliases in this import file
         """
-        aliases = {}
-        for child in self.root:
-            tag = self._retag.match(child.tag).groups()[1]
-            if tag == 'Aliases':
-                for el in child:
-                    aliases[el.attrib["Alias"]] = el.text
-                break
-        return aliases
+        self._read_header()
+        return self._aliases
+
+    def iter_node_datas(self):
+        """
+        Return an iterator of NodeData objects, yielded as nodes are parsed.
+        Raises UaError when the nodes were already requested
+        """
+        if self._nodes_read:
+            raise ua.UaError("nodes of {0} were already read, an XMLParser can only be used once".format(
+                self.path or "xml string"))
+        self._nodes_read = True
+        return self._iter_node_datas()
+
+    def _iter_node_datas(self):
+        self._read_header()
+        if self._first_node is not None:
+            tag, el = self._first_node
+            self._first_node = None
+            yield self._parse_node(tag, el)
+        for el in self._elements:
+            tag = self._tag(el)
+            if tag not in ("Aliases", "NamespaceUris", "Extensions", "Models"):  # these XML tags don't contain nodes
+                yield self._parse_node(tag, el)
 
     def get_node_datas(self):
-        nodes = []
-        for child in self.root:
-            tag = self._retag.match(child.tag).groups()[1]
-            if tag not in ["Aliases", "NamespaceUris", "Extensions", "Models"]:  # these XML tags don't contain nodes
-                node = self._parse_node(tag, child)
-                nodes.append(node)
-        return nodes
+        return list(self.iter_node_datas())
 
     def _parse_node(self, nodetype, child):
         """
@@ -4,11 +4,16 @@ from abc import ABCMeta, abstractmethod
 from my_opcua.ua import CryptographyNone, SecurityPolicy
 from my_opcua.ua import MessageSecurityMode
 from my_opcua.ua import UaError
+from my_opcua.common.utils import LazyModule
+
+# cryptography is slow to import, it is only imported when a policy needs it
 try:
-    from my_opcua.crypto import uacrypto
-    CRYPTOGRAPHY_AVAILABLE = True
-except ImportError:
-    CRYPTOGRAPHY_AVAILABLE = False
+    from importlib.util import find_spec
+    CRYPTOGRAPHY_AVAILABLE = find_spec("cryptography") is not None
+except ImportError:  # Python 2
+    from pkgutil import find_loader
+    CRYPTOGRAPHY_AVAILABLE = find_loader("cryptography") is not None
+uacrypto = LazyModule("my_opcua.crypto.uacrypto")
 
 
 POLICY_NONE_URI = 'http://opcfoundation.org/UA/SecurityPolicy#None'
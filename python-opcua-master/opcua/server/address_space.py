@@ -1,8 +1,8 @@
-from threading import RLock
+from threading import RLock, Lock
 import logging
 from datetime import datetime
 import collections
-import shelve
+import itertools
 try:
     import cPickle as pickle
 except:
@@ -10,10 +10,25 @@ except:
 
 from my_opcua import ua
 from my_opcua.server.user_manager import UserManager
+from my_opcua.server.snapshot import NodeStore, SnapshotNodes, write_snapshot
+from my_opcua.server.change_journal import ChangeJournal
+
+
+_null_nodeid = ua.NodeId(ua.ObjectIds.Null)
+_hassubtype_nodeid = ua.NodeId(ua.ObjectIds.HasSubtype)
+_hassubtype_set = frozenset([_hassubtype_nodeid])
+_numeric_nodeid_types = (ua.NodeIdType.Numeric, ua.NodeIdType.TwoByte, ua.NodeIdType.FourByte)
+# serializes the lazy builds and resets of NodeData reference indexes, so a reader building
+# an index from the references never replaces the index a writer just updated
+_index_lock = Lock()
 
 
 class AttributeValue(object):
 
+    # ChangeJournal of the attribute while subscriptions watch it, see AddressSpace.watch_attribute;
+    # a class default so pickled attributes do not store it
+    journal = None
+
     def __init__(self, value):
         self.value = value
         self.value_callback = None
@@ -23,8 +38,27 @@ class AttributeValue(object):
         return "AttributeValue({0})".format(self.value)
     __repr__ = __str__
 
+    def __getstate__(self):
+        # callbacks and journal belong to the running server, only the value is pickled
+        return {"value": self.value}
+
+    def __setstate__(self, state):
+        self.__init__(state["value"])
+
 
 class NodeData(object):
+    """
+    Attributes and references of a node.
+    References are changed under the address space lock while they are read without lock,
+    so lists and dicts read by browsing are never changed in a way breaking an iteration:
+    items are appended in place but removed by replacing the list or dict
+    """
+
+    # defaults for nodes pickled before references were indexed
+    _refs_by_type = None
+    _refs_by_name = None
+    _ref_keys = None
+    _ref_counter = 0
 
     def __init__(self, nodeid):
         self.nodeid = nodeid
@@ -36,6 +70,168 @@ class NodeData(object):
         return "NodeData(id:{0}, attrs:{1}, refs:{2})".format(self.nodeid, self.attributes, self.references)
     __repr__ = __str__
 
+    def __getstate__(self):
+        # indexes are not pickled, they are rebuilt when needed
+        state = self.__dict__.copy()
+        for name in ("_refs_by_type", "_refs_by_name", "_ref_keys", "_ref_counter"):
+            state.pop(name, None)
+        return state
+
+    def _index(self):
+        """
+        references indexed by (ReferenceTypeId, IsForward), each entry being
+        a list of (insertion counter, reference) used to keep browse order
+        """
+        index = self._refs_by_type
+        if index is None:
+            with _index_lock:
+                if self._refs_by_type is None:
+                    index = {}
+                    for counter, ref in enumerate(self.references):
+                        index.setdefault((ref.ReferenceTypeId, ref.IsForward), []).append((counter, ref))
+                    self._ref_counter = len(self.references)
+                    self._refs_by_type = index
+                index = self._refs_by_type
+        return index
+
+    def _name_index(self):
+        """
+        references indexed by the BrowseName of their target, in insertion order
+        """
+        index = self._refs_by_name
+        if index is None:
+            with _index_lock:
+                if self._refs_by_name is None:
+                    index = {}
+                    for ref in self.references:
+                        index.setdefault(ref.BrowseName, []).append(ref)
+                    self._refs_by_name = index
+                index = self._refs_by_name
+        return index
+
+    def _keys(self):
+        """
+        number of references for each (ReferenceTypeId, NodeId, IsForward)
+        """
+        keys = self._ref_keys
+        if keys is None:
+            with _index_lock:
+                if self._ref_keys is None:
+                    keys = {}
+                    for ref in self.references:
+                        key = (ref.ReferenceTypeId, ref.NodeId, ref.IsForward)
+                        keys[key] = keys.get(key, 0) + 1
+                    self._ref_keys = keys
+                keys = self._ref_keys
+        return keys
+
+    def has_reference(self, reftype, nodeid, isforward):
+        return (reftype, nodeid, isforward) in self._keys()
+
+    def add_reference(self, ref):
+        keys = self._keys()
+        key = (ref.ReferenceTypeId, ref.NodeId, ref.IsForward)
+        keys[key] = keys.get(key, 0) + 1
+        index = self._index()
+        index.setdefault((ref.ReferenceTypeId, ref.IsForward), []).append((self._ref_counter, ref))
+        self._ref_counter += 1
+        self._name_index().setdefault(ref.BrowseName, []).append(ref)
+        self.references.append(ref)
+
+    def remove_reference(self, ref):
+        keys = self._keys()
+        index = self._index()
+        names = self._name_index()
+        idx = self.references.index(ref)
+        ref = self.references[idx]
+        self.references = self.references[:idx] + self.references[idx + 1:]
+        key = (ref.ReferenceTypeId, ref.NodeId, ref.IsForward)
+        keys[key] -= 1
+        if not keys[key]:
+            del keys[key]
+        key = (ref.ReferenceTypeId, ref.IsForward)
+        entries = [entry for entry in index[key] if entry[1] is not ref]
+        if entries:
+            index[key] = entries
+        else:
+            index = dict(index)
+            del index[key]
+            self._refs_by_type = index
+        entries = [other for other in names[ref.BrowseName] if other is not ref]
+        if entries:
+            names[ref.BrowseName] = entries
+        else:
+            names = dict(names)
+            del names[ref.BrowseName]
+            self._refs_by_name = names
+
+    def remove_references_to(self, nodeids):
+        """
+        remove all references to nodes in nodeids in one pass, return removed references
+        """
+        removed = [ref for ref in self.references if ref.NodeId in nodeids]
+        if removed:
+            self._reset_indexes([ref for ref in self.references if ref.NodeId not in nodeids])
+        return removed
+
+    def remove_duplicate_references(self):
+        """
+        remove references to a node with the same type as an earlier
+        reference, whatever their direction, return removed references
+        """
+        seen = set()
+        kept = []
+        removed = []
+        for ref in self.references:
+            key = (ref.ReferenceTypeId, ref.NodeId)
+            if key in seen:
+                removed.append(ref)
+            else:
+                seen.add(key)
+                kept.append(ref)
+        if removed:
+            self._reset_indexes(kept)
+        return removed
+
+    def _reset_indexes(self, references):
+        # indexes are rebuilt in reference order when needed
+        with _index_lock:
+            self.references = references
+            self._refs_by_type = None
+            self._refs_by_name = None
+            self._ref_keys = None
+
+    def get_references_by_name(self, name):
+        """
+        return references whose target has BrowseName name, in the order they were added
+        """
+        return self._name_index().get(name, ())
+
+    def get_references(self, reftypes, direction=ua.BrowseDirection.Both):
+        """
+        return references whose type is in reftypes and following direction,
+        in the order they were added
+        """
+        matches = []
+        # a new key may be added meanwhile, iterate over a copy
+        for (reftype, isforward), entries in list(self._index().items()):
+            if reftype not in reftypes:
+                continue
+            if direction == ua.BrowseDirection.Forward and not isforward:
+                continue
+            if direction == ua.BrowseDirection.Inverse and isforward:
+                continue
+            matches.append(entries)
+        if not matches:
+            return []
+        if len(matches) == 1:
+            return [ref for _, ref in matches[0]]
+        return [ref for _, ref in sorted(itertools.chain(*matches), key=_first)]
+
+
+def _first(entry):
+    return entry[0]
+
 
 class AttributeService(object):
 
@@ -82,55 +278,29 @@ class ViewService(object):
 
     def _browse(self, desc):
         res = ua.BrowseResult()
-        if desc.NodeId not in self._aspace:
+        node = self._aspace.get(desc.NodeId)
+        if node is None:
             res.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdInvalid)
             return res
-        node = self._aspace[desc.NodeId]
-        for ref in node.references:
-            if not self._is_suitable_ref(desc, ref):
-                continue
-            res.References.append(ref)
-        return res
-
-    def _is_suitable_ref(self, desc, ref):
-        if not self._suitable_direction(desc.BrowseDirection, ref.IsForward):
-            self.logger.debug("%s is not suitable due to direction", ref)
-            return False
-        if not self._suitable_reftype(desc.ReferenceTypeId, ref.ReferenceTypeId, desc.IncludeSubtypes):
-            self.logger.debug("%s is not suitable due to type", ref)
-            return False
-        if desc.NodeClassMask and ((desc.NodeClassMask & ref.NodeClass) == 0):
-            self.logger.debug("%s is not suitable due to class", ref)
-            return False
-        self.logger.debug("%s is a suitable ref for desc %s", ref, desc)
-        return True
-
-    def _suitable_reftype(self, ref1, ref2, subtypes):
-        """
-        """
-        if ref1 == ua.NodeId(ua.ObjectIds.Null):
+        if desc.ReferenceTypeId == _null_nodeid:
             # If ReferenceTypeId is not specified in the BrowseDescription,
             # all References are returned and includeSubtypes is ignored.
-            return True
-        if not subtypes and ref2.Identifier == ua.ObjectIds.HasSubtype:
-            return False
-        if ref1.Identifier == ref2.Identifier:
-            return True
-        oktypes = self._get_sub_ref(ref1)
-        if not subtypes and ua.NodeId(ua.ObjectIds.HasSubtype) in oktypes:
-            oktypes.remove(ua.NodeId(ua.ObjectIds.HasSubtype))
-        return ref2 in oktypes
-
-    def _get_sub_ref(self, ref):
-        res = []
-        nodedata = self._aspace[ref]
-        if nodedata is not None:
-            for ref in nodedata.references:
-                if ref.ReferenceTypeId.Identifier == ua.ObjectIds.HasSubtype and ref.IsForward:
-                    res.append(ref.NodeId)
-                    res += self._get_sub_ref(ref.NodeId)
+            refs = [ref for ref in node.references if self._suitable_direction(desc.BrowseDirection, ref.IsForward)]
+        else:
+            refs = node.get_references(self._suitable_reftypes(desc.ReferenceTypeId, desc.IncludeSubtypes),
+                                       desc.BrowseDirection)
+        if desc.NodeClassMask:
+            refs = [ref for ref in refs if desc.NodeClassMask & ref.NodeClass]
+        res.References = refs
         return res
 
+    def _suitable_reftypes(self, reftype, subtypes):
+        reftypes = self._aspace.get_reference_subtypes(reftype)
+        if not subtypes:
+            # without subtypes, HasSubtype references are never returned
+            reftypes = reftypes - _hassubtype_set
+        return reftypes
+
     def _suitable_direction(self, desc, isforward):
         if desc == ua.BrowseDirection.Both:
             return True
@@ -150,16 +320,22 @@ class ViewService(object):
     def _translate_browsepath_to_nodeid(self, path):
         self.logger.debug("looking at path: %s", path)
         res = ua.BrowsePathResult()
-        if path.StartingNode not in self._aspace:
-            res.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdInvalid)
-            return res
-        current = path.StartingNode
-        for el in path.RelativePath.Elements:
-            nodeid = self._find_element_in_node(el, current)
-            if not nodeid:
-                res.StatusCode = ua.StatusCode(ua.StatusCodes.BadNoMatch)
+        key = (path.StartingNode, tuple((el.ReferenceTypeId, el.IsInverse, el.IncludeSubtypes, el.TargetName)
+                                        for el in path.RelativePath.Elements))
+        current = self._aspace.get_cached_browse_path(key)
+        if current is None:
+            if path.StartingNode not in self._aspace:
+                res.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdInvalid)
                 return res
-            current = nodeid
+            version = self._aspace.references_version()
+            current = path.StartingNode
+            for el in path.RelativePath.Elements:
+                nodeid = self._find_element_in_node(el, current)
+                if not nodeid:
+                    res.StatusCode = ua.StatusCode(ua.StatusCodes.BadNoMatch)
+                    return res
+                current = nodeid
+            self._aspace.cache_browse_path(key, current, version)
         target = ua.BrowsePathTarget()
         target.TargetId = current
         target.RemainingPathIndex = 4294967295
@@ -167,11 +343,20 @@ class ViewService(object):
         return res
 
     def _find_element_in_node(self, el, nodeid):
-        nodedata = self._aspace[nodeid]
-        for ref in nodedata.references:
-            # FIXME: here we should check other arguments!!
-            if ref.BrowseName == el.TargetName:
-                return ref.NodeId
+        nodedata = self._aspace.get(nodeid)
+        if nodedata is not None:
+            if el.ReferenceTypeId == _null_nodeid:
+                # all references are followed and IncludeSubtypes is ignored
+                reftypes = None
+            elif el.IncludeSubtypes:
+                reftypes = self._aspace.get_reference_subtypes(el.ReferenceTypeId)
+            else:
+                reftypes = (el.ReferenceTypeId,)
+            for ref in nodedata.get_references_by_name(el.TargetName):
+                if ref.IsForward == el.IsInverse:
+                    continue
+                if reftypes is None or ref.ReferenceTypeId in reftypes:
+                    return ref.NodeId
         self.logger.info("element %s was not found in node %s", el, nodeid)
         return None
 
@@ -182,10 +367,16 @@ class NodeManagementService(object):
         self.logger = logging.getLogger(__name__)
         self._aspace = aspace
 
-    def add_nodes(self, addnodeitems, user=UserManager.User.Admin):
+    def add_nodes(self, addnodeitems, user=UserManager.User.Admin, bulk=False):
+        """
+        add nodes. With bulk, duplicate references are only looked for
+        once all nodes are added and then silently dropped
+        """
+        batch = set() if bulk else None
         results = []
         for item in addnodeitems:
-            results.append(self._add_node(item, user))
+            results.append(self._add_node(item, user, batch=batch))
+        self._end_batch(batch)
         return results
 
     def try_add_nodes(self, addnodeitems, user=UserManager.User.Admin, check=True):
@@ -194,7 +385,7 @@ class NodeManagementService(object):
             if not ret.StatusCode.is_good():
                 yield item
 
-    def _add_node(self, item, user, check=True):
+    def _add_node(self, item, user, check=True, batch=None):
         self.logger.debug("Adding node %s %s", item.RequestedNewNodeId, item.BrowseName)
         result = ua.AddNodesResult()
 
@@ -236,12 +427,12 @@ class NodeManagementService(object):
         self._aspace[nodedata.nodeid] = nodedata
 
         if parentdata is not None:
-            self._add_ref_from_parent(nodedata, item, parentdata)
-            self._add_ref_to_parent(nodedata, item, parentdata)
+            self._add_ref_from_parent(nodedata, item, parentdata, batch)
+            self._add_ref_to_parent(nodedata, item, parentdata, batch)
 
         # add type definition
         if item.TypeDefinition != ua.NodeId():
-            self._add_type_definition(nodedata, item)
+            self._add_type_definition(nodedata, item, batch)
 
         result.StatusCode = ua.StatusCode()
         result.AddedNodeId = nodedata.nodeid
@@ -262,18 +453,34 @@ class NodeManagementService(object):
         # add requested attrs
         self._add_nodeattributes(item.NodeAttributes, nodedata, add_timestamps)
 
-    def _add_unique_reference(self, nodedata, desc):
-        for r in nodedata.references:
-            if r.ReferenceTypeId == desc.ReferenceTypeId and r.NodeId == desc.NodeId:
-                if r.IsForward != desc.IsForward:
-                    self.logger.error("Cannot add conflicting reference %s ", str(desc))
-                    return ua.StatusCode(ua.StatusCodes.BadReferenceNotAllowed)
-                break  # ref already exists
-        else:
-            nodedata.references.append(desc)
+    def _add_unique_reference(self, nodedata, desc, batch=None):
+        exists = nodedata.has_reference(desc.ReferenceTypeId, desc.NodeId, desc.IsForward)
+        conflict = nodedata.has_reference(desc.ReferenceTypeId, desc.NodeId, not desc.IsForward)
+        if batch is not None:
+            # duplicates are removed at the end of the batch
+            if exists or conflict:
+                batch.add(nodedata.nodeid)
+            self._aspace.add_reference(nodedata, desc)
+            return ua.StatusCode()
+        if exists:
+            return ua.StatusCode()
+        if conflict:
+            self.logger.error("Cannot add conflicting reference %s ", str(desc))
+            return ua.StatusCode(ua.StatusCodes.BadReferenceNotAllowed)
+        self._aspace.add_reference(nodedata, desc)
         return ua.StatusCode()
 
-    def _add_ref_from_parent(self, nodedata, item, parentdata):
+    def _end_batch(self, batch):
+        if not batch:
+            return
+        for nodeid in batch:
+            nodedata = self._aspace.get(nodeid)
+            if nodedata is None:
+                continue
+            for ref in self._aspace.remove_duplicate_references(nodedata):
+                self.logger.info("Dropping duplicate or conflicting reference %s of node %s", ref, nodeid)
+
+    def _add_ref_from_parent(self, nodedata, item, parentdata, batch=None):
         desc = ua.ReferenceDescription()
         desc.ReferenceTypeId = item.ReferenceTypeId
         desc.NodeId = nodedata.nodeid
@@ -282,25 +489,25 @@ class NodeManagementService(object):
         desc.DisplayName = item.NodeAttributes.DisplayName
         desc.TypeDefinition = item.TypeDefinition
         desc.IsForward = True
-        self._add_unique_reference(parentdata, desc)
+        self._add_unique_reference(parentdata, desc, batch)
 
-    def _add_ref_to_parent(self, nodedata, item, parentdata):
+    def _add_ref_to_parent(self, nodedata, item, parentdata, batch=None):
         addref = ua.AddReferencesItem()
         addref.ReferenceTypeId = item.ReferenceTypeId
         addref.SourceNodeId = nodedata.nodeid
         addref.TargetNodeId = item.ParentNodeId
         addref.TargetNodeClass = parentdata.attributes[ua.AttributeIds.NodeClass].value.Value.Value
         addref.IsForward = False
-        self._add_reference_no_check(nodedata, addref)
+        self._add_reference_no_check(nodedata, addref, batch)
 
-    def _add_type_definition(self, nodedata, item):
+    def _add_type_definition(self, nodedata, item, batch=None):
         addref = ua.AddReferencesItem()
         addref.SourceNodeId = nodedata.nodeid
         addref.IsForward = True
         addref.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasTypeDefinition)
         addref.TargetNodeId = item.TypeDefinition
         addref.TargetNodeClass = ua.NodeClass.DataType
-        self._add_reference_no_check(nodedata, addref)
+        self._add_reference_no_check(nodedata, addref, batch)
 
     def delete_nodes(self, deletenodeitems, user=UserManager.User.Admin):
         results = []
@@ -317,19 +524,82 @@ class NodeManagementService(object):
             return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
 
         if item.DeleteTargetReferences:
-            for elem in self._aspace.keys():
-                for rdesc in self._aspace[elem].references:
-                    if rdesc.NodeId == item.NodeId:
-                        self._aspace[elem].references.remove(rdesc)
+            self._delete_references_to(set([item.NodeId]))
 
         self._delete_node_callbacks(self._aspace[item.NodeId])
 
         del(self._aspace[item.NodeId])
+        self._aspace.references_changed()
 
         return ua.StatusCode()
 
+    def delete_subtrees(self, deletenodeitems, user=UserManager.User.Admin):
+        """
+        delete nodes and, in the same pass, all nodes below them through
+        forward hierarchical references. Return one status code per item
+        """
+        results = []
+        nodeids = set()
+        targets = set()  # nodes whose incoming references are deleted
+        for item in deletenodeitems.NodesToDelete:
+            if user != UserManager.User.Admin:
+                results.append(ua.StatusCode(ua.StatusCodes.BadUserAccessDenied))
+                continue
+            if item.NodeId not in self._aspace:
+                self.logger.warning("DeleteNodesItem: NodeId %s does not exists", item.NodeId)
+                results.append(ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown))
+                continue
+            subtree = self._get_subtree(item.NodeId, nodeids)
+            nodeids.update(subtree)
+            if item.DeleteTargetReferences:
+                targets.update(subtree)
+            results.append(ua.StatusCode())
+
+        self._delete_references_to(targets, nodeids)
+        for nodeid in nodeids:
+            self._delete_node_callbacks(self._aspace[nodeid])
+            del(self._aspace[nodeid])
+        if nodeids:
+            self._aspace.references_changed()
+        return results
+
+    def _get_subtree(self, nodeid, known):
+        """
+        return node ids of nodeid and nodes below it not already in known
+        """
+        reftypes = self._aspace.get_reference_subtypes(ua.NodeId(ua.ObjectIds.HierarchicalReferences))
+        subtree = set([nodeid])
+        stack = [nodeid]
+        while stack:
+            nodedata = self._aspace.get(stack.pop())
+            if nodedata is None:
+                continue
+            for ref in nodedata.get_references(reftypes, ua.BrowseDirection.Forward):
+                if ref.NodeId not in subtree and ref.NodeId not in known:
+                    subtree.add(ref.NodeId)
+                    stack.append(ref.NodeId)
+        return subtree
+
+    def _delete_references_to(self, nodeids, skip=()):
+        """
+        delete references to nodeids from the nodes having some,
+        except from nodes in skip which are about to be deleted
+        """
+        sources = set()
+        for nodeid in nodeids:
+            sources.update(self._aspace.get_referencing_nodes(nodeid))
+        for source in sources:
+            if source in skip:
+                continue
+            sourcedata = self._aspace.get(source)
+            if sourcedata is not None:
+                self._aspace.remove_references_to(sourcedata, nodeids)
+
     def _delete_node_callbacks(self, nodedata):
         if ua.AttributeIds.Value in nodedata.attributes:
+            attval = nodedata.attributes[ua.AttributeIds.Value]
+            if attval.journal is not None:
+                attval.journal.append(ua.DataValue(status=ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)))
             for handle, callback in list(nodedata.attributes[ua.AttributeIds.Value].datachange_callbacks.items()):
                 try:
                     callback(handle, None, ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown))
@@ -337,10 +607,16 @@ class NodeManagementService(object):
                 except Exception as ex:
                     self.logger.exception("Error calling delete node callback callback %s, %s, %s", nodedata, ua.AttributeIds.Value, ex)
 
-    def add_references(self, refs, user=UserManager.User.Admin):
+    def add_references(self, refs, user=UserManager.User.Admin, bulk=False):
+        """
+        add references. With bulk, duplicate references are only looked for
+        once all references are added and then silently dropped
+        """
+        batch = set() if bulk else None
         result = []
         for ref in refs:
-            result.append(self._add_reference(ref, user))
+            result.append(self._add_reference(ref, user, batch))
+        self._end_batch(batch)
         return result
 
     def try_add_references(self, refs, user=UserManager.User.Admin):
@@ -348,7 +624,7 @@ class NodeManagementService(object):
             if not self._add_reference(ref, user).is_good():
                 yield ref
 
-    def _add_reference(self, addref, user):
+    def _add_reference(self, addref, user, batch=None):
         sourcedata = self._aspace.get(addref.SourceNodeId)
         if sourcedata is None:
             return ua.StatusCode(ua.StatusCodes.BadSourceNodeIdInvalid)
@@ -356,9 +632,9 @@ class NodeManagementService(object):
             return ua.StatusCode(ua.StatusCodes.BadTargetNodeIdInvalid)
         if user != UserManager.User.Admin:
             return ua.StatusCode(ua.StatusCodes.BadUserAccessDenied)
-        return self._add_reference_no_check(sourcedata, addref)
+        return self._add_reference_no_check(sourcedata, addref, batch)
 
-    def _add_reference_no_check(self, sourcedata, addref):
+    def _add_reference_no_check(self, sourcedata, addref, batch=None):
         rdesc = ua.ReferenceDescription()
         rdesc.ReferenceTypeId = addref.ReferenceTypeId
         rdesc.IsForward = addref.IsForward
@@ -373,7 +649,7 @@ class NodeManagementService(object):
         dname = self._aspace.get_attribute_value(addref.TargetNodeId, ua.AttributeIds.DisplayName).Value.Value
         if dname:
             rdesc.DisplayName = dname
-        return self._add_unique_reference(sourcedata, rdesc)
+        return self._add_unique_reference(sourcedata, rdesc, batch)
 
     def delete_references(self, refs, user=UserManager.User.Admin):
         result = []
@@ -389,7 +665,7 @@ class NodeManagementService(object):
         for rdesc in self._aspace[source].references:
             if rdesc.NodeId == target and rdesc.ReferenceTypeId == item.ReferenceTypeId:
                 if rdesc.IsForward == forward:
-                    self._aspace[source].references.remove(rdesc)
+                    self._aspace.remove_reference(self._aspace[source], rdesc)
                     return ua.StatusCode()
         return ua.StatusCode(ua.StatusCodes.BadNotFound)
 
@@ -483,75 +759,268 @@ class AddressSpace(object):
     """
     The address space object stores all the nodes of the OPC-UA server
     and helper methods.
-    The methods are thread safe
+    The methods are thread safe: reads take no lock and rely on dict
+    lookups being atomic, adding and removing nodes is serialized by one lock
+    and attribute writes by one of several locks chosen from the node id.
+    Value callbacks and datachange callbacks are called without any lock held
     """
 
+    # number of locks attribute writes are spread over
+    write_lock_count = 32
+    # number of translated browse paths kept in cache
+    browse_path_cache_size = 1024
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self._nodes = {}
-        self._lock = RLock()  # FIXME: should use multiple reader, one writter pattern
+        self._lock = RLock()
+        self._write_locks = [Lock() for _ in range(self.write_lock_count)]
         self._datachange_callback_counter = 200
         self._handle_to_attribute_map = {}
         self._default_idx = 2
         self._nodeid_counter = {0: 20000, 1: 2000}
+        self._max_ids = {}
+        self._subtypes_cache = {}
+        self._browse_path_cache = collections.OrderedDict()
+        self._browse_path_lock = Lock()
+        self._references_version = 0
+        self._sources = None
+
+    def _write_lock(self, nodeid):
+        return self._write_locks[hash(nodeid) % self.write_lock_count]
 
     def __getitem__(self, nodeid):
-        with self._lock:
-            return self._nodes.__getitem__(nodeid)
+        return self._nodes.__getitem__(nodeid)
 
     def get(self, nodeid):
-        with self._lock:
-            return self._nodes.get(nodeid, None)
+        return self._nodes.get(nodeid, None)
 
     def __setitem__(self, nodeid, value):
         with self._lock:
+            if self._max_ids is not None:
+                self._track_nodeid(nodeid)
+            if self._sources is not None:
+                old = self._nodes.get(nodeid, None)
+                if old is not None:
+                    self._unindex_references(old.nodeid, old.references)
+                self._index_references(value.nodeid, value.references)
             return self._nodes.__setitem__(nodeid, value)
 
     def __contains__(self, nodeid):
-        with self._lock:
-            return self._nodes.__contains__(nodeid)
+        return self._nodes.__contains__(nodeid)
 
     def __delitem__(self, nodeid):
         with self._lock:
+            if self._sources is not None:
+                self._unindex_references(nodeid, self._nodes[nodeid].references)
             self._nodes.__delitem__(nodeid)
 
+    def _get_max_ids(self):
+        """
+        biggest numeric identifier per namespace index, updated as nodes
+        are added. After loading nodes from a file it is computed again once
+        """
+        if self._max_ids is None:
+            self._max_ids = {}
+            for nodeid in list(self._nodes.keys()):
+                self._track_nodeid(nodeid)
+        return self._max_ids
+
+    def _track_nodeid(self, nodeid):
+        idx = nodeid.NamespaceIndex
+        if nodeid.NodeIdType in _numeric_nodeid_types and nodeid.Identifier > self._max_ids.get(idx, 0):
+            self._max_ids[idx] = nodeid.Identifier
+
     def generate_nodeid(self, idx=None):
+        return self.reserve_nodeids(1, idx)[0]
+
+    def reserve_nodeids(self, count, idx=None):
+        """
+        return count numeric node ids in namespace idx which are not used
+        and will not be returned again
+        """
         if idx is None:
             idx = self._default_idx
-        if idx in self._nodeid_counter:
-            self._nodeid_counter[idx] += 1
-        else:
-            # get the biggest identifier number from the existed nodes in address space
-            identifier_list = sorted([nodeid.Identifier for nodeid in self._nodes.keys()
-                                      if nodeid.NamespaceIndex == idx and nodeid.NodeIdType
-                                      in (ua.NodeIdType.Numeric, ua.NodeIdType.TwoByte, ua.NodeIdType.FourByte)])
-            if identifier_list:
-                self._nodeid_counter[idx] = identifier_list[-1]
+        nodeids = []
+        with self._lock:
+            if idx in self._nodeid_counter:
+                identifier = self._nodeid_counter[idx]
             else:
-                self._nodeid_counter[idx] = 1
-        nodeid = ua.NodeId(self._nodeid_counter[idx], idx)
-        with self._lock:  # OK since reentrant lock
-            while True:
-                if nodeid in self._nodes:
-                    nodeid = self.generate_nodeid(idx)
-                else:
-                    return nodeid
+                # start after the biggest identifier already used in namespace
+                identifier = self._get_max_ids().get(idx, 0)
+            while len(nodeids) < count:
+                identifier += 1
+                nodeid = ua.NodeId(identifier, idx)
+                if nodeid not in self._nodes:
+                    nodeids.append(nodeid)
+            self._nodeid_counter[idx] = identifier
+        return nodeids
 
     def keys(self):
         with self._lock:
             return self._nodes.keys()
 
+    def get_reference_subtypes(self, reftype):
+        """
+        return a frozenset of reference type reftype and all its subtypes.
+        Results are cached until a HasSubtype reference is added or removed
+        """
+        try:
+            return self._subtypes_cache[reftype]
+        except KeyError:
+            pass
+        cache = self._subtypes_cache
+        subtypes = set([reftype])
+        stack = [reftype]
+        while stack:
+            nodedata = self._nodes.get(stack.pop(), None)
+            if nodedata is None:
+                continue
+            for ref in nodedata.get_references((_hassubtype_nodeid,), ua.BrowseDirection.Forward):
+                if ref.NodeId not in subtypes:
+                    subtypes.add(ref.NodeId)
+                    stack.append(ref.NodeId)
+        subtypes = frozenset(subtypes)
+        # do not fill a cache which has been cleared in between
+        cache[reftype] = subtypes
+        return subtypes
+
+    def clear_reference_subtypes_cache(self):
+        self._subtypes_cache = {}
+
+    def _get_sources(self):
+        """
+        inverse index of references: target node id -> {source node id: number of references}.
+        Built from all nodes on first use, then maintained as references are added and removed.
+        """
+        if self._sources is None:
+            self._sources = {}
+            for nodedata in list(self._nodes.values()):
+                self._index_references(nodedata.nodeid, nodedata.references)
+        return self._sources
+
+    def _index_references(self, source, refs):
+        for ref in refs:
+            sources = self._sources.setdefault(ref.NodeId, {})
+            sources[source] = sources.get(source, 0) + 1
+
+    def _unindex_references(self, source, refs):
+        for ref in refs:
+            sources = self._sources.get(ref.NodeId, None)
+            if sources is None or source not in sources:
+                continue
+            sources[source] -= 1
+            if not sources[source]:
+                del sources[source]
+                if not sources:
+                    del self._sources[ref.NodeId]
+
+    def get_referencing_nodes(self, nodeid):
+        """
+        return node ids of all nodes having a reference to nodeid
+        """
+        with self._lock:
+            return list(self._get_sources().get(nodeid, ()))
+
+    def add_reference(self, nodedata, ref):
+        """
+        add reference ref to node nodedata
+        """
+        with self._lock:
+            nodedata.add_reference(ref)
+            if self._sources is not None:
+                self._index_references(nodedata.nodeid, (ref,))
+        self.references_changed(ref.ReferenceTypeId)
+
+    def remove_reference(self, nodedata, ref):
+        """
+        remove reference ref from node nodedata
+        """
+        with self._lock:
+            nodedata.remove_reference(ref)
+            if self._sources is not None:
+                self._unindex_references(nodedata.nodeid, (ref,))
+        self.references_changed(ref.ReferenceTypeId)
+
+    def remove_duplicate_references(self, nodedata):
+        """
+        remove duplicate references of node nodedata, see NodeData.remove_duplicate_references
+        """
+        with self._lock:
+            removed = nodedata.remove_duplicate_references()
+            if self._sources is not None:
+                self._unindex_references(nodedata.nodeid, removed)
+        if removed:
+            self.references_changed()
+        return removed
+
+    def remove_references_to(self, nodedata, nodeids):
+        """
+        remove all references of node nodedata to nodes in nodeids
+        """
+        with self._lock:
+            removed = nodedata.remove_references_to(nodeids)
+            if self._sources is not None:
+                self._unindex_references(nodedata.nodeid, removed)
+        if removed:
+            self.references_changed()
+        return removed
+
+    def references_version(self):
+        """
+        return a number changing each time references are added or removed
+        """
+        return self._references_version
+
+    def get_cached_browse_path(self, key):
+        """
+        return target node id of an already translated browse path, or None
+        """
+        with self._browse_path_lock:
+            nodeid = self._browse_path_cache.get(key, None)
+            if nodeid is not None:
+                # OrderedDict.move_to_end does not exist in Python 2
+                self._browse_path_cache[key] = self._browse_path_cache.pop(key)
+            return nodeid
+
+    def cache_browse_path(self, key, nodeid, version):
+        """
+        remember target node id of a translated browse path, unless references
+        changed since references_version() returned version.
+        The least recently used paths are dropped beyond browse_path_cache_size
+        """
+        with self._browse_path_lock:
+            if version != self._references_version:
+                return
+            self._browse_path_cache[key] = nodeid
+            if len(self._browse_path_cache) > self.browse_path_cache_size:
+                self._browse_path_cache.popitem(last=False)
+
+    def references_changed(self, reftype=None):
+        """
+        to be called when references of type reftype have been added or removed,
+        reftype None meaning any type.
+        Drops translated browse paths and, if needed, reference subtypes
+        """
+        with self._browse_path_lock:
+            self._references_version += 1
+            self._browse_path_cache.clear()
+        if reftype is None or reftype == _hassubtype_nodeid:
+            self.clear_reference_subtypes_cache()
+
     def empty(self):
         """
         Delete all nodes in address space
         """
         with self._lock:
             self._nodes = {}
+            self._sources = None
+            self._max_ids = {}
+            self.references_changed()
 
     def dump(self, path):
         """
         Dump address space as binary to file; note that server must be stopped for this method to work
-        DO NOT DUMP AN ADDRESS SPACE WHICH IS USING A SHELF (load_aspace_shelf), ONLY CACHED NODES WILL GET DUMPED!
         """
         # prepare nodes in address space for being serialized
         for nodeid, ndata in self._nodes.items():
@@ -560,7 +1029,7 @@ class AddressSpace(object):
                 self._nodes[nodeid].call = None
 
         with open(path, 'wb') as f:
-            pickle.dump(self._nodes, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(dict(self._nodes.items()), f, pickle.HIGHEST_PROTOCOL)
 
     def load(self, path):
         """
@@ -568,99 +1037,122 @@ class AddressSpace(object):
         """
         with open(path, 'rb') as f:
             self._nodes = pickle.load(f)
+        self._sources = None
+        self._max_ids = None
+        self.references_changed()
+
+    def make_snapshot(self, path, schema=b""):
+        """
+        Write all nodes to a snapshot file, see snapshot.py. schema identifies
+        the definition nodes were built from, typically a hash of it
+        """
+        write_snapshot(self._nodes, path, schema)
+
+    def load_snapshot(self, path, schema=None):
+        """
+        Load address space from a snapshot file, overwriting everything in the current address space.
+        The file is memory mapped and nodes are only decoded when accessed.
+        A SnapshotError is raised if the file is not a snapshot of the current
+        version or, if schema is given, was made from another schema
+        """
+        nodes = SnapshotNodes(path, schema)
+        with self._lock:
+            self._nodes = nodes
+            self._sources = None
+            self._max_ids = None
+            self.references_changed()
 
     def make_aspace_shelf(self, path):
         """
-        Make a shelf for containing the nodes from the standard address space; this is typically only done on first
-        start of the server. Subsequent server starts will load the shelf, nodes are then moved to a cache
-        by the LazyLoadingDict class when they are accessed. Saving data back to the shelf
-        is currently NOT supported, it is only used for the default OPC UA standard address space
+        Write all nodes to a node store file, see NodeStore in snapshot.py; this is typically only done on first
+        start of the server. Subsequent server starts will load the store, nodes are then decoded
+        when they are accessed. Changes are written back to the store with sync()
 
         Note: Intended for slow devices, such as Raspberry Pi, to greatly improve start up time
         """
-        s = shelve.open(path, "n", protocol=pickle.HIGHEST_PROTOCOL)
-        for nodeid, ndata in self._nodes.items():
-            s[nodeid.to_string()] = ndata
-        s.close()
+        write_snapshot(self._nodes, path)
 
     def load_aspace_shelf(self, path):
         """
-        Load the standard address space nodes from a python shelve via LazyLoadingDict as needed.
-        The dump() method can no longer be used if the address space is being loaded from a shelf
+        Load address space from a node store file, overwriting everything in the current address space.
+        The file is created if it does not exist and nodes are decoded from it as needed.
+        A SnapshotError is raised if the file is not a node store of the current version
 
         Note: Intended for slow devices, such as Raspberry Pi, to greatly improve start up time
         """
-        class LazyLoadingDict(collections.MutableMapping):
-            """
-            Special dict that only loads nodes as they are accessed. If a node is accessed it gets copied from the
-            shelve to the cache dict. All user nodes are saved in the cache ONLY. Saving data back to the shelf
-            is currently NOT supported
-            """
-            def __init__(self, source):
-                self.source = source  # python shelf
-                self.cache = {}  # internal dict
-
-            def __getitem__(self, key):
-                # try to get the item (node) from the cache, if it isn't there get it from the shelf
-                try:
-                    return self.cache[key]
-                except KeyError:
-                    node = self.cache[key] = self.source[key.to_string()]
-                    return node
-
-            def __setitem__(self, key, value):
-                # add a new item to the cache; if this item is in the shelf it is not updated
-                self.cache[key] = value
-
-            def __contains__(self, key):
-                return key in self.cache or key.to_string() in self.source
-
-            def __delitem__(self, key):
-                # only deleting items from the cache is allowed
-                del self.cache[key]
-
-            def __iter__(self):
-                # only the cache can be iterated over
-                return iter(self.cache.keys())
-
-            def __len__(self):
-                # only returns the length of items in the cache, not unaccessed items in the shelf
-                return len(self.cache)
+        nodes = NodeStore(path)
+        with self._lock:
+            self._nodes = nodes
+            self._sources = None
+            self._max_ids = None
+            self.references_changed()
 
-        self._nodes = LazyLoadingDict(shelve.open(path, "r"))
+    def sync(self):
+        """
+        Write nodes added, modified or deleted since load_aspace_shelf back to the node store file,
+        accessed nodes are written when their record changed. Does nothing if the address space was not loaded
+        with load_aspace_shelf; as for dump(), the server should not be modifying nodes meanwhile
+        """
+        if isinstance(self._nodes, NodeStore):
+            with self._lock:
+                self._nodes.sync()
 
     def get_attribute_value(self, nodeid, attr):
-        with self._lock:
-            self.logger.debug("get attr val: %s %s", nodeid, attr)
-            if nodeid not in self._nodes:
-                dv = ua.DataValue()
-                dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
-                return dv
-            node = self._nodes[nodeid]
-            if attr not in node.attributes:
-                dv = ua.DataValue()
-                dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
-                return dv
-            attval = node.attributes[attr]
-            if attval.value_callback:
-                return attval.value_callback()
-            return attval.value
+        self.logger.debug("get attr val: %s %s", nodeid, attr)
+        node = self._nodes.get(nodeid, None)
+        if node is None:
+            dv = ua.DataValue()
+            dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+            return dv
+        attval = node.attributes.get(attr, None)
+        if attval is None:
+            dv = ua.DataValue()
+            dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
+            return dv
+        if attval.value_callback:
+            return attval.value_callback()
+        return attval.value
+
+    def set_attribute_value_callback(self, nodeid, attr, callback):
+        """
+        Reads of the attribute return callback(), a DataValue, instead of the stored value.
+        A callback of None restores the stored value.
+        Monitored items of such an attribute are sampled since writes do not reflect its value
+        """
+        node = self._nodes.get(nodeid, None)
+        if node is None:
+            return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+        attval = node.attributes.get(attr, None)
+        if attval is None:
+            return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
+        attval.value_callback = callback
+        return ua.StatusCode()
+
+    def has_value_callback(self, nodeid, attr):
+        node = self._nodes.get(nodeid, None)
+        if node is None:
+            return False
+        attval = node.attributes.get(attr, None)
+        return attval is not None and attval.value_callback is not None
 
     def set_attribute_value(self, nodeid, attr, value):
-        with self._lock:
-            self.logger.debug("set attr val: %s %s %s", nodeid, attr, value)
-            node = self._nodes.get(nodeid, None)
-            if node is None:
-                return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
-            attval = node.attributes.get(attr, None)
-            if attval is None:
-                return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
+        self.logger.debug("set attr val: %s %s %s", nodeid, attr, value)
+        node = self._nodes.get(nodeid, None)
+        if node is None:
+            return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+        attval = node.attributes.get(attr, None)
+        if attval is None:
+            return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
 
+        with self._write_lock(nodeid):
             old = attval.value
             attval.value = value
             cbs = []
             if old.Value != value.Value:  # only send call callback when a value change has happend
                 cbs = list(attval.datachange_callbacks.items())
+                if attval.journal is not None:
+                    # appended under the write lock, so the journal keeps the order of the writes
+                    attval.journal.append(value)
 
         for k, v in cbs:
             try:
@@ -671,25 +1163,59 @@ class AddressSpace(object):
         return ua.StatusCode()
 
     def add_datachange_callback(self, nodeid, attr, callback):
+        self.logger.debug("set attr callback: %s %s %s", nodeid, attr, callback)
+        node = self._nodes.get(nodeid, None)
+        if node is None:
+            return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown), 0
+        attval = node.attributes.get(attr, None)
+        if attval is None:
+            return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid), 0
         with self._lock:
-            self.logger.debug("set attr callback: %s %s %s", nodeid, attr, callback)
-            if nodeid not in self._nodes:
-                return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown), 0
-            node = self._nodes[nodeid]
-            if attr not in node.attributes:
-                return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid), 0
-            attval = node.attributes[attr]
-            self._datachange_callback_counter += 1
-            handle = self._datachange_callback_counter
-            attval.datachange_callbacks[handle] = callback
+            handle = self.new_datachange_handle()
             self._handle_to_attribute_map[handle] = (nodeid, attr)
-            return ua.StatusCode(), handle
+        with self._write_lock(nodeid):
+            attval.datachange_callbacks[handle] = callback
+        return ua.StatusCode(), handle
+
+    def new_datachange_handle(self):
+        """
+        return a new handle, unique among datachange callback handles, for monitored
+        items notified without datachange callback
+        """
+        with self._lock:
+            self._datachange_callback_counter += 1
+            return self._datachange_callback_counter
+
+    def watch_attribute(self, nodeid, attr, reader):
+        """
+        Log the changes of an attribute to its ChangeJournal, they are read by the ChangeReader
+        of a subscription at its publish tick instead of being pushed to datachange callbacks
+        by the writer. Returns a status code and the AttributeValue, to pass to unwatch_attribute
+        """
+        node = self._nodes.get(nodeid, None)
+        if node is None:
+            return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown), None
+        attval = node.attributes.get(attr, None)
+        if attval is None:
+            return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid), None
+        with self._write_lock(nodeid):
+            if attval.journal is None:
+                attval.journal = ChangeJournal()
+            attval.journal.add_reader(reader)
+        return ua.StatusCode(), attval
+
+    def unwatch_attribute(self, nodeid, attval, reader):
+        with self._write_lock(nodeid):
+            if attval.journal is not None and attval.journal.remove_reader(reader):
+                attval.journal = None
 
     def delete_datachange_callback(self, handle):
         with self._lock:
-            if handle in self._handle_to_attribute_map:
-                nodeid, attr = self._handle_to_attribute_map.pop(handle)
-                self._nodes[nodeid].attributes[attr].datachange_callbacks.pop(handle)
+            if handle not in self._handle_to_attribute_map:
+                return
+            nodeid, attr = self._handle_to_attribute_map.pop(handle)
+        with self._write_lock(nodeid):
+            self._nodes[nodeid].attributes[attr].datachange_callbacks.pop(handle)
 
     def add_method_callback(self, methodid, callback):
         with self._lock:
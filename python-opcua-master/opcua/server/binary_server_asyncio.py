@@ -2,6 +2,7 @@
 Socket server forwarding request to internal server
 """
 import logging
+import struct
 try:
     # we prefer to use bundles asyncio version, otherwise fallback to trollius
     import asyncio
@@ -17,9 +18,23 @@ logger = logging.getLogger(__name__)
 
 
 
-class OPCUAProtocol(asyncio.Protocol):
+# asyncio.BufferedProtocol is available from python 3.7, older versions
+# fall back to data_received
+BufferedProtocol = getattr(asyncio, "BufferedProtocol", asyncio.Protocol)
+
+# default size limit of a received message chunk, headers announcing
+# larger chunks are rejected before their body is buffered
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+_header_struct = struct.Struct("<3scI")
+
+
+class OPCUAProtocol(BufferedProtocol):
 
     """Interface for OPCUA protocol.
+    Received data is written by asyncio directly into a per connection
+    bytearray, complete chunks are parsed in place and only the incomplete
+    tail is moved to the front of the buffer
     """
 
     iserver = None
@@ -27,6 +42,8 @@ class OPCUAProtocol(asyncio.Protocol):
     logger = None
     policies = None
     clients = None
+    max_message_size = MAX_MESSAGE_SIZE
+    buffer_size = 65536
 
     def __str__(self):
         return "OPCUAProtocol({}, {})".format(self.peername, self.processor.session)
@@ -38,7 +55,10 @@ class OPCUAProtocol(asyncio.Protocol):
         self.transport = transport
         self.processor = UaProcessor(self.iserver, self.transport)
         self.processor.set_policies(self.policies)
-        self.data = b""
+        self._buffer = bytearray(self.buffer_size)
+        self._start = 0  # start of data not parsed yet
+        self._end = 0  # end of received data
+        self._closed = False
         self.iserver.asyncio_transports.append(transport)
         self.clients.append(self)
 
@@ -50,38 +70,85 @@ class OPCUAProtocol(asyncio.Protocol):
         if self in self.clients:
             self.clients.remove(self)
 
+    def get_buffer(self, sizehint):
+        # do not let the socket read a few bytes at a time at the end of buffer
+        minimum = self.buffer_size // 4
+        if len(self._buffer) - self._end < minimum:
+            self._reserve(self._end - self._start + minimum)
+        return memoryview(self._buffer)[self._end:]
+
+    def buffer_updated(self, nbytes):
+        logger.debug("received %s bytes from socket", nbytes)
+        self._end += nbytes
+        self._process_data()
+
     def data_received(self, data):
+        # used when asyncio.BufferedProtocol is not available
         logger.debug("received %s bytes from socket", len(data))
-        if self.data:
-            data = self.data + data
-            self.data = b""
-        self._process_data(data)
-
-    def _process_data(self, data):
-        buf = ua.utils.Buffer(data)
-        while True:
+        self._reserve(self._end - self._start + len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+        self._process_data()
+
+    def _reserve(self, size):
+        """
+        make room for size bytes of data from self._start, compacting the
+        unparsed tail to the front of the buffer, or growing it
+        """
+        tail = self._end - self._start
+        if size <= len(self._buffer) - self._start:
+            return
+        if size <= len(self._buffer):
+            self._buffer[:tail] = self._buffer[self._start:self._end]
+        else:
+            buf = bytearray(max(size, 2 * len(self._buffer)))
+            buf[:tail] = memoryview(self._buffer)[self._start:self._end]
+            self._buffer = buf
+        self._start = 0
+        self._end = tail
+
+    def _reject(self, size):
+        logger.warning("Message of %s bytes from %s exceeds max message size %s, closing",
+                       size, self.peername, self.max_message_size)
+        err = ua.ErrorMessage()
+        err.Error = ua.StatusCode(ua.StatusCodes.BadTcpMessageTooLarge)
+        err.Reason = "Message size {0} exceeds {1}".format(size, self.max_message_size)
+        self.transport.write(uabin.uatcp_to_binary(ua.MessageType.Error, err))
+        self._close()
+
+    def _close(self):
+        self._closed = True
+        self._start = self._end = 0
+        self.transport.close()
+
+    def _process_data(self):
+        while not self._closed:
+            available = self._end - self._start
+            if available < _header_struct.size:
+                break
+            size = _header_struct.unpack_from(self._buffer, self._start)[2]
+            if size > self.max_message_size or size < _header_struct.size:
+                self._reject(size)
+                return
+            if available < size:
+                logger.info("We did not receive enough data from client, waiting for more")
+                self._reserve(size)
+                return
+            buf = ua.utils.Buffer(memoryview(self._buffer)[self._start:self._start + size])
+            self._start += size
             try:
-                backup_buf = buf.copy()
-                try:
-                    hdr = uabin.header_from_binary(buf)
-                except ua.utils.NotEnoughData:
-                    logger.info("We did not receive enough data from client, waiting for more")
-                    self.data = backup_buf.read(len(backup_buf))
-                    return
-                if len(buf) < hdr.body_size:
-                    logger.info("We did not receive enough data from client, waiting for more")
-                    self.data = backup_buf.read(len(backup_buf))
-                    return
+                hdr = uabin.header_from_binary(buf)
                 ret = self.processor.process(hdr, buf)
-                if not ret:
-                    logger.info("processor returned False, we close connection from %s", self.peername)
-                    self.transport.close()
-                    return
-                if len(buf) == 0:
-                    return
             except Exception:
-                logger.exception("Exception raised while parsing message from client, closing")
+                logger.exception("Exception raised while parsing message from client, dropping received data")
+                self._start = self._end = 0
+                return
+            if not ret:
+                logger.info("processor returned False, we close connection from %s", self.peername)
+                self._close()
                 return
+        if self._start == self._end:
+            self._start = self._end = 0
 
 
 class BinaryServer(object):
@@ -95,10 +162,18 @@ class BinaryServer(object):
         self._server = None
         self._policies = []
         self.clients = []
+        self.max_message_size = MAX_MESSAGE_SIZE
 
     def set_policies(self, policies):
         self._policies = policies
 
+    def set_max_message_size(self, size):
+        """
+        set maximum size of a received message chunk, larger chunks are
+        rejected with BadTcpMessageTooLarge and the connection is closed
+        """
+        self.max_message_size = size
+
     def set_loop(self, loop):
         self.loop = loop
 
@@ -108,7 +183,8 @@ class BinaryServer(object):
                 loop=self.loop,
                 logger=self.logger,
                 policies=self._policies,
-                clients=self.clients
+                clients=self.clients,
+                max_message_size=self.max_message_size
             )
         protocol_factory = type('OPCUAProtocol', (OPCUAProtocol,), prop)
 
@@ -0,0 +1,117 @@
+"""
+journals of attribute value changes, written by the address space and read by subscriptions
+"""
+
+from threading import Lock
+
+
+class ChangeJournal(object):
+    """
+    Append only log of the value changes of one AttributeValue, read by the
+    ChangeReader of each subscription monitoring the attribute.
+    Writers append in O(1) whatever the number of readers; a reader is marked
+    dirty only by the first change written after its previous read of the
+    journal, so at its publish tick it reads only the journals of attributes
+    it watches which changed. Changes read by all readers are dropped, and a
+    reader falling more than max_size changes behind loses the oldest ones
+    """
+
+    max_size = 10000
+    # the journal is trimmed when it grows past this size, then twice its size after trimming,
+    # at most min_trim_size past max_size
+    min_trim_size = 64
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries = []
+        self._first = 0  # sequence number of _entries[0]
+        self._cursors = {}
+        # readers which read all the changes, marked dirty by the next append
+        self._idle = set()
+        self._trim_size = self.min_trim_size
+
+    def append(self, value):
+        with self._lock:
+            if not self._cursors:
+                return
+            self._entries.append(value)
+            if self._idle:
+                for reader in self._idle:
+                    reader.mark(self)
+                self._idle = set()
+            if len(self._entries) >= self._trim_size:
+                self._trim()
+
+    def add_reader(self, reader):
+        """
+        register reader, which reads changes appended from now on
+        """
+        with self._lock:
+            if reader not in self._cursors:
+                self._cursors[reader] = self._first + len(self._entries)
+                self._idle.add(reader)
+
+    def remove_reader(self, reader):
+        """
+        unregister reader, return True when no reader is left
+        """
+        with self._lock:
+            self._cursors.pop(reader, None)
+            self._idle.discard(reader)
+            if not self._cursors:
+                self._first += len(self._entries)
+                self._entries = []
+                self._trim_size = self.min_trim_size
+            return not self._cursors
+
+    def read(self, reader):
+        """
+        return the changes appended since the previous read of reader, and
+        whether some of them were lost because the reader fell too far behind
+        """
+        with self._lock:
+            cursor = self._cursors.get(reader)
+            if cursor is None:
+                return [], False
+            end = self._first + len(self._entries)
+            self._cursors[reader] = end
+            self._idle.add(reader)
+            if cursor >= end:
+                return [], False
+            return self._entries[max(cursor - self._first, 0):], cursor < self._first
+
+    def _trim(self):
+        drop = min(self._cursors.values()) - self._first
+        drop = max(drop, len(self._entries) - self.max_size)
+        if drop > 0:
+            del self._entries[:drop]
+            self._first += drop
+        self._trim_size = max(self.min_trim_size, min(2 * len(self._entries), self.max_size + self.min_trim_size))
+
+
+class ChangeReader(object):
+    """
+    Reader of the change journals of the attributes monitored by a subscription,
+    keeping the set of journals changed since their previous read
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._dirty = set()
+
+    def mark(self, journal):
+        with self._lock:
+            self._dirty.add(journal)
+
+    def read(self):
+        """
+        return (journal, changes, lost) for each journal changed since the previous read
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        results = []
+        for journal in dirty:
+            changes, lost = journal.read(self)
+            if changes:
+                results.append((journal, changes, lost))
+        return results
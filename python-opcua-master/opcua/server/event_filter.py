@@ -0,0 +1,370 @@
+"""
+compile the WhereClause and SelectClauses of an EventFilter into functions
+called for each event, instead of walking the filter for every event
+"""
+
+from datetime import datetime
+import copy
+import operator
+import re
+
+from my_opcua import ua
+
+
+# values returned as is by the select function instead of being deep copied,
+# NodeIds are hashable and never modified once created
+_immutable_types = (bool, int, float, str, bytes, datetime, type(None), ua.NodeId)
+
+# python conversion of the built-in data types for Cast
+_cast_types = {
+    ua.ObjectIds.Boolean: lambda val: val.strip().lower() in ("true", "1") if isinstance(val, str) else bool(val),
+    ua.ObjectIds.String: str,
+    ua.ObjectIds.Float: float,
+    ua.ObjectIds.Double: float,
+}
+for _typeid in (ua.ObjectIds.SByte, ua.ObjectIds.Byte, ua.ObjectIds.Int16, ua.ObjectIds.UInt16, ua.ObjectIds.Int32,
+                ua.ObjectIds.UInt32, ua.ObjectIds.Int64, ua.ObjectIds.UInt64):
+    _cast_types[_typeid] = int
+
+# number of operands of each supported operator, as (minimum, maximum).
+# RelatedTo is a query operator relating instances of type definitions, events
+# are not nodes of the address space and it is rejected
+_operand_counts = {
+    ua.FilterOperator.Equals: (2, 2),
+    ua.FilterOperator.IsNull: (1, 1),
+    ua.FilterOperator.GreaterThan: (2, 2),
+    ua.FilterOperator.LessThan: (2, 2),
+    ua.FilterOperator.GreaterThanOrEqual: (2, 2),
+    ua.FilterOperator.LessThanOrEqual: (2, 2),
+    ua.FilterOperator.Like: (2, 2),
+    ua.FilterOperator.Not: (1, 1),
+    ua.FilterOperator.Between: (3, 3),
+    ua.FilterOperator.InList: (2, None),
+    ua.FilterOperator.And: (2, 2),
+    ua.FilterOperator.Or: (2, 2),
+    ua.FilterOperator.Cast: (2, 2),
+    ua.FilterOperator.InView: (1, 1),
+    ua.FilterOperator.OfType: (1, 1),
+    ua.FilterOperator.BitwiseAnd: (2, 2),
+    ua.FilterOperator.BitwiseOr: (2, 2),
+}
+
+
+def compile_select_clauses(select_clauses):
+    """
+    return a function returning the EventFields of an event for select_clauses,
+    see Event.to_event_fields
+    """
+    names = [_select_name(sattr) for sattr in select_clauses]
+
+    def select(event):
+        fields = []
+        data_types = event.data_types
+        for name in names:
+            val = getattr(event, name, _missing) if name is not None else _missing
+            if val is _missing:
+                fields.append(ua.Variant(None))
+                continue
+            if type(val) not in _immutable_types:
+                val = copy.deepcopy(val)
+            fields.append(ua.Variant(val, data_types.get(name)))
+        return fields
+    return select
+
+
+def compile_where_clause(whereclause, aspace=None):
+    """
+    return a predicate telling whether an event matches the ContentFilter whereclause.
+    Operators follow the three-valued logic of the spec, with None as NULL, and the
+    event matches when the first element evaluates to True.
+    Raises UaStatusCodeError for an invalid filter
+    """
+    elements = whereclause.Elements
+    if not elements:
+        return lambda event: True
+    return _FilterCompiler(elements, aspace).compile()
+
+
+class _Missing(object):
+    pass
+
+
+_missing = _Missing()
+
+
+def _select_name(sattr):
+    if sattr.BrowsePath:
+        return sattr.BrowsePath[0].Name
+    try:
+        return ua.AttributeIds(sattr.AttributeId).name
+    except ValueError:
+        return None
+
+
+class _FilterCompiler(object):
+
+    def __init__(self, elements, aspace):
+        self.elements = elements
+        self.aspace = aspace
+        self._compiled = {}
+        # subtype checks of OfType, by (EventType, type)
+        self._subtypes = {}
+
+    def compile(self):
+        func = self._element(0)
+
+        def predicate(event):
+            return func(event) is True
+        return predicate
+
+    def _element(self, index):
+        if index not in self._compiled:
+            self._compiled[index] = self._compile_element(index)
+        return self._compiled[index]
+
+    def _compile_element(self, index):
+        el = self.elements[index]
+        try:
+            op = ua.FilterOperator(el.FilterOperator)
+        except ValueError:
+            raise ua.UaStatusCodeError(ua.StatusCodes.BadFilterOperatorInvalid)
+        if op not in _operand_counts:
+            raise ua.UaStatusCodeError(ua.StatusCodes.BadFilterOperatorUnsupported)
+        low, high = _operand_counts[op]
+        nb = len(el.FilterOperands)
+        if nb < low or (high is not None and nb > high):
+            raise ua.UaStatusCodeError(ua.StatusCodes.BadFilterOperandCountMismatch)
+        ops = [self._operand(operand, index) for operand in el.FilterOperands]
+        return getattr(self, "_compile_" + op.name)(*ops)
+
+    def _operand(self, operand, index):
+        """
+        return a function returning the value of operand for an event
+        """
+        if isinstance(operand, ua.ElementOperand):
+            # elements may only use the following ones, which excludes loops
+            if not index < operand.Index < len(self.elements):
+                raise ua.UaStatusCodeError(ua.StatusCodes.BadFilterElementInvalid)
+            return self._element(operand.Index)
+        if isinstance(operand, ua.LiteralOperand):
+            value = operand.Value.Value
+            return lambda event: value
+        if isinstance(operand, ua.SimpleAttributeOperand):
+            if operand.BrowsePath:
+                # only properties of the event are supported
+                return self._event_property(operand.BrowsePath[0].Name)
+            return self._event_type_attribute(operand.AttributeId)
+        if isinstance(operand, ua.AttributeOperand):
+            if operand.BrowsePath.Elements:
+                return self._event_property(operand.BrowsePath.Elements[0].TargetName.Name)
+            return self._event_type_attribute(operand.AttributeId)
+        raise ua.UaStatusCodeError(ua.StatusCodes.BadFilterOperandInvalid)
+
+    @staticmethod
+    def _event_property(name):
+        return lambda event: getattr(event, name, None)
+
+    def _event_type_attribute(self, attr):
+        aspace = self.aspace
+        values = {}
+
+        def value(event):
+            if event.EventType not in values:
+                values[event.EventType] = aspace.get_attribute_value(event.EventType, attr).Value.Value
+            return values[event.EventType]
+        return value
+
+    @staticmethod
+    def _compare(compare, first, second):
+        def func(event):
+            val1 = first(event)
+            val2 = second(event)
+            if val1 is None or val2 is None:
+                return None
+            try:
+                return compare(val1, val2)
+            except TypeError:
+                return None
+        return func
+
+    def _compile_Equals(self, first, second):
+        return self._compare(operator.eq, first, second)
+
+    def _compile_IsNull(self, first):
+        return lambda event: first(event) is None
+
+    def _compile_GreaterThan(self, first, second):
+        return self._compare(operator.gt, first, second)
+
+    def _compile_LessThan(self, first, second):
+        return self._compare(operator.lt, first, second)
+
+    def _compile_GreaterThanOrEqual(self, first, second):
+        return self._compare(operator.ge, first, second)
+
+    def _compile_LessThanOrEqual(self, first, second):
+        return self._compare(operator.le, first, second)
+
+    def _compile_Like(self, first, second):
+        patterns = {}
+
+        def func(event):
+            string = _text(first(event))
+            pattern = _text(second(event))
+            if string is None or pattern is None:
+                return None
+            if pattern not in patterns:
+                patterns[pattern] = _like_to_regex(pattern)
+            return patterns[pattern].match(string) is not None
+        return func
+
+    def _compile_Not(self, first):
+        def func(event):
+            val = first(event)
+            return None if val is None else not val
+        return func
+
+    def _compile_Between(self, first, low, high):
+        def func(event):
+            val = first(event)
+            val_low = low(event)
+            val_high = high(event)
+            if val is None or val_low is None or val_high is None:
+                return None
+            try:
+                return val_low <= val <= val_high
+            except TypeError:
+                return None
+        return func
+
+    def _compile_InList(self, first, *others):
+        def func(event):
+            val = first(event)
+            if val is None:
+                return None
+            return any(val == other(event) for other in others)
+        return func
+
+    def _compile_And(self, first, second):
+        def func(event):
+            val1 = first(event)
+            if val1 is not None and not val1:
+                return False
+            val2 = second(event)
+            if val2 is not None and not val2:
+                return False
+            if val1 is None or val2 is None:
+                return None
+            return True
+        return func
+
+    def _compile_Or(self, first, second):
+        def func(event):
+            val1 = first(event)
+            if val1:
+                return True
+            val2 = second(event)
+            if val2:
+                return True
+            if val1 is None or val2 is None:
+                return None
+            return False
+        return func
+
+    def _compile_Cast(self, first, second):
+        def func(event):
+            val = first(event)
+            typeid = second(event)
+            cast = None
+            if getattr(typeid, "NamespaceIndex", None) == 0:
+                cast = _cast_types.get(typeid.Identifier)
+            if val is None or cast is None:
+                return None
+            try:
+                return cast(val)
+            except (TypeError, ValueError):
+                return None
+        return func
+
+    def _compile_InView(self, first):
+        aspace = self.aspace
+
+        def func(event):
+            # the source node of the event is organized in the view
+            nodedata = aspace.get(first(event))
+            if nodedata is None:
+                return False
+            source = getattr(event, "SourceNode", None)
+            return any(ref.IsForward and ref.NodeId == source for ref in nodedata.references)
+        return func
+
+    def _compile_OfType(self, first):
+        def func(event):
+            typeid = first(event)
+            evtype = getattr(event, "EventType", None)
+            if typeid is None or evtype is None:
+                return None
+            key = (evtype, typeid)
+            if key not in self._subtypes:
+                self._subtypes[key] = self._is_subtype(evtype, typeid)
+            return self._subtypes[key]
+        return func
+
+    def _is_subtype(self, nodeid, typeid):
+        hassubtype = ua.NodeId(ua.ObjectIds.HasSubtype)
+        while nodeid != typeid:
+            nodedata = self.aspace.get(nodeid) if self.aspace is not None else None
+            if nodedata is None:
+                return False
+            for ref in nodedata.get_references((hassubtype,), ua.BrowseDirection.Inverse):
+                nodeid = ref.NodeId
+                break
+            else:
+                return False
+        return True
+
+    def _compile_BitwiseAnd(self, first, second):
+        return self._compare(operator.and_, first, second)
+
+    def _compile_BitwiseOr(self, first, second):
+        return self._compare(operator.or_, first, second)
+
+
+def _text(value):
+    if isinstance(value, ua.LocalizedText):
+        return value.Text
+    if isinstance(value, str):
+        return value
+    return None
+
+
+def _like_to_regex(pattern):
+    """
+    translate a Like pattern: % matches any string, _ any character, [] a character
+    out of a list or range and [^] one not in it, \\ escapes the next character
+    """
+    regex = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == "\\" and idx + 1 < len(pattern):
+            regex.append(re.escape(pattern[idx + 1]))
+            idx += 2
+            continue
+        if char == "%":
+            regex.append(".*")
+        elif char == "_":
+            regex.append(".")
+        elif char == "[" and pattern.find("]", idx + 2) != -1:
+            end = pattern.find("]", idx + 2)
+            chars = pattern[idx + 1:end]
+            negate = chars.startswith("^")
+            if negate:
+                chars = chars[1:]
+            regex.append("[" + ("^" if negate else "") + chars.replace("\\", "\\\\") + "]")
+            idx = end + 1
+            continue
+        else:
+            regex.append(re.escape(char))
+        idx += 1
+    return re.compile("".join(regex) + r"\Z", re.DOTALL)
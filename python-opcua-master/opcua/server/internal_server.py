@@ -28,7 +28,9 @@ from my_opcua.server.address_space import MethodService
 from my_opcua.server.subscription_service import SubscriptionService
 from my_opcua.server.discovery_service import LocalDiscoveryService
 from my_opcua.server.standard_address_space import standard_address_space
+from my_opcua.server.snapshot import SnapshotError
 from my_opcua.server.user_manager import UserManager
+from my_opcua.server.uaprocessor import new_service_table, register_service
 #from my_opcua.common import xmlimporter
 
 
@@ -39,7 +41,7 @@ class SessionState(Enum):
 
 class InternalServer(object):
 
-    def __init__(self, shelffile=None, parent=None):
+    def __init__(self, shelffile=None, parent=None, snapshotfile=None):
         self.logger = logging.getLogger(__name__)
 
         self._parent = parent
@@ -56,10 +58,12 @@ class InternalServer(object):
         self.method_service = MethodService(self.aspace)
         self.node_mgt_service = NodeManagementService(self.aspace)
 
-        self.load_standard_address_space(shelffile)
+        self.load_standard_address_space(shelffile, snapshotfile)
 
         self.loop = None
         self.asyncio_transports = []
+        # service table of the connections to this server, see register_service
+        self.services = new_service_table()
         self.subscription_service = SubscriptionService(self.aspace)
 
         self.history_manager = HistoryManager(self)
@@ -99,10 +103,16 @@ class InternalServer(object):
         ns_node = Node(self.isession, ua.NodeId(ua.ObjectIds.Server_NamespaceArray))
         ns_node.set_value(uries)
 
-    def load_standard_address_space(self, shelffile=None):
-        if (shelffile is not None) and (os.path.isfile(shelffile) or os.path.isfile(shelffile+".db")):
-            # import address space from shelf
-            self.aspace.load_aspace_shelf(shelffile)
+    def load_standard_address_space(self, shelffile=None, snapshotfile=None):
+        """
+        Load the standard address space from shelffile or snapshotfile if they exist,
+        otherwise build it and write shelffile or snapshotfile for next start up.
+        Without any file, it is built from the generated code at every start up
+        """
+        if shelffile is not None and self._load_node_store(shelffile):
+            pass
+        elif shelffile is None and snapshotfile is not None and self._load_snapshot(snapshotfile):
+            pass
         else:
             # import address space from code generated from xml
             standard_address_space.fill_address_space(self.node_mgt_service)
@@ -110,9 +120,33 @@ class InternalServer(object):
             # importer = xmlimporter.XmlImporter(self.node_mgt_service)
             # importer.import_xml("/path/to/python-opcua/schemas/Opc.Ua.NodeSet2.xml", self)
 
-            # if a cache file was supplied a shelve of the standard address space can now be built for next start up
+            # if a cache file was supplied a node store of the standard address space can now be built for next start up
             if shelffile:
                 self.aspace.make_aspace_shelf(shelffile)
+                self.aspace.load_aspace_shelf(shelffile)
+            elif snapshotfile:
+                self.aspace.make_snapshot(snapshotfile, standard_address_space.schema_hash())
+
+    def _load_node_store(self, path):
+        if not os.path.isfile(path):
+            return False
+        try:
+            self.aspace.load_aspace_shelf(path)
+        except (SnapshotError, EnvironmentError) as ex:
+            # for example a shelve file written by previous versions
+            self.logger.warning("Could not load address space from node store %s: %s", path, ex)
+            return False
+        return True
+
+    def _load_snapshot(self, path):
+        if not os.path.isfile(path):
+            return False
+        try:
+            self.aspace.load_snapshot(path, standard_address_space.schema_hash())
+        except (SnapshotError, EnvironmentError) as ex:
+            self.logger.warning("Could not load standard address space from snapshot %s: %s", path, ex)
+            return False
+        return True
 
     def _address_space_fixes(self):
         """
@@ -147,6 +181,12 @@ class InternalServer(object):
         """
         self.aspace.dump(path)
 
+    def sync_address_space(self):
+        """
+        Write changes back to the node store the address space was loaded from, see AddressSpace.sync
+        """
+        self.aspace.sync()
+
     def start(self):
         self.logger.info("starting internal server")
         self.loop = utils.ThreadLoop()
@@ -255,6 +295,25 @@ class InternalServer(object):
         """
         self.aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, datavalue)
 
+    def set_attribute_value_callback(self, nodeid, callback, attr=ua.AttributeIds.Value):
+        """
+        Make reads of the attribute return callback(), see AddressSpace.set_attribute_value_callback
+        """
+        return self.aspace.set_attribute_value_callback(nodeid, attr, callback)
+
+    def register_service(self, typeid, name, handler):
+        """
+        Handle the requests whose encoding id is typeid with handler on this server,
+        see uaprocessor.register_service
+        """
+        return register_service(self.services, typeid, name, handler)
+
+    def service_counters(self):
+        """
+        return a dict of service names and the number of requests this server received
+        """
+        return dict((service.name, service.count) for service in list(self.services.values()))
+
 
 class InternalSession(object):
     _counter = 10
@@ -341,14 +400,17 @@ class InternalSession(object):
     def translate_browsepaths_to_nodeids(self, params):
         return self.iserver.view_service.translate_browsepaths_to_nodeids(params)
 
-    def add_nodes(self, params):
-        return self.iserver.node_mgt_service.add_nodes(params, self.user)
+    def add_nodes(self, params, bulk=False):
+        return self.iserver.node_mgt_service.add_nodes(params, self.user, bulk)
 
     def delete_nodes(self, params):
         return self.iserver.node_mgt_service.delete_nodes(params, self.user)
 
-    def add_references(self, params):
-        return self.iserver.node_mgt_service.add_references(params, self.user)
+    def delete_subtrees(self, params):
+        return self.iserver.node_mgt_service.delete_subtrees(params, self.user)
+
+    def add_references(self, params, bulk=False):
+        return self.iserver.node_mgt_service.add_references(params, self.user, bulk)
 
     def delete_references(self, params):
         return self.iserver.node_mgt_service.delete_references(params, self.user)
@@ -2,12 +2,16 @@
 server side implementation of a subscription object
 """
 
+from collections import deque
 from threading import RLock
+import copy
 import logging
 # import copy
 # import traceback
 
 from my_opcua import ua
+from my_opcua.server.event_filter import compile_where_clause, compile_select_clauses
+from my_opcua.server.change_journal import ChangeReader
 
 
 class MonitoredItemData(object):
@@ -20,7 +24,14 @@ class MonitoredItemData(object):
         self.filter = None
         self.mvalue = MonitoredItemValues()
         self.where_clause_evaluator = None
+        self.select_fields = None
         self.queue_size = 0
+        self.discard_oldest = True
+        self.item_to_monitor = None
+        self.attval = None
+        # (Low, High) of the EURange property for Percent deadband, updated by a datachange callback
+        self.eurange = None
+        self.eurange_handle = None
 
 
 class MonitoredItemValues(object):
@@ -39,6 +50,87 @@ class MonitoredItemValues(object):
     def get_old_value(self):
         return self.old_value
 
+    def discard_current_value(self):
+        """
+        forget a value filtered out by the deadband, which is compared to the last reported value
+        """
+        self.current_value = self.old_value
+
+
+class MonitoredItemQueue(object):
+    """
+    Notifications of a monitored item waiting for the next publish, in a ring buffer of
+    size notifications, unbounded with a size of 0.
+    When the queue is full the oldest notification is discarded, or with discard_oldest False the
+    newest one is replaced. With overflow True, notifications are MonitoredItemNotification and the
+    Overflow bit is set in the StatusCode of the value next to the discarded ones when the queue is
+    drained, except for a queue of size 1
+    """
+
+    # InfoType DataValue and Overflow info bits of a StatusCode
+    overflow_bits = 0x480
+
+    def __init__(self, size, discard_oldest=True, overflow=False):
+        self._overflow = overflow
+        self.overflowed = False
+        self._items = deque()
+        self.resize(size, discard_oldest)
+
+    def resize(self, size, discard_oldest=True):
+        """
+        change the size and discard policy of the queue, queued notifications which
+        do not fit any more are discarded following the new policy
+        """
+        items = list(self._items)
+        if size and len(items) > size:
+            if discard_oldest:
+                items = items[-size:]
+            else:
+                items = items[:size - 1] + items[-1:]
+            self.overflowed = True
+        self.size = size
+        self.discard_oldest = discard_oldest
+        self.overflow = self._overflow and size != 1
+        self._items = deque(items, maxlen=size or None)
+
+    def __len__(self):
+        return len(self._items)
+
+    def append(self, item):
+        items = self._items
+        if not self.size or len(items) < self.size:
+            items.append(item)
+            return
+        if self.discard_oldest:
+            items.append(item)
+        else:
+            items[-1] = item
+        self.overflowed = True
+
+    def drain(self, notifications):
+        """
+        move the queued notifications to the end of the list notifications
+        """
+        items = self._items
+        if self.overflowed and self.overflow:
+            # the oldest one follows the discarded ones, the newest one replaced them
+            index = 0 if self.discard_oldest else -1
+            items[index] = self._set_overflow(items[index])
+        notifications.extend(items)
+        items.clear()
+        self.overflowed = False
+
+    def _set_overflow(self, notification):
+        value = notification.Value
+        if value.StatusCode.value & self.overflow_bits == self.overflow_bits:
+            return notification
+        # the DataValue is shared with the other monitored items of the attribute
+        value = copy.copy(value)
+        value.StatusCode = ua.StatusCode(value.StatusCode.value | self.overflow_bits)
+        notification = copy.copy(notification)
+        notification.Value = value
+        return notification
+
 
 class MonitoredItemService(object):
 
@@ -50,11 +142,15 @@ class MonitoredItemService(object):
         self.logger = logging.getLogger(__name__ + "." + str(isub.data.SubscriptionId))
         self.isub = isub
         self.aspace = aspace
+        self.sampler = isub.subservice.sampler
         self._lock = RLock()
         self._monitored_items = {}
         self._monitored_events = {}
         self._monitored_datachange = {}
         self._monitored_item_counter = 111
+        # monitored item ids by ChangeJournal of the watched attributes, read at the publish tick
+        self._watched = {}
+        self._change_reader = ChangeReader()
 
     def delete_all_monitored_items(self):
         self.delete_monitored_items([mdata.monitored_item_id for mdata in self._monitored_items.values()])
@@ -87,10 +183,27 @@ class MonitoredItemService(object):
                 result = ua.MonitoredItemModifyResult()
                 if mdata.monitored_item_id == params.MonitoredItemId:
                     result.RevisedSamplingInterval = params.RequestedParameters.SamplingInterval
+                    if self.sampler.has_item(mdata.callback_handle):
+                        result.RevisedSamplingInterval = self._revise_sampling_interval(
+                            params.RequestedParameters.SamplingInterval, mdata.item_to_monitor.NodeId)
+                        self.sampler.modify_item(mdata.callback_handle, result.RevisedSamplingInterval)
                     result.RevisedQueueSize = params.RequestedParameters.QueueSize
-                    if params.RequestedParameters.Filter is not None:
-                        mdata.filter = params.RequestedParameters.Filter
+                    flt = params.RequestedParameters.Filter
+                    if flt is not None:
+                        # an invalid filter leaves the item with its previous one
+                        if mdata.where_clause_evaluator is not None:
+                            result.StatusCode = self._compile_event_filter(mdata, flt)
+                        else:
+                            old = mdata.filter
+                            self._release_eurange(mdata)
+                            mdata.filter = flt
+                            result.StatusCode = self._resolve_eurange(mdata)
+                            if not result.StatusCode.is_good():
+                                mdata.filter = old
+                                self._resolve_eurange(mdata)
                     mdata.queue_size = params.RequestedParameters.QueueSize
+                    mdata.discard_oldest = params.RequestedParameters.DiscardOldest
+                    self.isub.resize_queue(mdata.monitored_item_id, mdata.queue_size, mdata.discard_oldest)
                     return result
             result = ua.MonitoredItemModifyResult()
             result.StatusCode(ua.StatusCodes.BadMonitoredItemIdInvalid)
@@ -114,10 +227,22 @@ class MonitoredItemService(object):
         mdata.client_handle = params.RequestedParameters.ClientHandle
         mdata.monitored_item_id = result.MonitoredItemId
         mdata.queue_size = params.RequestedParameters.QueueSize
+        mdata.discard_oldest = params.RequestedParameters.DiscardOldest
         mdata.filter = params.RequestedParameters.Filter
+        mdata.item_to_monitor = params.ItemToMonitor
 
         return result, mdata
 
+    def _revise_sampling_interval(self, requested, nodeid):
+        if requested < 0:
+            # -1 means the publishing interval
+            requested = self.isub.data.RevisedPublishingInterval
+        interval = max(requested, self.sampler.min_sampling_interval)
+        minimum = self.aspace.get_attribute_value(nodeid, ua.AttributeIds.MinimumSamplingInterval)
+        if minimum.StatusCode.is_good() and minimum.Value.Value:
+            interval = max(interval, minimum.Value.Value)
+        return interval
+
     def _create_events_monitored_item(self, params):
         self.logger.info("request to subscribe to events for node %s and attribute %s",
                          params.ItemToMonitor.NodeId,
@@ -131,13 +256,31 @@ class MonitoredItemService(object):
             result.StatusCode = ua.StatusCode(ua.StatusCodes.BadServiceUnsupported)
             return result
         # result.FilterResult = ua.EventFilterResult()  # spec says we can ignore if not error
-        mdata.where_clause_evaluator = WhereClauseEvaluator(self.logger, self.aspace, mdata.filter.WhereClause)
+        result.StatusCode = self._compile_event_filter(mdata, mdata.filter)
+        if not result.StatusCode.is_good():
+            return result
         self._commit_monitored_item(result, mdata)
         if params.ItemToMonitor.NodeId not in self._monitored_events:
             self._monitored_events[params.ItemToMonitor.NodeId] = []
         self._monitored_events[params.ItemToMonitor.NodeId].append(result.MonitoredItemId)
         return result
 
+    def _compile_event_filter(self, mdata, evfilter):
+        """
+        compile evfilter and set it as the filter of mdata, which is left unchanged
+        when evfilter is invalid
+        """
+        try:
+            where_clause_evaluator = WhereClauseEvaluator(self.logger, self.aspace, evfilter.WhereClause)
+            select_fields = compile_select_clauses(evfilter.SelectClauses)
+        except ua.UaStatusCodeError as ex:
+            self.logger.warning("%s: invalid event filter %s: %s", self, evfilter, ex)
+            return ua.StatusCode(ex.code)
+        mdata.filter = evfilter
+        mdata.where_clause_evaluator = where_clause_evaluator
+        mdata.select_fields = select_fields
+        return ua.StatusCode()
+
     def _create_data_change_monitored_item(self, params):
         self.logger.info("request to subscribe to datachange for node %s and attribute %s",
                          params.ItemToMonitor.NodeId,
@@ -145,18 +288,88 @@ class MonitoredItemService(object):
 
         result, mdata = self._make_monitored_item_common(params)
         result.FilterResult = params.RequestedParameters.Filter
-        result.StatusCode, handle = self.aspace.add_datachange_callback(
-            params.ItemToMonitor.NodeId, params.ItemToMonitor.AttributeId, self.datachange_callback)
-
-        self.logger.debug("adding callback return status %s and handle %s", result.StatusCode, handle)
-        mdata.callback_handle = handle
+        result.StatusCode = self._resolve_eurange(mdata)
+        if not result.StatusCode.is_good():
+            return result
+        nodeid = params.ItemToMonitor.NodeId
+        attr = params.ItemToMonitor.AttributeId
+        # the value of an attribute read from a callback is not changed by writes, it is sampled
+        sampled = self.aspace.has_value_callback(nodeid, attr)
+        if sampled:
+            # notified by the sampler only, the handle identifies the item in the sampler
+            handle = mdata.callback_handle = self.aspace.new_datachange_handle()
+        elif self.isub.data.RevisedPublishingInterval <= 0:
+            # without publish tick, changes are pushed to the subscription by the writer
+            result.StatusCode, handle = self.aspace.add_datachange_callback(nodeid, attr, self.datachange_callback)
+            self.logger.debug("adding callback return status %s and handle %s", result.StatusCode, handle)
+            mdata.callback_handle = handle
+        else:
+            result.StatusCode, mdata.attval = self.aspace.watch_attribute(nodeid, attr, self._change_reader)
+        if not result.StatusCode.is_good():
+            self._release_eurange(mdata)
         self._commit_monitored_item(result, mdata)
         if result.StatusCode.is_good():
-            self._monitored_datachange[handle] = result.MonitoredItemId
+            if mdata.attval is not None:
+                self._watched.setdefault(mdata.attval.journal, []).append(result.MonitoredItemId)
+            else:
+                self._monitored_datachange[handle] = result.MonitoredItemId
             # force data change event generation
-            self.trigger_datachange(handle, params.ItemToMonitor.NodeId, params.ItemToMonitor.AttributeId)
+            value = self.aspace.get_attribute_value(nodeid, attr)
+            self._datachange(mdata, value)
+            if sampled:
+                result.RevisedSamplingInterval = self._revise_sampling_interval(
+                    params.RequestedParameters.SamplingInterval, nodeid)
+                self.sampler.add_item(handle, nodeid, attr, result.RevisedSamplingInterval,
+                                      self.datachange_callback, value)
         return result
 
+    def _resolve_eurange(self, mdata):
+        """
+        find the EURange property of the node monitored with a Percent deadband, cache its
+        value in mdata and register a datachange callback to update it when it is written
+        """
+        flt = mdata.filter
+        if getattr(flt, "DeadbandType", None) != ua.DeadbandType.Percent:
+            return ua.StatusCode()
+        if not 0 <= flt.DeadbandValue <= 100:
+            return ua.StatusCode(ua.StatusCodes.BadDeadbandFilterInvalid)
+        nodedata = self.aspace.get(mdata.item_to_monitor.NodeId)
+        if nodedata is None:
+            return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+        for ref in nodedata.get_references_by_name(ua.QualifiedName("EURange", 0)):
+            if ref.IsForward and ref.ReferenceTypeId == ua.NodeId(ua.ObjectIds.HasProperty):
+                break
+        else:
+            self.logger.warning("%s: Percent deadband requested for %s which has no EURange property",
+                                self, mdata.item_to_monitor.NodeId)
+            return ua.StatusCode(ua.StatusCodes.BadMonitoredItemFilterUnsupported)
+
+        def eurange_callback(handle, value, error=None):
+            if error:
+                # the EURange property was deleted, its callback is deleted with it
+                mdata.eurange_handle = None
+                mdata.eurange = None
+            else:
+                self._set_eurange(mdata, value)
+
+        status, mdata.eurange_handle = self.aspace.add_datachange_callback(
+            ref.NodeId, ua.AttributeIds.Value, eurange_callback)
+        if status.is_good():
+            self._set_eurange(mdata, self.aspace.get_attribute_value(ref.NodeId, ua.AttributeIds.Value))
+        return status
+
+    @staticmethod
+    def _set_eurange(mdata, value):
+        eurange = value.Value.Value
+        low, high = getattr(eurange, "Low", None), getattr(eurange, "High", None)
+        mdata.eurange = (low, high) if low is not None and high is not None else None
+
+    def _release_eurange(self, mdata):
+        if mdata.eurange_handle:
+            self.aspace.delete_datachange_callback(mdata.eurange_handle)
+        mdata.eurange_handle = None
+        mdata.eurange = None
+
     def delete_monitored_items(self, ids):
         self.logger.debug("delete monitored items %s", ids)
         with self._lock:
@@ -177,9 +390,18 @@ class MonitoredItemService(object):
         for k, v in self._monitored_datachange.items():
             if v == mid:
                 self.aspace.delete_datachange_callback(k)
+                self.sampler.remove_item(k)
                 self._monitored_datachange.pop(k)
                 break
-        self._monitored_items.pop(mid)
+        mdata = self._monitored_items.pop(mid)
+        self._release_eurange(mdata)
+        if mdata.attval is not None:
+            journal = mdata.attval.journal
+            mids = self._watched[journal]
+            mids.remove(mid)
+            if not mids:
+                del self._watched[journal]
+                self.aspace.unwatch_attribute(mdata.item_to_monitor.NodeId, mdata.attval, self._change_reader)
         return ua.StatusCode()
 
     def datachange_callback(self, handle, value, error=None):
@@ -190,31 +412,57 @@ class MonitoredItemService(object):
         else:
             self.logger.info("subscription %s: datachange callback called with handle '%s' and value '%s'", self,
                              handle, value.Value)
-            event = ua.MonitoredItemNotification()
             with self._lock:
                 mid = self._monitored_datachange[handle]
-                mdata = self._monitored_items[mid]
-                mdata.mvalue.set_current_value(value.Value.Value)
-                if mdata.filter:
-                    deadband_flag_pass = self.deadband_callback(mdata.mvalue, mdata.filter)
-                else:
-                    deadband_flag_pass = True
-                if deadband_flag_pass:
-                    event.ClientHandle = mdata.client_handle
-                    event.Value = value
-                    self.isub.enqueue_datachange_event(mid, event, mdata.queue_size)
-
-    def deadband_callback(self, values, flt):
+                self._datachange(self._monitored_items[mid], value)
+
+    def _datachange(self, mdata, value):
+        mdata.mvalue.set_current_value(value.Value.Value)
+        if mdata.filter and value.StatusCode.is_good():
+            deadband_flag_pass = self.deadband_callback(mdata.mvalue, mdata.filter, mdata.eurange)
+            if not deadband_flag_pass:
+                mdata.mvalue.discard_current_value()
+        else:
+            deadband_flag_pass = True
+        if deadband_flag_pass:
+            event = ua.MonitoredItemNotification()
+            event.ClientHandle = mdata.client_handle
+            event.Value = value
+            self.isub.enqueue_datachange_event(mdata.monitored_item_id, event, mdata.queue_size, mdata.discard_oldest)
+
+    def publish_datachanges(self):
+        """
+        read the changes of watched attributes written since the previous publish tick from
+        their change journals and make their notifications. Changes to the same attribute are
+        coalesced, only the last queue_size values are used (all of them with a queue size of 0)
+        """
+        with self._lock:
+            if not self._watched:
+                return
+            for journal, values, lost in self._change_reader.read():
+                if journal not in self._watched:
+                    continue
+                for mid in self._watched[journal]:
+                    mdata = self._monitored_items[mid]
+                    if lost and (not mdata.queue_size or mdata.queue_size > len(values)):
+                        self.logger.warning("%s: changes were dropped from the change journal of %s",
+                                            self, mdata.item_to_monitor.NodeId)
+                        lost = False
+                    for value in values[-mdata.queue_size:] if mdata.queue_size else values:
+                        self._datachange(mdata, value)
+
+    def deadband_callback(self, values, flt, eurange=None):
         if flt.DeadbandType == ua.DeadbandType.None_ or values.get_old_value() is None:
             return True
-        elif flt.DeadbandType == ua.DeadbandType.Absolute and \
-                ((abs(values.get_current_value() - values.get_old_value())) > flt.DeadbandValue):
-            return True
+        elif flt.DeadbandType == ua.DeadbandType.Absolute:
+            deadband = flt.DeadbandValue
         elif flt.DeadbandType == ua.DeadbandType.Percent:
-            self.logger.warn("DeadbandType Percent is not implemented !")
-            return True
+            if eurange is None:
+                return True
+            deadband = flt.DeadbandValue / 100.0 * (eurange[1] - eurange[0])
         else:
-            return False
+            return True
+        return _exceeds_deadband(values.get_old_value(), values.get_current_value(), deadband)
 
     def trigger_event(self, event):
         with self._lock:
@@ -239,13 +487,28 @@ class MonitoredItemService(object):
             return
         fieldlist = ua.EventFieldList()
         fieldlist.ClientHandle = mdata.client_handle
-        fieldlist.EventFields = event.to_event_fields(mdata.filter.SelectClauses)
-        self.isub.enqueue_event(mid, fieldlist, mdata.queue_size)
+        fieldlist.EventFields = mdata.select_fields(event)
+        self.isub.enqueue_event(mid, fieldlist, mdata.queue_size, mdata.discard_oldest)
 
     def trigger_statuschange(self, code):
         self.isub.enqueue_statuschange(code)
 
 
+def _exceeds_deadband(old, new, deadband):
+    """
+    compare numbers, and arrays element by element; arrays of a different size and
+    values which are not numbers are compared for equality
+    """
+    if isinstance(new, (list, tuple)):
+        if not isinstance(old, (list, tuple)) or len(old) != len(new):
+            return True
+        return any(_exceeds_deadband(o, n, deadband) for o, n in zip(old, new))
+    try:
+        return abs(new - old) > deadband
+    except TypeError:
+        return new != old
+
+
 class InternalSubscription(object):
 
     def __init__(self, subservice, data, addressspace, callback):
@@ -256,6 +519,7 @@ class InternalSubscription(object):
         self.callback = callback
         self.monitored_item_srv = MonitoredItemService(self, addressspace)
         self.task = None
+        self._timer = None
         self._lock = RLock()
         self._triggered_datachanges = {}
         self._triggered_events = {}
@@ -278,6 +542,8 @@ class InternalSubscription(object):
     def stop(self):
         self.logger.debug("stopping subscription %s", self.data.SubscriptionId)
         self._stopev = True
+        if self._timer is not None:
+            self._timer.cancel()
         self.monitored_item_srv.delete_all_monitored_items()
 
     def _trigger_publish(self):
@@ -286,7 +552,7 @@ class InternalSubscription(object):
 
     def _subscription_loop(self):
         if not self._stopev:
-            self.subservice.loop.call_later(self.data.RevisedPublishingInterval / 1000.0, self._sub_loop)
+            self._timer = self.subservice.wheel.call_later(self.data.RevisedPublishingInterval, self._sub_loop)
 
     def _sub_loop(self):
         if self._stopev:
@@ -312,6 +578,7 @@ class InternalSubscription(object):
             # FIXME this will never be send since we do not have publish request anyway
             self.monitored_item_srv.trigger_statuschange(ua.StatusCode(ua.StatusCodes.BadTimeout))
             self._stopev = True
+        self.monitored_item_srv.publish_datachanges()
         result = None
         with self._lock:
             if self.has_published_results():
@@ -340,7 +607,8 @@ class InternalSubscription(object):
     def _pop_triggered_datachanges(self, result):
         if self._triggered_datachanges:
             notif = ua.DataChangeNotification()
-            notif.MonitoredItems = [item for sublist in self._triggered_datachanges.values() for item in sublist]
+            for queue in self._triggered_datachanges.values():
+                queue.drain(notif.MonitoredItems)
             self._triggered_datachanges = {}
             self.logger.debug("sending datachanges notification with %s events", len(notif.MonitoredItems))
             result.NotificationMessage.NotificationData.append(notif)
@@ -348,7 +616,8 @@ class InternalSubscription(object):
     def _pop_triggered_events(self, result):
         if self._triggered_events:
             notif = ua.EventNotificationList()
-            notif.Events = [item for sublist in self._triggered_events.values() for item in sublist]
+            for queue in self._triggered_events.values():
+                queue.drain(notif.Events)
             self._triggered_events = {}
             result.NotificationMessage.NotificationData.append(notif)
             self.logger.debug("sending event notification with %s events", len(notif.Events))
@@ -378,110 +647,52 @@ class InternalSubscription(object):
                 self.logger.info("Error request to re-published non existing ack %s in subscription %s", nb, self)
                 return ua.NotificationMessage()
 
-    def enqueue_datachange_event(self, mid, eventdata, maxsize):
-        self._enqueue_event(mid, eventdata, maxsize, self._triggered_datachanges)
+    def enqueue_datachange_event(self, mid, eventdata, maxsize, discard_oldest=True):
+        self._enqueue_event(mid, eventdata, maxsize, discard_oldest, self._triggered_datachanges, True)
+
+    def enqueue_event(self, mid, eventdata, maxsize, discard_oldest=True):
+        self._enqueue_event(mid, eventdata, maxsize, discard_oldest, self._triggered_events, False)
 
-    def enqueue_event(self, mid, eventdata, maxsize):
-        self._enqueue_event(mid, eventdata, maxsize, self._triggered_events)
+    def resize_queue(self, mid, size, discard_oldest=True):
+        """
+        apply a modified queue size and discard policy to the notifications
+        of monitored item mid waiting for the next publish
+        """
+        with self._lock:
+            for queues in (self._triggered_datachanges, self._triggered_events):
+                if mid in queues:
+                    queues[mid].resize(size, discard_oldest)
 
     def enqueue_statuschange(self, code):
         self._triggered_statuschanges.append(code)
         self._trigger_publish()
 
-    def _enqueue_event(self, mid, eventdata, size, queue):
+    def _enqueue_event(self, mid, eventdata, size, discard_oldest, queues, overflow):
         with self._lock:
-            if mid not in queue:
-                queue[mid] = [eventdata]
+            if mid not in queues:
+                queues[mid] = MonitoredItemQueue(size, discard_oldest, overflow)
+                queues[mid].append(eventdata)
                 self._trigger_publish()
                 return
-            if size != 0:
-                if len(queue[mid]) >= size:
-                    queue[mid].pop(0)
-            queue[mid].append(eventdata)
+            queues[mid].append(eventdata)
 
 
 class WhereClauseEvaluator(object):
+    """
+    Tell whether events match a WhereClause, which is compiled once into a predicate,
+    see compile_where_clause
+    """
+
     def __init__(self, logger, aspace, whereclause):
         self.logger = logger
         self.elements = whereclause.Elements
         self._aspace = aspace
+        self._predicate = compile_where_clause(whereclause, aspace)
 
     def eval(self, event):
-        if not self.elements:
-            return True
-        # spec says we should only evaluate first element, which may use other elements
         try:
-            res = self._eval_el(0, event)
+            return self._predicate(event)
         except Exception as ex:
             self.logger.exception("Exception while evaluating WhereClause %s for event %s: %s",
                                   self.elements, event, ex)
             return False
-        return res
-
-    def _eval_el(self, index, event):
-        el = self.elements[index]
-        # ops = [self._eval_op(op, event) for op in el.FilterOperands]
-        ops = el.FilterOperands  # just to make code more readable
-        if el.FilterOperator == ua.FilterOperator.Equals:
-            return self._eval_op(ops[0], event) == self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.IsNull:
-            return self._eval_op(ops[0], event) is None  # FIXME: might be too strict
-        elif el.FilterOperator == ua.FilterOperator.GreaterThan:
-            return self._eval_op(ops[0], event) > self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.LessThan:
-            return self._eval_op(ops[0], event) < self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.GreaterThanOrEqual:
-            return self._eval_op(ops[0], event) >= self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.LessThanOrEqual:
-            return self._eval_op(ops[0], event) <= self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.Like:
-            return self._likeoperator(self._eval_op(ops[0], event), self._eval_el(ops[1], event))
-        elif el.FilterOperator == ua.FilterOperator.Not:
-            return not self._eval_op(ops[0], event)
-        elif el.FilterOperator == ua.FilterOperator.Between:
-            return self._eval_el(ops[2], event) >= self._eval_op(ops[0], event) >= self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.InList:
-            return self._eval_op(ops[0], event) in [self._eval_op(op, event) for op in ops[1:]]
-        elif el.FilterOperator == ua.FilterOperator.And:
-            self.elements(ops[0].Index)
-            return self._eval_op(ops[0], event) and self._eval_op(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.Or:
-            return self._eval_op(ops[0], event) or self._eval_el(ops[1], event)
-        elif el.FilterOperator == ua.FilterOperator.Cast:
-            self.logger.warn("Cast operand not implemented, assuming True")
-            return True
-        elif el.FilterOperator == ua.FilterOperator.OfType:
-            return event.EventType == self._eval_op(ops[0], event)
-        else:
-            # TODO: implement missing operators
-            self.logger.warning("WhereClause not implemented for element: %s", el)
-            raise NotImplementedError
-
-    def _like_operator(self, string, pattern):
-        raise NotImplementedError
-
-    def _eval_op(self, op, event):
-        # seems spec says we should return Null if issues
-        if type(op) is ua.ElementOperand:
-            return self._eval_el(op.Index, event)
-        elif type(op) is ua.AttributeOperand:
-            if op.BrowsePath:
-                return getattr(event, op.BrowsePath.Elements[0].TargetName.Name)
-            else:
-                return self._aspace.get_attribute_value(event.EventType, op.AttributeId).Value.Value
-            # FIXME: check, this is probably broken
-        elif type(op) is ua.SimpleAttributeOperand:
-            if op.BrowsePath:
-                # we only support depth of 1
-                return getattr(event, op.BrowsePath[0].Name)
-            else:
-                # TODO: write code for index range.... but doe it make any sense
-                return self._aspace.get_attribute_value(event.EventType, op.AttributeId).Value.Value
-        elif type(op) is ua.LiteralOperand:
-            return op.Value.Value
-        else:
-            self.logger.warning("Where clause element % is not of a known type", op)
-            raise NotImplementedError
-
-
-
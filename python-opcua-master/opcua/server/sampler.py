@@ -0,0 +1,151 @@
+"""
+server side sampling of monitored items whose value comes from a callback
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+import logging
+
+
+class _SampledItem(object):
+
+    def __init__(self, handle, nodeid, attr, callback, value):
+        self.handle = handle
+        self.nodeid = nodeid
+        self.attr = attr
+        self.callback = callback
+        self.value = value
+
+
+class _SamplingGroup(object):
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.items = {}
+        self.timer = None
+        # a sampling of the group is running in the executor
+        self.busy = False
+
+
+class Sampler(object):
+    """
+    Sample monitored items at their sampling interval and call their callback
+    with the new DataValue when it differs from the previous sample.
+    Items with the same sampling interval share one timer of the timing wheel,
+    and at each tick an attribute monitored by several items is read only once.
+    Value callbacks may block, so attributes are read in an executor and the
+    item callbacks are called back on the loop; a tick is skipped while the
+    previous sampling of its group is still reading
+    """
+
+    # fastest sampling interval in milliseconds, a requested interval of 0 is revised to this one
+    min_sampling_interval = 10
+    # threads reading the sampled attributes
+    max_workers = 4
+
+    def __init__(self, aspace, wheel):
+        self.logger = logging.getLogger(__name__)
+        self.aspace = aspace
+        self.wheel = wheel
+        self._lock = RLock()
+        self._groups = {}
+        self._handle_to_interval = {}
+        self._executor = None
+
+    def add_item(self, handle, nodeid, attr, interval, callback, value=None):
+        """
+        sample attribute attr of nodeid every interval ms, callback(handle, datavalue) is
+        called with each sample different from the previous one, starting with value
+        """
+        item = _SampledItem(handle, nodeid, attr, callback, value)
+        with self._lock:
+            group = self._groups.get(interval)
+            if group is None:
+                group = self._groups[interval] = _SamplingGroup(interval)
+                group.timer = self.wheel.call_later(interval, lambda: self._tick(group))
+            group.items[handle] = item
+            self._handle_to_interval[handle] = interval
+
+    def remove_item(self, handle):
+        with self._lock:
+            interval = self._handle_to_interval.pop(handle, None)
+            if interval is None:
+                return None
+            group = self._groups[interval]
+            item = group.items.pop(handle)
+            if not group.items:
+                group.timer.cancel()
+                del self._groups[interval]
+            return item
+
+    def modify_item(self, handle, interval):
+        with self._lock:
+            item = self.remove_item(handle)
+            if item is not None:
+                self.add_item(handle, item.nodeid, item.attr, interval, item.callback, item.value)
+
+    def has_item(self, handle):
+        with self._lock:
+            return handle in self._handle_to_interval
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _tick(self, group):
+        with self._lock:
+            if self._groups.get(group.interval) is not group:
+                return
+            group.timer = self.wheel.call_later(group.interval, lambda: self._tick(group))
+            if group.busy:
+                self.logger.debug("sampling at %s ms is late, skipping a tick", group.interval)
+                return
+            group.busy = True
+            items = list(group.items.values())
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+            self._executor.submit(self._sample_group, group, items)
+
+    def _sample_group(self, group, items):
+        try:
+            values = self.read(items)
+            loop = self.wheel.loop
+            if loop is not None:
+                loop.call_soon(lambda: self.notify(items, values))
+        finally:
+            group.busy = False
+
+    def read(self, items):
+        """
+        read the attributes of items, once per attribute, return the DataValues by
+        (nodeid, attr), None for the attributes which could not be read
+        """
+        values = {}
+        for item in items:
+            key = (item.nodeid, item.attr)
+            if key not in values:
+                try:
+                    values[key] = self.aspace.get_attribute_value(item.nodeid, item.attr)
+                except Exception as ex:
+                    self.logger.exception("Error sampling %s, %s: %s", item.nodeid, item.attr, ex)
+                    values[key] = None
+        return values
+
+    def notify(self, items, values):
+        """
+        call the callbacks of the items whose value in values changed
+        """
+        for item in items:
+            value = values[(item.nodeid, item.attr)]
+            if value is None or not self.has_item(item.handle):
+                continue
+            old = item.value
+            if old is not None and old.Value == value.Value and old.StatusCode == value.StatusCode:
+                continue
+            item.value = value
+            try:
+                item.callback(item.handle, value)
+            except Exception as ex:
+                self.logger.exception("Error calling sampling callback for %s, %s: %s", item.nodeid, item.attr, ex)
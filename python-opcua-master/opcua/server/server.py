@@ -59,6 +59,14 @@ class Server(object):
     cache file or the file will be created if it does not exist yet.
     As a result the first startup will be even slower due to the cache file
     generation but all further start ups will be significantly faster.
+    Nodes are decoded from the cache file when first accessed. Added and modified
+    nodes, for example a large user namespace, are written back to the file by
+    iserver.sync_address_space() and then loaded from it at next start up.
+    snapshotfile works the same way with a memory mapped snapshot file, nodes
+    then being decoded when first accessed. It is rebuilt when it was made by
+    another version of the library or from another standard address space.
+    No snapshot is shipped with the library: for fast start ups, pass a
+    snapshotfile in a writable location, e.g. Server(snapshotfile="/var/lib/myserver/aspace.snapshot")
 
     :ivar product_uri:
     :vartype product_uri: uri
@@ -75,7 +83,7 @@ class Server(object):
 
     """
 
-    def __init__(self, shelffile=None, iserver=None):
+    def __init__(self, shelffile=None, iserver=None, snapshotfile=None):
         self.logger = logging.getLogger(__name__)
         self.endpoint = urlparse("opc.tcp://0.0.0.0:4840/freeopcua/server/")
         self._application_uri = "urn:freeopcua:python:server"
@@ -87,8 +95,9 @@ class Server(object):
         if iserver is not None:
             self.iserver = iserver
         else:
-            self.iserver = InternalServer(shelffile = shelffile, parent = self)
+            self.iserver = InternalServer(shelffile = shelffile, parent = self, snapshotfile = snapshotfile)
         self.bserver = None
+        self._max_message_size = None
         self._policies = []
         self.nodes = Shortcuts(self.iserver.isession)
 
@@ -298,6 +307,14 @@ class Server(object):
     def set_server_name(self, name):
         self.name = name
 
+    def set_max_message_size(self, size):
+        """
+        set maximum size of message chunks accepted from clients,
+        headers announcing larger chunks are rejected before their
+        body is received
+        """
+        self._max_message_size = size
+
     def start(self):
         """
         Start to listen on network
@@ -308,6 +325,8 @@ class Server(object):
             if not self.bserver:
                 self.bserver = BinaryServer(self.iserver, self.endpoint.hostname, self.endpoint.port)
             self.bserver.set_policies(self._policies)
+            if self._max_message_size is not None:
+                self.bserver.set_max_message_size(self._max_message_size)
             self.bserver.set_loop(self.iserver.loop)
             self.bserver.start()
         except Exception as exp:
@@ -467,8 +486,7 @@ class Server(object):
         Export defined nodes to xml
         """
         exp = XmlExporter(self)
-        exp.build_etree(nodes)
-        return exp.write_xml(path)
+        return exp.export_xml(nodes, path)
 
     def export_xml_by_ns(self, path, namespaces=None):
         """
@@ -579,3 +597,11 @@ class Server(object):
         so it is a little faster
         """
         return self.iserver.set_attribute_value(nodeid, datavalue, attr)
+
+    def set_attribute_value_callback(self, nodeid, callback, attr=ua.AttributeIds.Value):
+        """
+        Read the value of the attribute from a python callback instead of the address space.
+        callback takes no argument and returns a DataValue. Subscriptions sample the
+        callback at the sampling interval of their monitored items
+        """
+        return self.iserver.set_attribute_value_callback(nodeid, callback, attr)
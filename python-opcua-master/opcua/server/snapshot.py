@@ -0,0 +1,264 @@
+"""
+Binary snapshot of address space nodes, typically of the standard address space,
+to avoid building it node by node at each server start.
+
+A snapshot file is made of a header, one pickled NodeData record per node
+and an index of records. It is memory mapped when loaded and nodes are only
+unpickled when accessed for the first time.
+NodeStore writes changes back to the file by appending records and a new
+index, the header always pointing to the last complete index, and rewrites
+the file when replaced records take more room than the live ones
+"""
+import mmap
+import os
+import struct
+import threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+from my_opcua.ua.uaerrors import UaError
+
+
+# to be increased when NodeData or the pickled ua classes change
+SNAPSHOT_VERSION = 1
+
+_MAGIC = b"PYOPCUAS"
+# magic, snapshot version, pickle protocol, schema hash, index offset, index size
+_header = struct.Struct("<8sHH20sQQ")
+
+
+class SnapshotError(UaError):
+    pass
+
+
+def _replace(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:  # Python 2, rename does not overwrite dst on Windows
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def write_snapshot(nodes, path, schema=b""):
+    """
+    write nodes, a mapping of NodeId to NodeData, to a snapshot file.
+    schema identifies where nodes come from, for example a hash of the
+    standard address space definition, it is at most 20 bytes
+    """
+    index = {}
+    with open(path, "wb") as f:
+        f.write(b"\0" * _header.size)
+        _write_records(f, ((nodeid, _dump(ndata)) for nodeid, ndata in nodes.items()), index)
+        _write_index(f, index, schema)
+
+
+def _dump(ndata):
+    call = ndata.call
+    ndata.call = None  # method callbacks cannot be serialized
+    try:
+        return pickle.dumps(ndata, pickle.HIGHEST_PROTOCOL)
+    finally:
+        ndata.call = call
+
+
+def _write_records(f, records, index):
+    """
+    append (NodeId, pickled NodeData) records to f, updating index
+    """
+    f.seek(0, os.SEEK_END)
+    offset = f.tell()
+    for nodeid, record in records:
+        f.write(record)
+        index[nodeid] = (offset, len(record))
+        offset += len(record)
+
+
+def _write_index(f, index, schema):
+    """
+    append index to f then point the header to it
+    """
+    f.seek(0, os.SEEK_END)
+    offset = f.tell()
+    data = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+    f.write(data)
+    f.flush()
+    f.seek(0)
+    f.write(_header.pack(_MAGIC, SNAPSHOT_VERSION, pickle.HIGHEST_PROTOCOL, schema, offset, len(data)))
+    f.flush()
+
+
+class SnapshotNodes(MutableMapping):
+    """
+    Mapping of NodeId to NodeData backed by a snapshot file.
+    Nodes are unpickled from the memory mapped file when first accessed and
+    then kept in memory, together with added nodes. The file is never written,
+    changes only live in memory
+    """
+
+    def __init__(self, path, schema=None):
+        self._path = path
+        self._map()
+        try:
+            self._index = self._read_index(schema)
+        except Exception:
+            self._mmap.close()
+            raise
+        self._cache = {}
+        self._deleted = set()
+        self._lock = threading.RLock()
+
+    def _map(self):
+        # a previous map is not closed, another thread may still be reading from it
+        with open(self._path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_index(self, schema):
+        if len(self._mmap) < _header.size:
+            raise SnapshotError("File is too small to be a snapshot")
+        magic, version, protocol, fileschema, offset, size = _header.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise SnapshotError("File is not a snapshot")
+        if version != SNAPSHOT_VERSION or protocol > pickle.HIGHEST_PROTOCOL:
+            raise SnapshotError("Snapshot version {0} with pickle protocol {1} is not supported".format(
+                version, protocol))
+        if schema is not None and fileschema != schema.ljust(20, b"\0"):
+            raise SnapshotError("Snapshot was made from another schema")
+        self._schema = fileschema.rstrip(b"\0")
+        return pickle.loads(self._mmap[offset:offset + size])
+
+    def _load(self, nodeid):
+        offset, size = self._index[nodeid]
+        ndata = pickle.loads(self._mmap[offset:offset + size])
+        # another thread may have loaded the node in between
+        return self._cache.setdefault(nodeid, ndata)
+
+    def __getitem__(self, nodeid):
+        try:
+            return self._cache[nodeid]
+        except KeyError:
+            if nodeid in self._deleted:
+                raise
+        return self._load(nodeid)
+
+    def get(self, nodeid, default=None):
+        ndata = self._cache.get(nodeid, None)
+        if ndata is not None:
+            return ndata
+        if nodeid not in self._index or nodeid in self._deleted:
+            return default
+        return self._load(nodeid)
+
+    def __setitem__(self, nodeid, ndata):
+        with self._lock:
+            self._cache[nodeid] = ndata
+            self._deleted.discard(nodeid)
+
+    def __delitem__(self, nodeid):
+        with self._lock:
+            if nodeid in self._deleted or (nodeid not in self._cache and nodeid not in self._index):
+                raise KeyError(nodeid)
+            self._cache.pop(nodeid, None)
+            if nodeid in self._index:
+                self._deleted.add(nodeid)
+
+    def __contains__(self, nodeid):
+        if nodeid in self._cache:
+            return True
+        return nodeid in self._index and nodeid not in self._deleted
+
+    def __iter__(self):
+        for nodeid in list(self._cache):
+            yield nodeid
+        for nodeid in self._index:
+            if nodeid not in self._cache and nodeid not in self._deleted:
+                yield nodeid
+
+    def __len__(self):
+        return len(self._cache) + sum(1 for nodeid in self._index
+                                      if nodeid not in self._cache and nodeid not in self._deleted)
+
+
+class NodeStore(SnapshotNodes):
+    """
+    SnapshotNodes which can be written back to its file.
+    The file is created if it does not exist. sync() appends the nodes
+    accessed or added since the store was opened whose record changed, and a
+    new index; untouched nodes are never decoded nor written.
+    compact() rewrites the file without the records replaced since, sync()
+    calls it when they take more than compact_ratio times the live records
+    """
+
+    compact_ratio = 1.0
+
+    def __init__(self, path, schema=None):
+        if not os.path.isfile(path):
+            write_snapshot({}, path, schema or b"")
+        SnapshotNodes.__init__(self, path, schema)
+
+    def sync(self):
+        """
+        write nodes in memory and deletions to file
+        """
+        with self._lock:
+            records = []
+            for nodeid, ndata in list(self._cache.items()):
+                record = _dump(ndata)
+                if nodeid in self._index:
+                    start, size = self._index[nodeid]
+                    if size == len(record) and self._mmap[start:start + size] == record:
+                        continue
+                records.append((nodeid, record))
+            if not records and not self._deleted:
+                return
+            index = dict(self._index)
+            for nodeid in self._deleted:
+                index.pop(nodeid, None)
+            with open(self._path, "r+b") as f:
+                _write_records(f, records, index)
+                index_offset = f.tell()
+                _write_index(f, index, self._schema)
+            self._index = index
+            self._deleted = set()
+            self._map()
+            live = sum(size for _, size in index.values())
+            if index_offset - _header.size - live > self.compact_ratio * live:
+                self.compact()
+
+    def compact(self):
+        """
+        write nodes to a new file replacing the current one, dropping
+        records which were written again or deleted
+        """
+        with self._lock:
+            tmppath = self._path + ".tmp"
+            index = {}
+            with open(tmppath, "wb") as f:
+                f.write(b"\0" * _header.size)
+                _write_records(f, [(nodeid, _dump(ndata)) for nodeid, ndata in list(self._cache.items())], index)
+                offset = f.tell()
+                for nodeid, (start, size) in self._index.items():
+                    if nodeid in self._cache or nodeid in self._deleted:
+                        continue
+                    # untouched records are copied without decoding them
+                    f.write(self._mmap[start:start + size])
+                    index[nodeid] = (offset, size)
+                    offset += size
+                _write_index(f, index, self._schema)
+            _replace(tmppath, self._path)
+            self._index = index
+            self._deleted = set()
+            self._map()
+
+    def close(self):
+        """
+        write changes to file and release it
+        """
+        self.sync()
+        self._mmap.close()
@@ -1,16 +1,26 @@
 
+import hashlib
+import importlib
 import os.path
 
 import my_opcua as opcua
 
-from my_opcua.server.standard_address_space.standard_address_space_part3 import create_standard_address_space_Part3
-from my_opcua.server.standard_address_space.standard_address_space_part4 import create_standard_address_space_Part4
-from my_opcua.server.standard_address_space.standard_address_space_part5 import create_standard_address_space_Part5
-from my_opcua.server.standard_address_space.standard_address_space_part8 import create_standard_address_space_Part8
-from my_opcua.server.standard_address_space.standard_address_space_part9 import create_standard_address_space_Part9
-from my_opcua.server.standard_address_space.standard_address_space_part10 import create_standard_address_space_Part10
-from my_opcua.server.standard_address_space.standard_address_space_part11 import create_standard_address_space_Part11
-from my_opcua.server.standard_address_space.standard_address_space_part13 import create_standard_address_space_Part13
+_DIR = os.path.dirname(os.path.abspath(__file__))
+# generated modules, imported only when the address space is built from them
+_PARTS = (3, 4, 5, 8, 9, 10, 11, 13)
+
+
+def schema_hash():
+    """
+    return a sha1 of the generated standard address space code, identifying
+    the NodeSet2 XML files it was generated from
+    """
+    sha = hashlib.sha1()
+    for part in _PARTS:
+        with open(os.path.join(_DIR, "standard_address_space_part{0}.py".format(part)), "rb") as f:
+            sha.update(f.read())
+    return sha.digest()
+
 
 class PostponeReferences(object):
     def __init__(self, server):
@@ -40,11 +50,6 @@ class PostponeReferences(object):
 
 def fill_address_space(nodeservice):
     with PostponeReferences(nodeservice) as server:
-        create_standard_address_space_Part3(server)
-        create_standard_address_space_Part4(server)
-        create_standard_address_space_Part5(server)
-        create_standard_address_space_Part8(server)
-        create_standard_address_space_Part9(server)
-        create_standard_address_space_Part10(server)
-        create_standard_address_space_Part11(server)
-        create_standard_address_space_Part13(server)
+        for part in _PARTS:
+            module = importlib.import_module("my_opcua.server.standard_address_space.standard_address_space_part{0}".format(part))
+            getattr(module, "create_standard_address_space_Part{0}".format(part))(server)
@@ -8,6 +8,8 @@ import logging
 from my_opcua import ua
 from my_opcua.common import utils
 from my_opcua.server.internal_subscription import InternalSubscription
+from my_opcua.server.sampler import Sampler
+from my_opcua.server.timing_wheel import TimingWheel
 
 
 class SubscriptionService(object):
@@ -16,12 +18,18 @@ class SubscriptionService(object):
         self.logger = logging.getLogger(__name__)
         self.loop = None
         self.aspace = aspace
+        # publish cycles of subscriptions and sampling of monitored items are timers of the wheel
+        self.wheel = TimingWheel()
+        self.sampler = Sampler(aspace, self.wheel)
         self.subscriptions = {}
         self._sub_id_counter = 77
         self._lock = RLock()
 
     def set_loop(self, loop):
         self.loop = loop
+        self.wheel.set_loop(loop)
+        if loop is None:
+            self.sampler.stop()
 
     def create_subscription(self, params, callback):
         self.logger.info("create subscription with callback: %s", callback)
@@ -0,0 +1,172 @@
+"""
+hierarchical timing wheel running the periodic work of subscriptions on the server loop
+"""
+
+from threading import Lock
+import logging
+import math
+import time
+
+# wall-clock time jumps when the clock is set, e.g. at NTP sync on devices without RTC
+_monotonic = getattr(time, "monotonic", time.time)
+
+
+class Timer(object):
+    """
+    callback scheduled in a TimingWheel, see TimingWheel.call_later
+    """
+    __slots__ = ("expires", "callback", "cancelled", "_wheel")
+
+    def __init__(self, wheel, expires, callback):
+        self._wheel = wheel
+        self.expires = expires
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self._wheel._cancel(self)
+
+
+class TimingWheel(object):
+    """
+    Run callbacks after a delay, with a resolution of resolution ms; delays are rounded up
+    to a whole number of ticks.
+    The wheel ticks once per resolution step while timers are pending and runs all the
+    callbacks due at that tick; scheduling and cancelling a timer is O(1)
+    whatever the number of pending timers.
+    Level 0 has one slot per tick, each slot of level n covers a whole turn of level n-1,
+    timers are moved down a level when their slot of the upper level comes up
+    """
+
+    def __init__(self, resolution=10, slots=64, levels=4):
+        self.logger = logging.getLogger(__name__)
+        self.resolution = resolution
+        self._step = resolution / 1000.0
+        self._slots = slots
+        self._levels = levels
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._lock = Lock()
+        self._start = _monotonic()
+        self._tick = 0
+        self._pending = 0
+        self._running = False
+        self.loop = None
+
+    def set_loop(self, loop):
+        with self._lock:
+            if loop is self.loop:
+                return
+            self.loop = loop
+            self._running = False
+            if loop is not None and self._pending:
+                self._run_later()
+
+    def call_later(self, delay, callback):
+        """
+        call callback on the loop after delay ms, rounded up to the resolution.
+        Callbacks run by the wheel which call it again with the same delay are
+        called periodically without drift
+        """
+        with self._lock:
+            if not self._pending and not self._running:
+                # an idle wheel does not tick, jump to the current tick
+                self._tick = self._current_tick()
+            ticks = max(1, int(math.ceil(delay / float(self.resolution))))
+            timer = Timer(self, self._tick + ticks, callback)
+            self._insert(timer)
+            self._pending += 1
+            if not self._running and self.loop is not None:
+                self._run_later()
+            return timer
+
+    def _cancel(self, timer):
+        with self._lock:
+            if not timer.cancelled:
+                timer.cancelled = True
+                self._pending -= 1
+
+    def _current_tick(self):
+        return int((_monotonic() - self._start) / self._step)
+
+    def _insert(self, timer):
+        # timers beyond the last level are put in its farthest slot and inserted again from there
+        expires = min(timer.expires, self._tick + self._slots ** self._levels - 1)
+        delta = expires - self._tick
+        width = 1  # ticks covered by a slot of the level
+        for level in range(self._levels):
+            if delta < width * self._slots:
+                self._wheels[level][(expires // width) % self._slots].append(timer)
+                return
+            width *= self._slots
+
+    def _advance(self, due):
+        """
+        move to the next tick and add the timers which expire at that tick to due
+        """
+        self._tick += 1
+        tick = self._tick
+        span = self._slots
+        for level in range(1, self._levels):
+            if tick % span:
+                break
+            slot = self._wheels[level][(tick // span) % self._slots]
+            self._wheels[level][(tick // span) % self._slots] = []
+            for timer in slot:
+                if not timer.cancelled:
+                    self._insert(timer)
+            span *= self._slots
+        slot = self._wheels[0][tick % self._slots]
+        if slot:
+            self._wheels[0][tick % self._slots] = []
+            for timer in slot:
+                if timer.cancelled:
+                    continue
+                if timer.expires > tick:
+                    self._insert(timer)
+                    continue
+                timer.cancelled = True
+                self._pending -= 1
+                due.append(timer)
+
+    def _skip(self, tick):
+        """
+        move to tick without running the ticks in between, timers due meanwhile expire at tick
+        """
+        timers = [timer for wheel in self._wheels for slot in wheel for timer in slot if not timer.cancelled]
+        self._wheels = [[[] for _ in range(self._slots)] for _ in range(self._levels)]
+        self._tick = tick - 1
+        for timer in timers:
+            timer.expires = max(timer.expires, tick)
+            self._insert(timer)
+
+    def _run_later(self):
+        self._running = True
+        loop = self.loop
+        loop.call_soon(lambda: self._run(loop))
+
+    def _run(self, loop):
+        target = self._current_tick()
+        while True:
+            due = []
+            with self._lock:
+                if loop is not self.loop:
+                    return
+                if self._tick >= target:
+                    if not self._pending:
+                        self._running = False
+                        return
+                    delay = max(0.0, self._start + (self._tick + 1) * self._step - _monotonic())
+                    break
+                if target - self._tick > self._slots:
+                    # the loop was held up for more than a turn, do not replay every missed tick
+                    self.logger.warning("timing wheel is %s ticks late, skipping them", target - self._tick)
+                    self._skip(target)
+                self._advance(due)
+            # callbacks run at the tick they are due, so rescheduling from them does not drift
+            for timer in due:
+                try:
+                    timer.callback()
+                except Exception as ex:
+                    self.logger.exception("Error in timer callback %s: %s", timer.callback, ex)
+        # already on the loop thread, no need for the thread safe ThreadLoop.call_later
+        loop.loop.call_later(delay, self._run, loop)
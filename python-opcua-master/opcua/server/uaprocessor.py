@@ -5,7 +5,7 @@ import time
 
 from my_opcua import ua
 from my_opcua.ua.ua_binary import nodeid_from_binary, struct_from_binary
-from my_opcua.ua.ua_binary import struct_to_binary, uatcp_to_binary
+from my_opcua.ua.ua_binary import struct_to_writer, uatcp_to_binary
 from my_opcua.common import utils
 from my_opcua.common.connection import SecureConnection
 
@@ -19,8 +19,64 @@ class PublishRequestData(object):
         self.timestamp = time.time()
 
 
+class UaService(object):
+    """
+    entry of a service table, handler called for a request
+    and number of requests received
+    """
+
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+        self.count = 0
+        self._lock = Lock()
+
+    def __call__(self, processor, requesthdr, algohdr, seqhdr, body):
+        with self._lock:
+            self.count += 1
+        return self.handler(processor, requesthdr, algohdr, seqhdr, body)
+
+    def __str__(self):
+        return "UaService({0}, count:{1})".format(self.name, self.count)
+    __repr__ = __str__
+
+
+def _service_key(typeid):
+    # requests of namespace 0 are looked up by their integer identifier
+    if isinstance(typeid, ua.NodeId) and typeid.NamespaceIndex == 0:
+        return typeid.Identifier
+    return typeid
+
+
+def new_service_table():
+    """
+    return a service table for one server, keyed by encoding id of requests, with new
+    entries for the services of UaProcessor.default_services so that registrations
+    and counters are not shared between servers
+    """
+    return dict((key, UaService(service.name, service.handler))
+                for key, service in UaProcessor.default_services.items())
+
+
+def register_service(services, typeid, name, handler):
+    """
+    register handler in the service table services for requests whose encoding id
+    is typeid (a NodeId or an integer id in namespace 0). Used to add vendor services
+    or override default ones. handler is called as
+    handler(processor, requesthdr, algohdr, seqhdr, body), body being the
+    buffer positionned after the request header. It must send the response
+    and return False to close the connection, True otherwise
+    """
+    service = UaService(name, handler)
+    services[_service_key(typeid)] = service
+    return service
+
+
 class UaProcessor(object):
 
+    # services copied into the service table of each server, see new_service_table
+    default_services = {}
+
     def __init__(self, internal_server, socket):
         self.logger = logging.getLogger(__name__)
         self.iserver = internal_server
@@ -33,6 +89,8 @@ class UaProcessor(object):
         self._publishdata_queue = []
         self._publish_result_queue = []  # used when we need to wait for PublishRequest
         self._connection = SecureConnection(ua.SecurityPolicy())
+        # service table of the server, see InternalServer.register_service
+        self.services = internal_server.services if internal_server is not None else new_service_table()
 
     @property
     def local_discovery_service(self):
@@ -44,10 +102,12 @@ class UaProcessor(object):
     def send_response(self, requesthandle, algohdr, seqhdr, response, msgtype=ua.MessageType.SecureMessage):
         with self._socketlock:
             response.ResponseHeader.RequestHandle = requesthandle
-            data = self._connection.message_to_binary(
-                struct_to_binary(response), message_type=msgtype, request_id=seqhdr.RequestId, algohdr=algohdr)
+            writer = utils.Writer()
+            struct_to_writer(writer, response)
+            buffers = self._connection.message_to_buffers(
+                writer.view(), message_type=msgtype, request_id=seqhdr.RequestId, algohdr=algohdr)
 
-            self.socket.write(data)
+            self.socket.writelines(buffers)
 
     def open_secure_channel(self, algohdr, seqhdr, body):
         request = struct_from_binary(ua.OpenSecureChannelRequest, body)
@@ -121,365 +181,392 @@ class UaProcessor(object):
             return True
 
     def _process_message(self, typeid, requesthdr, algohdr, seqhdr, body):
-        if typeid == ua.NodeId(ua.ObjectIds.CreateSessionRequest_Encoding_DefaultBinary):
-            self.logger.info("Create session request")
-            params = struct_from_binary(ua.CreateSessionParameters, body)
-
-            # create the session on server
-            self.session = self.iserver.create_session(self.name, external=True)
-            # get a session creation result to send back
-            sessiondata = self.session.create_session(params, sockname=self.sockname)
-
-            response = ua.CreateSessionResponse()
-            response.Parameters = sessiondata
-            response.Parameters.ServerCertificate = self._connection.security_policy.client_certificate
-            if self._connection.security_policy.server_certificate is None:
-                data = params.ClientNonce
-            else:
-                data = self._connection.security_policy.server_certificate + params.ClientNonce
-            response.Parameters.ServerSignature.Signature = \
-                self._connection.security_policy.asymmetric_cryptography.signature(data)
-
-            response.Parameters.ServerSignature.Algorithm = "http://www.w3.org/2000/09/xmldsig#rsa-sha1"
-
-            self.logger.info("sending create session response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        service = self.services.get(_service_key(typeid))
+        if service is None:
+            self.logger.warning("Unknown message received %s", typeid)
+            raise utils.ServiceError(ua.StatusCodes.BadNotImplemented)
+        return service(self, requesthdr, algohdr, seqhdr, body)
+
+    def _create_session(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("Create session request")
+        params = struct_from_binary(ua.CreateSessionParameters, body)
+
+        # create the session on server
+        self.session = self.iserver.create_session(self.name, external=True)
+        # get a session creation result to send back
+        sessiondata = self.session.create_session(params, sockname=self.sockname)
+
+        response = ua.CreateSessionResponse()
+        response.Parameters = sessiondata
+        response.Parameters.ServerCertificate = self._connection.security_policy.client_certificate
+        if self._connection.security_policy.server_certificate is None:
+            data = params.ClientNonce
+        else:
+            data = self._connection.security_policy.server_certificate + params.ClientNonce
+        response.Parameters.ServerSignature.Signature = \
+            self._connection.security_policy.asymmetric_cryptography.signature(data)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.CloseSessionRequest_Encoding_DefaultBinary):
-            self.logger.info("Close session request")
+        response.Parameters.ServerSignature.Algorithm = "http://www.w3.org/2000/09/xmldsig#rsa-sha1"
 
-            if self.session:
-                deletesubs = ua.ua_binary.Primitives.Boolean.unpack(body)
-                self.session.close_session(deletesubs)
-            else:
-                self.logger.info("Request to close non-existing session")
+        self.logger.info("sending create session response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.CloseSessionResponse()
-            self.logger.info("sending close session response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+    def _close_session(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("Close session request")
 
-        elif typeid == ua.NodeId(ua.ObjectIds.ActivateSessionRequest_Encoding_DefaultBinary):
-            self.logger.info("Activate session request")
-            params = struct_from_binary(ua.ActivateSessionParameters, body)
+        if self.session:
+            deletesubs = ua.ua_binary.Primitives.Boolean.unpack(body)
+            self.session.close_session(deletesubs)
+        else:
+            self.logger.info("Request to close non-existing session")
 
-            if not self.session:
-                self.logger.info("request to activate non-existing session")
-                raise utils.ServiceError(ua.StatusCodes.BadSessionIdInvalid)
+        response = ua.CloseSessionResponse()
+        self.logger.info("sending close session response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            if self._connection.security_policy.client_certificate is None:
-                data = self.session.nonce
-            else:
-                data = self._connection.security_policy.client_certificate + self.session.nonce
-            self._connection.security_policy.asymmetric_cryptography.verify(data, params.ClientSignature.Signature)
+    def _activate_session(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("Activate session request")
+        params = struct_from_binary(ua.ActivateSessionParameters, body)
 
-            result = self.session.activate_session(params)
+        if not self.session:
+            self.logger.info("request to activate non-existing session")
+            raise utils.ServiceError(ua.StatusCodes.BadSessionIdInvalid)
 
-            response = ua.ActivateSessionResponse()
-            response.Parameters = result
+        if self._connection.security_policy.client_certificate is None:
+            data = self.session.nonce
+        else:
+            data = self._connection.security_policy.client_certificate + self.session.nonce
+        self._connection.security_policy.asymmetric_cryptography.verify(data, params.ClientSignature.Signature)
 
-            self.logger.info("sending read response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        result = self.session.activate_session(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.ReadRequest_Encoding_DefaultBinary):
-            self.logger.info("Read request")
-            params = struct_from_binary(ua.ReadParameters, body)
+        response = ua.ActivateSessionResponse()
+        response.Parameters = result
 
-            results = self.session.read(params)
+        self.logger.info("sending read response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.ReadResponse()
-            response.Results = results
+    def _read(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("Read request")
+        params = struct_from_binary(ua.ReadParameters, body)
 
-            self.logger.info("sending read response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.read(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.WriteRequest_Encoding_DefaultBinary):
-            self.logger.info("Write request")
-            params = struct_from_binary(ua.WriteParameters, body)
+        response = ua.ReadResponse()
+        response.Results = results
 
-            results = self.session.write(params)
+        self.logger.info("sending read response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.WriteResponse()
-            response.Results = results
+    def _write(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("Write request")
+        params = struct_from_binary(ua.WriteParameters, body)
 
-            self.logger.info("sending write response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.write(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.BrowseRequest_Encoding_DefaultBinary):
-            self.logger.info("Browse request")
-            params = struct_from_binary(ua.BrowseParameters, body)
+        response = ua.WriteResponse()
+        response.Results = results
 
-            results = self.session.browse(params)
+        self.logger.info("sending write response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.BrowseResponse()
-            response.Results = results
+    def _browse(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("Browse request")
+        params = struct_from_binary(ua.BrowseParameters, body)
 
-            self.logger.info("sending browse response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.browse(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.GetEndpointsRequest_Encoding_DefaultBinary):
-            self.logger.info("get endpoints request")
-            params = struct_from_binary(ua.GetEndpointsParameters, body)
+        response = ua.BrowseResponse()
+        response.Results = results
 
-            endpoints = self.iserver.get_endpoints(params, sockname=self.sockname)
+        self.logger.info("sending browse response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.GetEndpointsResponse()
-            response.Endpoints = endpoints
+    def _get_endpoints(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("get endpoints request")
+        params = struct_from_binary(ua.GetEndpointsParameters, body)
 
-            self.logger.info("sending get endpoints response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        endpoints = self.iserver.get_endpoints(params, sockname=self.sockname)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.FindServersRequest_Encoding_DefaultBinary):
-            self.logger.info("find servers request")
-            params = struct_from_binary(ua.FindServersParameters, body)
+        response = ua.GetEndpointsResponse()
+        response.Endpoints = endpoints
 
-            servers = self.local_discovery_service.find_servers(params)
+        self.logger.info("sending get endpoints response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.FindServersResponse()
-            response.Servers = servers
+    def _find_servers(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("find servers request")
+        params = struct_from_binary(ua.FindServersParameters, body)
 
-            self.logger.info("sending find servers response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        servers = self.local_discovery_service.find_servers(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.RegisterServerRequest_Encoding_DefaultBinary):
-            self.logger.info("register server request")
-            serv = struct_from_binary(ua.RegisteredServer, body)
+        response = ua.FindServersResponse()
+        response.Servers = servers
 
-            self.local_discovery_service.register_server(serv)
+        self.logger.info("sending find servers response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.RegisterServerResponse()
+    def _register_server(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("register server request")
+        serv = struct_from_binary(ua.RegisteredServer, body)
 
-            self.logger.info("sending register server response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        self.local_discovery_service.register_server(serv)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.RegisterServer2Request_Encoding_DefaultBinary):
-            self.logger.info("register server 2 request")
-            params = struct_from_binary(ua.RegisterServer2Parameters, body)
+        response = ua.RegisterServerResponse()
 
-            results = self.local_discovery_service.register_server2(params)
+        self.logger.info("sending register server response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.RegisterServer2Response()
-            response.ConfigurationResults = results
+    def _register_server_2(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("register server 2 request")
+        params = struct_from_binary(ua.RegisterServer2Parameters, body)
 
-            self.logger.info("sending register server 2 response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.local_discovery_service.register_server2(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.TranslateBrowsePathsToNodeIdsRequest_Encoding_DefaultBinary):
-            self.logger.info("translate browsepaths to nodeids request")
-            params = struct_from_binary(ua.TranslateBrowsePathsToNodeIdsParameters, body)
+        response = ua.RegisterServer2Response()
+        response.ConfigurationResults = results
 
-            paths = self.session.translate_browsepaths_to_nodeids(params.BrowsePaths)
+        self.logger.info("sending register server 2 response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.TranslateBrowsePathsToNodeIdsResponse()
-            response.Results = paths
+    def _translate_browse_paths(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("translate browsepaths to nodeids request")
+        params = struct_from_binary(ua.TranslateBrowsePathsToNodeIdsParameters, body)
 
-            self.logger.info("sending translate browsepaths to nodeids response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        paths = self.session.translate_browsepaths_to_nodeids(params.BrowsePaths)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.AddNodesRequest_Encoding_DefaultBinary):
-            self.logger.info("add nodes request")
-            params = struct_from_binary(ua.AddNodesParameters, body)
+        response = ua.TranslateBrowsePathsToNodeIdsResponse()
+        response.Results = paths
 
-            results = self.session.add_nodes(params.NodesToAdd)
+        self.logger.info("sending translate browsepaths to nodeids response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.AddNodesResponse()
-            response.Results = results
+    def _add_nodes(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("add nodes request")
+        params = struct_from_binary(ua.AddNodesParameters, body)
 
-            self.logger.info("sending add node response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.add_nodes(params.NodesToAdd)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.DeleteNodesRequest_Encoding_DefaultBinary):
-            self.logger.info("delete nodes request")
-            params = struct_from_binary(ua.DeleteNodesParameters, body)
+        response = ua.AddNodesResponse()
+        response.Results = results
 
-            results = self.session.delete_nodes(params)
+        self.logger.info("sending add node response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.DeleteNodesResponse()
-            response.Results = results
+    def _delete_nodes(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("delete nodes request")
+        params = struct_from_binary(ua.DeleteNodesParameters, body)
 
-            self.logger.info("sending delete node response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.delete_nodes(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.AddReferencesRequest_Encoding_DefaultBinary):
-            self.logger.info("add references request")
-            params = struct_from_binary(ua.AddReferencesParameters, body)
+        response = ua.DeleteNodesResponse()
+        response.Results = results
 
-            results = self.session.add_references(params.ReferencesToAdd)
+        self.logger.info("sending delete node response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.AddReferencesResponse()
-            response.Results = results
+    def _add_references(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("add references request")
+        params = struct_from_binary(ua.AddReferencesParameters, body)
 
-            self.logger.info("sending add references response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.add_references(params.ReferencesToAdd)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.DeleteReferencesRequest_Encoding_DefaultBinary):
-            self.logger.info("delete references request")
-            params = struct_from_binary(ua.DeleteReferencesParameters, body)
+        response = ua.AddReferencesResponse()
+        response.Results = results
 
-            results = self.session.delete_references(params.ReferencesToDelete)
+        self.logger.info("sending add references response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.DeleteReferencesResponse()
-            response.Parameters.Results = results
+    def _delete_references(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("delete references request")
+        params = struct_from_binary(ua.DeleteReferencesParameters, body)
 
-            self.logger.info("sending delete references response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.delete_references(params.ReferencesToDelete)
 
+        response = ua.DeleteReferencesResponse()
+        response.Parameters.Results = results
 
-        elif typeid == ua.NodeId(ua.ObjectIds.CreateSubscriptionRequest_Encoding_DefaultBinary):
-            self.logger.info("create subscription request")
-            params = struct_from_binary(ua.CreateSubscriptionParameters, body)
+        self.logger.info("sending delete references response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            result = self.session.create_subscription(params, self.forward_publish_response)
+    def _create_subscription(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("create subscription request")
+        params = struct_from_binary(ua.CreateSubscriptionParameters, body)
 
-            response = ua.CreateSubscriptionResponse()
-            response.Parameters = result
+        result = self.session.create_subscription(params, self.forward_publish_response)
 
-            self.logger.info("sending create subscription response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        response = ua.CreateSubscriptionResponse()
+        response.Parameters = result
 
-        elif typeid == ua.NodeId(ua.ObjectIds.ModifySubscriptionRequest_Encoding_DefaultBinary):
-            self.logger.info("modify subscription request")
-            params = struct_from_binary(ua.ModifySubscriptionParameters, body)
+        self.logger.info("sending create subscription response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            result = self.session.modify_subscription(params, self.forward_publish_response)
+    def _modify_subscription(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("modify subscription request")
+        params = struct_from_binary(ua.ModifySubscriptionParameters, body)
 
-            response = ua.ModifySubscriptionResponse()
-            response.Parameters = result
+        result = self.session.modify_subscription(params, self.forward_publish_response)
 
-            self.logger.info("sending modify subscription response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        response = ua.ModifySubscriptionResponse()
+        response.Parameters = result
 
-        elif typeid == ua.NodeId(ua.ObjectIds.DeleteSubscriptionsRequest_Encoding_DefaultBinary):
-            self.logger.info("delete subscriptions request")
-            params = struct_from_binary(ua.DeleteSubscriptionsParameters, body)
+        self.logger.info("sending modify subscription response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            results = self.session.delete_subscriptions(params.SubscriptionIds)
+    def _delete_subscriptions(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("delete subscriptions request")
+        params = struct_from_binary(ua.DeleteSubscriptionsParameters, body)
 
-            response = ua.DeleteSubscriptionsResponse()
-            response.Results = results
+        results = self.session.delete_subscriptions(params.SubscriptionIds)
 
-            self.logger.info("sending delte subscription response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        response = ua.DeleteSubscriptionsResponse()
+        response.Results = results
 
-        elif typeid == ua.NodeId(ua.ObjectIds.CreateMonitoredItemsRequest_Encoding_DefaultBinary):
-            self.logger.info("create monitored items request")
-            params = struct_from_binary(ua.CreateMonitoredItemsParameters, body)
-            results = self.session.create_monitored_items(params)
-
-            response = ua.CreateMonitoredItemsResponse()
-            response.Results = results
+        self.logger.info("sending delte subscription response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            self.logger.info("sending create monitored items response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+    def _create_monitored_items(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("create monitored items request")
+        params = struct_from_binary(ua.CreateMonitoredItemsParameters, body)
+        results = self.session.create_monitored_items(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.ModifyMonitoredItemsRequest_Encoding_DefaultBinary):
-            self.logger.info("modify monitored items request")
-            params = struct_from_binary(ua.ModifyMonitoredItemsParameters, body)
-            results = self.session.modify_monitored_items(params)
+        response = ua.CreateMonitoredItemsResponse()
+        response.Results = results
 
-            response = ua.ModifyMonitoredItemsResponse()
-            response.Results = results
+        self.logger.info("sending create monitored items response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            self.logger.info("sending modify monitored items response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+    def _modify_monitored_items(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("modify monitored items request")
+        params = struct_from_binary(ua.ModifyMonitoredItemsParameters, body)
+        results = self.session.modify_monitored_items(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.DeleteMonitoredItemsRequest_Encoding_DefaultBinary):
-            self.logger.info("delete monitored items request")
-            params = struct_from_binary(ua.DeleteMonitoredItemsParameters, body)
+        response = ua.ModifyMonitoredItemsResponse()
+        response.Results = results
 
-            results = self.session.delete_monitored_items(params)
+        self.logger.info("sending modify monitored items response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.DeleteMonitoredItemsResponse()
-            response.Results = results
+    def _delete_monitored_items(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("delete monitored items request")
+        params = struct_from_binary(ua.DeleteMonitoredItemsParameters, body)
 
-            self.logger.info("sending delete monitored items response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.delete_monitored_items(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.HistoryReadRequest_Encoding_DefaultBinary):
-            self.logger.info("history read request")
-            params = struct_from_binary(ua.HistoryReadParameters, body)
+        response = ua.DeleteMonitoredItemsResponse()
+        response.Results = results
 
-            results = self.session.history_read(params)
+        self.logger.info("sending delete monitored items response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            response = ua.HistoryReadResponse()
-            response.Results = results
+    def _history_read(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("history read request")
+        params = struct_from_binary(ua.HistoryReadParameters, body)
 
-            self.logger.info("sending history read response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.history_read(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.RegisterNodesRequest_Encoding_DefaultBinary):
-            self.logger.info("register nodes request")
-            params = struct_from_binary(ua.RegisterNodesParameters, body)
-            self.logger.info("Node registration not implemented")
+        response = ua.HistoryReadResponse()
+        response.Results = results
 
-            response = ua.RegisterNodesResponse()
-            response.Parameters.RegisteredNodeIds = params.NodesToRegister
+        self.logger.info("sending history read response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            self.logger.info("sending register nodes response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+    def _register_nodes(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("register nodes request")
+        params = struct_from_binary(ua.RegisterNodesParameters, body)
+        self.logger.info("Node registration not implemented")
 
-        elif typeid == ua.NodeId(ua.ObjectIds.UnregisterNodesRequest_Encoding_DefaultBinary):
-            self.logger.info("unregister nodes request")
-            params = struct_from_binary(ua.UnregisterNodesParameters, body)
+        response = ua.RegisterNodesResponse()
+        response.Parameters.RegisteredNodeIds = params.NodesToRegister
 
-            response = ua.UnregisterNodesResponse()
+        self.logger.info("sending register nodes response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            self.logger.info("sending unregister nodes response")
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+    def _unregister_nodes(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("unregister nodes request")
+        # node registration is not implemented, the request is only decoded
+        struct_from_binary(ua.UnregisterNodesParameters, body)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.PublishRequest_Encoding_DefaultBinary):
-            self.logger.info("publish request")
+        response = ua.UnregisterNodesResponse()
 
-            if not self.session:
-                return False
+        self.logger.info("sending unregister nodes response")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            params = struct_from_binary(ua.PublishParameters, body)
+    def _publish(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("publish request")
 
-            data = PublishRequestData()
-            data.requesthdr = requesthdr
-            data.seqhdr = seqhdr
-            data.algohdr = algohdr
-            with self._datalock:
-                self._publishdata_queue.append(data)  # will be used to send publish answers from server
-                if self._publish_result_queue:
-                    result = self._publish_result_queue.pop(0)
-                    self.forward_publish_response(result)
-            self.session.publish(params.SubscriptionAcknowledgements)
-            self.logger.info("publish forward to server")
+        if not self.session:
+            return False
 
-        elif typeid == ua.NodeId(ua.ObjectIds.RepublishRequest_Encoding_DefaultBinary):
-            self.logger.info("re-publish request")
+        params = struct_from_binary(ua.PublishParameters, body)
 
-            params = struct_from_binary(ua.RepublishParameters, body)
-            msg = self.session.republish(params)
+        data = PublishRequestData()
+        data.requesthdr = requesthdr
+        data.seqhdr = seqhdr
+        data.algohdr = algohdr
+        with self._datalock:
+            self._publishdata_queue.append(data)  # will be used to send publish answers from server
+            if self._publish_result_queue:
+                result = self._publish_result_queue.pop(0)
+                self.forward_publish_response(result)
+        self.session.publish(params.SubscriptionAcknowledgements)
+        self.logger.info("publish forward to server")
+        return True
 
-            response = ua.RepublishResponse()
-            response.NotificationMessage = msg
+    def _republish(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("re-publish request")
 
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        params = struct_from_binary(ua.RepublishParameters, body)
+        msg = self.session.republish(params)
 
-        elif typeid == ua.NodeId(ua.ObjectIds.CloseSecureChannelRequest_Encoding_DefaultBinary):
-            self.logger.info("close secure channel request")
-            self._connection.close()
-            response = ua.CloseSecureChannelResponse()
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
-            return False
+        response = ua.RepublishResponse()
+        response.NotificationMessage = msg
 
-        elif typeid == ua.NodeId(ua.ObjectIds.CallRequest_Encoding_DefaultBinary):
-            self.logger.info("call request")
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return True
 
-            params = struct_from_binary(ua.CallParameters, body)
+    def _close_secure_channel(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("close secure channel request")
+        self._connection.close()
+        response = ua.CloseSecureChannelResponse()
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        return False
 
-            results = self.session.call(params.MethodsToCall)
+    def _call(self, requesthdr, algohdr, seqhdr, body):
+        self.logger.info("call request")
 
-            response = ua.CallResponse()
-            response.Results = results
+        params = struct_from_binary(ua.CallParameters, body)
 
-            self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
+        results = self.session.call(params.MethodsToCall)
 
-        else:
-            self.logger.warning("Unknown message received %s", typeid)
-            raise utils.ServiceError(ua.StatusCodes.BadNotImplemented)
+        response = ua.CallResponse()
+        response.Results = results
 
+        self.send_response(requesthdr.RequestHandle, algohdr, seqhdr, response)
         return True
 
     def close(self):
@@ -490,3 +577,38 @@ class UaProcessor(object):
         self.logger.info("Cleanup client connection: %s", self.name)
         if self.session:
             self.session.close_session(True)
+
+
+# default services
+for _name, _handler in (
+        ("CreateSession", UaProcessor._create_session),
+        ("CloseSession", UaProcessor._close_session),
+        ("ActivateSession", UaProcessor._activate_session),
+        ("Read", UaProcessor._read),
+        ("Write", UaProcessor._write),
+        ("Browse", UaProcessor._browse),
+        ("GetEndpoints", UaProcessor._get_endpoints),
+        ("FindServers", UaProcessor._find_servers),
+        ("RegisterServer", UaProcessor._register_server),
+        ("RegisterServer2", UaProcessor._register_server_2),
+        ("TranslateBrowsePathsToNodeIds", UaProcessor._translate_browse_paths),
+        ("AddNodes", UaProcessor._add_nodes),
+        ("DeleteNodes", UaProcessor._delete_nodes),
+        ("AddReferences", UaProcessor._add_references),
+        ("DeleteReferences", UaProcessor._delete_references),
+        ("CreateSubscription", UaProcessor._create_subscription),
+        ("ModifySubscription", UaProcessor._modify_subscription),
+        ("DeleteSubscriptions", UaProcessor._delete_subscriptions),
+        ("CreateMonitoredItems", UaProcessor._create_monitored_items),
+        ("ModifyMonitoredItems", UaProcessor._modify_monitored_items),
+        ("DeleteMonitoredItems", UaProcessor._delete_monitored_items),
+        ("HistoryRead", UaProcessor._history_read),
+        ("RegisterNodes", UaProcessor._register_nodes),
+        ("UnregisterNodes", UaProcessor._unregister_nodes),
+        ("Publish", UaProcessor._publish),
+        ("Republish", UaProcessor._republish),
+        ("CloseSecureChannel", UaProcessor._close_secure_channel),
+        ("Call", UaProcessor._call),
+        ):
+    register_service(UaProcessor.default_services, getattr(ua.ObjectIds, _name + "Request_Encoding_DefaultBinary"),
+                     _name, _handler)
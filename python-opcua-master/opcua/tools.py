@@ -5,22 +5,29 @@ from datetime import datetime, timedelta
 import math
 import time
 
-try:
-    from IPython import embed
-except ImportError:
-    import code
-
-    def embed():
-        code.interact(local=dict(globals(), **locals()))
-
 from my_opcua import ua
 from my_opcua import Client
-from my_opcua import Server
 from my_opcua import Node
 from my_opcua import uamethod
 from my_opcua.ua.uaerrors import UaStatusCodeError
 
 
+def embed():
+    """
+    start an interactive shell with the variables of the caller,
+    IPython if available; it is imported here since it is slow to import
+    """
+    frame = sys._getframe(1)
+    namespace = dict(frame.f_globals, **frame.f_locals)
+    try:
+        import IPython
+    except ImportError:
+        import code
+        code.interact(local=namespace)
+    else:
+        IPython.start_ipython(argv=[], user_ns=namespace)
+
+
 def add_minimum_args(parser):
     parser.add_argument("-u",
                         "--url",
@@ -522,6 +529,7 @@ def uaserver():
     args = parser.parse_args()
     logging.basicConfig(format="%(levelname)s: %(message)s", level=getattr(logging, args.loglevel))
 
+    from my_opcua import Server  # not imported by client commands
     server = Server()
     server.set_endpoint(args.url)
     if args.certificate:
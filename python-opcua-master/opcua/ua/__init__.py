@@ -1,9 +1,59 @@
-# the order is important, some classes are overriden
+import importlib
+import importlib.util
+import sys
+
 from my_opcua.ua.attribute_ids import AttributeIds
-from my_opcua.ua.object_ids import ObjectIds
-from my_opcua.ua.object_ids import ObjectIdNames
 from my_opcua.ua.status_codes import StatusCodes
-from my_opcua.ua.uaprotocol_auto import *
-from my_opcua.ua.uaprotocol_hand import *
 from my_opcua.ua.uatypes import *  #TODO: This should be renamed to uatypes_hand
 
+# The generated ids and protocol classes are large and slow to import, they are
+# only imported when one of their names is first accessed (PEP 562).
+# the order is important, some classes are overriden: uatypes names are defined
+# above, then uaprotocol_hand names override uaprotocol_auto names
+_lazy_modules = {
+    "ObjectIds": ("my_opcua.ua.object_ids",),
+    "ObjectIdNames": ("my_opcua.ua.object_ids",),
+}
+_protocol_modules = ("my_opcua.ua.uaprotocol_hand", "my_opcua.ua.uaprotocol_auto")
+
+# filled when uaprotocol_auto is imported, so accessing them must import it
+del extension_object_classes
+del extension_object_ids
+
+
+def __getattr__(name):
+    if name == "__all__":
+        # for star imports, which otherwise only see names already imported
+        return [n for n in __dir__() if not n.startswith("_")]
+    if name.startswith("_"):
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    for modname in _lazy_modules.get(name, _protocol_modules):
+        module = importlib.import_module(modname)
+        if name in globals():
+            # a submodule, set by the import
+            return globals()[name]
+        if hasattr(module, name):
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+    if importlib.util.find_spec(__name__ + "." + name) is not None:
+        # a submodule like ua_binary, which the package used to import as a side effect
+        return importlib.import_module(__name__ + "." + name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+def __dir__():
+    names = set(globals())
+    for modname in _protocol_modules + ("my_opcua.ua.object_ids",):
+        names.update(n for n in dir(importlib.import_module(modname)) if not n.startswith("_"))
+    return sorted(names)
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported
+    from my_opcua.ua.object_ids import ObjectIds
+    from my_opcua.ua.object_ids import ObjectIdNames
+    from my_opcua.ua.uaprotocol_auto import *
+    from my_opcua.ua.uaprotocol_hand import *
+    from my_opcua.ua.uatypes import *
+    from my_opcua.ua import ua_binary
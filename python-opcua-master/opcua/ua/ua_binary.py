@@ -9,7 +9,7 @@ import uuid
 from enum import IntEnum, Enum
 
 from my_opcua.ua.uaerrors import UaError
-from my_opcua.common.utils import Buffer
+from my_opcua.common.utils import Buffer, Writer
 from my_opcua import ua
 
 if sys.version_info.major > 2:
@@ -18,6 +18,16 @@ if sys.version_info.major > 2:
 logger = logging.getLogger('__name__')
 
 
+def _unpack(st, data):
+    """
+    unpack st.size bytes with struct.Struct st from data, either a Buffer
+    or any object having a read method
+    """
+    if isinstance(data, Buffer):
+        return data.unpack(st)
+    return st.unpack(data.read(st.size))
+
+
 def test_bit(data, offset):
     mask = 1 << offset
     return data & mask
@@ -33,12 +43,25 @@ def unset_bit(data, offset):
     return data & ~mask
 
 
+def _to_bytes(func, *args):
+    """
+    call func(writer, *args) on a new Writer and return the written bytes
+    """
+    writer = Writer()
+    func(writer, *args)
+    return writer.getvalue()
+
+
 class _DateTime(object):
     @staticmethod
     def pack(dt):
         epch = ua.datetime_to_win_epoch(dt)
         return Primitives.Int64.pack(epch)
 
+    @staticmethod
+    def write(writer, dt):
+        Primitives.Int64.write(writer, ua.datetime_to_win_epoch(dt))
+
     @staticmethod
     def unpack(data):
         epch = Primitives.Int64.unpack(data)
@@ -53,6 +76,14 @@ class _Bytes(object):
         length = len(data)
         return Primitives.Int32.pack(length) + data
 
+    @staticmethod
+    def write(writer, data):
+        if data is None:
+            Primitives.Int32.write(writer, -1)
+            return
+        Primitives.Int32.write(writer, len(data))
+        writer.write(data)
+
     @staticmethod
     def unpack(data):
         length = Primitives.Int32.unpack(data)
@@ -73,16 +104,26 @@ class _String(object):
                     string = string.encode('utf-8')
         return _Bytes.pack(string)
 
+    @staticmethod
+    def write(writer, string):
+        if string is not None:
+            if sys.version_info.major > 2 or isinstance(string, unicode):
+                string = string.encode('utf-8')
+        _Bytes.write(writer, string)
+
     @staticmethod
     def unpack(data):
-        b = _Bytes.unpack(data)
         if sys.version_info.major < 3:
             # return unicode(b)  #might be correct for python2 but would complicate tests for python3
-            return b
+            return _Bytes.unpack(data)
         else:
-            if b is None:
-                return b
-            return b.decode("utf-8")
+            length = Primitives.Int32.unpack(data)
+            if length == -1:
+                return None
+            if isinstance(data, Buffer):
+                # decode directly from buffer, avoiding an intermediate bytes object
+                return unicode(data.read_view(length), "utf-8")
+            return data.read(length).decode("utf-8")
 
 
 class _Null(object):
@@ -90,6 +131,10 @@ class _Null(object):
     def pack(data):
         return b""
 
+    @staticmethod
+    def write(writer, data):
+        pass
+
     @staticmethod
     def unpack(data):
         return None
@@ -98,44 +143,35 @@ class _Null(object):
 class _Guid(object):
     @staticmethod
     def pack(guid):
-        # convert python UUID 6 field format to OPC UA 4 field format
-        f1 = Primitives.UInt32.pack(guid.time_low)
-        f2 = Primitives.UInt16.pack(guid.time_mid)
-        f3 = Primitives.UInt16.pack(guid.time_hi_version)
-        f4a = Primitives.Byte.pack(guid.clock_seq_hi_variant)
-        f4b = Primitives.Byte.pack(guid.clock_seq_low)
-        f4c = struct.pack('>Q', guid.node)[2:8]  # no primitive .pack available for 6 byte int
-        f4 = f4a + f4b + f4c
-        # concat byte fields
-        b = f1 + f2 + f3 + f4
-
-        return b
+        # OPC UA 4 field format is the little endian layout of python UUID
+        return guid.bytes_le
 
     @staticmethod
-    def unpack(data):
-        # convert OPC UA 4 field format to python UUID bytes
-        f1 = struct.pack('>I', Primitives.UInt32.unpack(data))
-        f2 = struct.pack('>H', Primitives.UInt16.unpack(data))
-        f3 = struct.pack('>H', Primitives.UInt16.unpack(data))
-        f4 = data.read(8)
-        # concat byte fields
-        b = f1 + f2 + f3 + f4
+    def write(writer, guid):
+        writer.write(guid.bytes_le)
 
-        return uuid.UUID(bytes=b)
+    @staticmethod
+    def unpack(data):
+        # OPC UA 4 field format is the little endian layout of python UUID
+        return uuid.UUID(bytes_le=data.read(16))
 
 
 class _Primitive1(object):
     def __init__(self, fmt):
         self._fmt = fmt
         st = struct.Struct(fmt.format(1))
+        self._struct = st
         self.size = st.size
         self.format = st.format
 
     def pack(self, data):
         return struct.pack(self.format, data)
 
+    def write(self, writer, data):
+        writer.pack(self._struct, data)
+
     def unpack(self, data):
-        return struct.unpack(self.format, data.read(self.size))[0]
+        return _unpack(self._struct, data)[0]
 
     def pack_array(self, data):
         if data is None:
@@ -143,12 +179,19 @@ class _Primitive1(object):
         sizedata = Primitives.Int32.pack(len(data))
         return sizedata + struct.pack(self._fmt.format(len(data)), *data)
 
+    def write_array(self, writer, data):
+        if data is None:
+            Primitives.Int32.write(writer, -1)
+            return
+        Primitives.Int32.write(writer, len(data))
+        writer.pack(struct.Struct(self._fmt.format(len(data))), *data)
+
     def unpack_array(self, data, length):
         if length == -1:
             return None
         if length == 0:
             return ()
-        return struct.unpack(self._fmt.format(length), data.read(self.size * length))
+        return _unpack(struct.Struct(self._fmt.format(length)), data)
 
 
 class Primitives1(object):
@@ -177,18 +220,22 @@ class Primitives(Primitives1):
 
 
 def pack_uatype(vtype, value):
+    return _to_bytes(uatype_to_writer, vtype, value)
+
+
+def uatype_to_writer(writer, vtype, value):
     if hasattr(Primitives, vtype.name):
-        return getattr(Primitives, vtype.name).pack(value)
+        getattr(Primitives, vtype.name).write(writer, value)
     elif vtype.value > 25:
-        return Primitives.Bytes.pack(value)
+        Primitives.Bytes.write(writer, value)
     elif vtype == ua.VariantType.ExtensionObject:
-        return extensionobject_to_binary(value)
+        extensionobject_to_writer(writer, value)
     elif vtype in (ua.VariantType.NodeId, ua.VariantType.ExpandedNodeId):
-        return nodeid_to_binary(value)
+        nodeid_to_writer(writer, value)
     elif vtype == ua.VariantType.Variant:
-        return variant_to_binary(value)
+        variant_to_writer(writer, value)
     else:
-        return struct_to_binary(value)
+        struct_to_writer(writer, value)
 
 
 def unpack_uatype(vtype, data):
@@ -212,15 +259,20 @@ def unpack_uatype(vtype, data):
 
 
 def pack_uatype_array(vtype, array):
+    return _to_bytes(uatype_array_to_writer, vtype, array)
+
+
+def uatype_array_to_writer(writer, vtype, array):
     if hasattr(Primitives1, vtype.name):
         dataType = getattr(Primitives1, vtype.name)
-        return dataType.pack_array(array)
+        dataType.write_array(writer, array)
+        return
     if array is None:
-        return b'\xff\xff\xff\xff'
-    length = len(array)
-    b = [pack_uatype(vtype, val) for val in array]
-    b.insert(0, Primitives.Int32.pack(length))
-    return b"".join(b)
+        Primitives.Int32.write(writer, -1)
+        return
+    Primitives.Int32.write(writer, len(array))
+    for val in array:
+        uatype_to_writer(writer, vtype, val)
 
 
 def unpack_uatype_array(vtype, data):
@@ -237,6 +289,26 @@ def unpack_uatype_array(vtype, data):
 
 
 def struct_to_binary(obj):
+    """
+    Pack a python object having a ua_types member, using the compiled
+    encoder registered for its class
+    """
+    return _to_bytes(struct_to_writer, obj)
+
+
+def struct_to_writer(writer, obj):
+    try:
+        encoder = _struct_encoders[obj.__class__]
+    except KeyError:
+        encoder = _create_struct_encoder(obj.__class__)
+    encoder(writer, obj)
+
+
+def _struct_to_binary_interpreted(obj):
+    """
+    reference implementation of struct_to_binary, interpreting
+    ua_types for every call. Only used to check the compiled encoders
+    """
     packet = []
     has_switch = hasattr(obj, "ua_switches")
     if has_switch:
@@ -256,91 +328,115 @@ def struct_to_binary(obj):
                 pass
             else:
                 packet.append(to_binary(uatype, val))
-    b = b''.join(packet)
-    #print(b)
-    b = b.replace(b'rfr310.Scan\x01\x00\x00\x00\x0c\x0b\x00\x00\x00magicwordxx', b'\x72\x66\x72\x33\x31\x30\x2e\x53\x63\x61\x6e\x01\x00\x00\x00\x16\x01\x03\x97\x13\x01\x11\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x34\x40\x14\x00\x00\x00\x00')
-    return b
+    return b''.join(packet)
 
 
 def to_binary(uatype, val):
     """
     Pack a python object to binary given a string defining its type
     """
+    return _to_bytes(to_writer, uatype, val)
+
+
+def to_writer(writer, uatype, val):
+    """
+    Pack a python object into writer given a string defining its type
+    """
     if uatype.startswith("ListOf"):
         #if isinstance(val, (list, tuple)):
-        return list_to_binary(uatype[6:], val)
+        list_to_writer(writer, uatype[6:], val)
     elif isinstance(uatype, (str, unicode)) and hasattr(ua.VariantType, uatype):
         vtype = getattr(ua.VariantType, uatype)
-        return pack_uatype(vtype, val)
+        uatype_to_writer(writer, vtype, val)
     elif isinstance(uatype, (str, unicode)) and hasattr(Primitives, uatype):
-        return getattr(Primitives, uatype).pack(val)
+        getattr(Primitives, uatype).write(writer, val)
     elif isinstance(val, (IntEnum, Enum)):
-        return Primitives.UInt32.pack(val.value)
+        Primitives.UInt32.write(writer, val.value)
     elif isinstance(val, ua.NodeId):
-        return nodeid_to_binary(val)
+        nodeid_to_writer(writer, val)
     elif isinstance(val, ua.Variant):
-        return variant_to_binary(val)
+        variant_to_writer(writer, val)
     elif hasattr(val, "ua_types"):
-        return struct_to_binary(val)
+        struct_to_writer(writer, val)
     else:
         raise UaError("No known way to pack {} of type {} to ua binary".format(val, uatype))
 
 
 def list_to_binary(uatype, val):
+    return _to_bytes(list_to_writer, uatype, val)
+
+
+def list_to_writer(writer, uatype, val):
     if val is None:
-        return Primitives.Int32.pack(-1)
+        Primitives.Int32.write(writer, -1)
+        return
     if hasattr(Primitives1, uatype):
         dataType = getattr(Primitives1, uatype)
-        return dataType.pack_array(val)
-    datasize = Primitives.Int32.pack(len(val))
-    pack = [to_binary(uatype, el) for el in val]
-    pack.insert(0, datasize)
-    return b''.join(pack)
+        dataType.write_array(writer, val)
+        return
+    Primitives.Int32.write(writer, len(val))
+    for el in val:
+        to_writer(writer, uatype, el)
+
+
+_twobyte_nodeid_struct = struct.Struct("<BB")
+_fourbyte_nodeid_struct_enc = struct.Struct("<BBH")
+_numeric_nodeid_struct_enc = struct.Struct("<BHI")
+_nodeid_header_struct = struct.Struct("<BH")
 
 
 def nodeid_to_binary(nodeid):
-    data = None
-    if nodeid.NodeIdType == ua.NodeIdType.TwoByte:
-        return struct.pack("<BB", nodeid.NodeIdType.value, nodeid.Identifier)
-    elif nodeid.NodeIdType == ua.NodeIdType.FourByte:
-        return struct.pack("<BBH", nodeid.NodeIdType.value, nodeid.NamespaceIndex, nodeid.Identifier)
-    elif nodeid.NodeIdType == ua.NodeIdType.Numeric:
-        data = struct.pack("<BHI", nodeid.NodeIdType.value, nodeid.NamespaceIndex, nodeid.Identifier)
-    elif nodeid.NodeIdType == ua.NodeIdType.String:
-        data = struct.pack("<BH", nodeid.NodeIdType.value, nodeid.NamespaceIndex) + \
-            Primitives.String.pack(nodeid.Identifier)
-    elif nodeid.NodeIdType == ua.NodeIdType.ByteString:
-        data = struct.pack("<BH", nodeid.NodeIdType.value, nodeid.NamespaceIndex) + \
-            Primitives.Bytes.pack(nodeid.Identifier)
-    elif nodeid.NodeIdType == ua.NodeIdType.Guid:
-        data = struct.pack("<BH", nodeid.NodeIdType.value, nodeid.NamespaceIndex) + \
-               Primitives.Guid.pack(nodeid.Identifier)
-    else:
+    return _to_bytes(nodeid_to_writer, nodeid)
+
+
+def nodeid_to_writer(writer, nodeid):
+    nodeidtype = nodeid.NodeIdType
+    if nodeidtype == ua.NodeIdType.TwoByte:
+        writer.pack(_twobyte_nodeid_struct, nodeidtype.value, nodeid.Identifier)
+        return
+    elif nodeidtype == ua.NodeIdType.FourByte:
+        writer.pack(_fourbyte_nodeid_struct_enc, nodeidtype.value, nodeid.NamespaceIndex, nodeid.Identifier)
+        return
+    elif nodeidtype not in (ua.NodeIdType.Numeric, ua.NodeIdType.String,
+                            ua.NodeIdType.ByteString, ua.NodeIdType.Guid):
         raise UaError("Unknown NodeIdType: {} for NodeId: {}".format(nodeid.NodeIdType, nodeid))
+    encoding = nodeidtype.value
     # Add NamespaceUri and ServerIndex in case we have an ExpandedNodeId
     if nodeid.NamespaceUri:
-        data = bytearray(data)
-        data[0] = set_bit(data[0], 7)
-        data.extend(Primitives.String.pack(nodeid.NamespaceUri))
+        encoding = set_bit(encoding, 7)
+    if nodeid.ServerIndex:
+        encoding = set_bit(encoding, 6)
+    if nodeidtype == ua.NodeIdType.Numeric:
+        writer.pack(_numeric_nodeid_struct_enc, encoding, nodeid.NamespaceIndex, nodeid.Identifier)
+    else:
+        writer.pack(_nodeid_header_struct, encoding, nodeid.NamespaceIndex)
+        if nodeidtype == ua.NodeIdType.String:
+            Primitives.String.write(writer, nodeid.Identifier)
+        elif nodeidtype == ua.NodeIdType.ByteString:
+            Primitives.Bytes.write(writer, nodeid.Identifier)
+        else:
+            Primitives.Guid.write(writer, nodeid.Identifier)
+    if nodeid.NamespaceUri:
+        Primitives.String.write(writer, nodeid.NamespaceUri)
     if nodeid.ServerIndex:
-        if not isinstance(data, bytearray):
-            data = bytearray(data)
-        data[0] = set_bit(data[0], 6)
-        data.extend(Primitives.UInt32.pack(nodeid.ServerIndex))
-    return data
+        Primitives.UInt32.write(writer, nodeid.ServerIndex)
+
+
+_fourbyte_nodeid_struct = struct.Struct("<BH")
+_numeric_nodeid_struct = struct.Struct("<HI")
 
 
 def nodeid_from_binary(data):
     nid = ua.NodeId()
-    encoding = ord(data.read(1))
+    encoding = Primitives.Byte.unpack(data)
     nid.NodeIdType = ua.NodeIdType(encoding & 0b00111111)
 
     if nid.NodeIdType == ua.NodeIdType.TwoByte:
-        nid.Identifier = ord(data.read(1))
+        nid.Identifier = Primitives.Byte.unpack(data)
     elif nid.NodeIdType == ua.NodeIdType.FourByte:
-        nid.NamespaceIndex, nid.Identifier = struct.unpack("<BH", data.read(3))
+        nid.NamespaceIndex, nid.Identifier = _unpack(_fourbyte_nodeid_struct, data)
     elif nid.NodeIdType == ua.NodeIdType.Numeric:
-        nid.NamespaceIndex, nid.Identifier = struct.unpack("<HI", data.read(6))
+        nid.NamespaceIndex, nid.Identifier = _unpack(_numeric_nodeid_struct, data)
     elif nid.NodeIdType == ua.NodeIdType.String:
         nid.NamespaceIndex = Primitives.UInt16.unpack(data)
         nid.Identifier = Primitives.String.unpack(data)
@@ -362,28 +458,29 @@ def nodeid_from_binary(data):
 
 
 def variant_to_binary(var):
-    b = []
+    return _to_bytes(variant_to_writer, var)
+
+
+def variant_to_writer(writer, var):
     encoding = var.VariantType.value & 0b111111
     if var.is_array or isinstance(var.Value, (list, tuple)):
         var.is_array = True
         encoding = set_bit(encoding, 7)
         if var.Dimensions is not None:
             encoding = set_bit(encoding, 6)
-        b.append(Primitives.Byte.pack(encoding))
-        b.append(pack_uatype_array(var.VariantType, ua.flatten(var.Value)))
+        Primitives.Byte.write(writer, encoding)
+        uatype_array_to_writer(writer, var.VariantType, ua.flatten(var.Value))
         if var.Dimensions is not None:
-            b.append(pack_uatype_array(ua.VariantType.Int32, var.Dimensions))
+            uatype_array_to_writer(writer, ua.VariantType.Int32, var.Dimensions)
     else:
-        b.append(Primitives.Byte.pack(encoding))
-        b.append(pack_uatype(var.VariantType, var.Value))
-
-    return b"".join(b)
+        Primitives.Byte.write(writer, encoding)
+        uatype_to_writer(writer, var.VariantType, var.Value)
 
 
 def variant_from_binary(data):
     dimensions = None
     array = False
-    encoding = ord(data.read(1))
+    encoding = Primitives.Byte.unpack(data)
     int_type = encoding & 0b00111111
     vtype = ua.datatype_to_varianttype(int_type)
     if test_bit(encoding, 7):
@@ -417,7 +514,7 @@ def extensionobject_from_binary(data):
     Returns an object, or None if TypeId is zero
     """
     typeid = nodeid_from_binary(data)
-    Encoding = ord(data.read(1))
+    Encoding = Primitives.Byte.unpack(data)
     body = None
     if Encoding & (1 << 0):
         length = Primitives.Int32.unpack(data)
@@ -448,22 +545,27 @@ def extensionobject_to_binary(obj):
     If obj is None, convert to empty ExtensionObject (TypeId=0, no Body).
     Returns a binary string
     """
+    return _to_bytes(extensionobject_to_writer, obj)
+
+
+def extensionobject_to_writer(writer, obj):
+    """
+    Pack Python object into writer as a binary-coded ExtensionObject.
+    The body is encoded in place and its length prefix patched afterwards
+    """
     if isinstance(obj, ua.ExtensionObject):
-        return struct_to_binary(obj)
+        struct_to_writer(writer, obj)
+        return
     if obj is None:
-        TypeId = ua.NodeId()
-        Encoding = 0
-        Body = None
-    else:
-        TypeId = ua.extension_object_ids[obj.__class__.__name__]
-        Encoding = 0x01
-        Body = struct_to_binary(obj)
-    packet = []
-    packet.append(nodeid_to_binary(TypeId))
-    packet.append(Primitives.Byte.pack(Encoding))
-    if Body:
-        packet.append(Primitives.Bytes.pack(Body))
-    return b''.join(packet)
+        nodeid_to_writer(writer, ua.NodeId())
+        Primitives.Byte.write(writer, 0)
+        return
+    nodeid_to_writer(writer, ua.extension_object_ids[obj.__class__.__name__])
+    Primitives.Byte.write(writer, 0x01)
+    pos = writer.tell()
+    Primitives.Int32.write(writer, 0)
+    struct_to_writer(writer, obj)
+    writer.pack_at(pos, Primitives.Int32._struct, writer.tell() - pos - 4)
 
 
 def from_binary(uatype, data):
@@ -490,6 +592,20 @@ def struct_from_binary(objtype, data):
     """
     unpack an ua struct. Arguments are an objtype as Python class or string
     """
+    if isinstance(objtype, (unicode, str)):
+        objtype = getattr(ua, objtype)
+    try:
+        decoder = _struct_decoders[objtype]
+    except KeyError:
+        decoder = _create_struct_decoder(objtype)
+    return decoder(data)
+
+
+def _struct_from_binary_interpreted(objtype, data):
+    """
+    reference implementation of struct_from_binary, interpreting
+    ua_types for every call. Only used to check the compiled decoders
+    """
     if isinstance(objtype, (unicode, str)):
         objtype = getattr(ua, objtype)
     if issubclass(objtype, Enum):
@@ -507,16 +623,304 @@ def struct_from_binary(objtype, data):
     return obj
 
 
+# Compiled struct codecs.
+# Interpreting ua_types for every field of every message is the main cost
+# of the binary protocol. Instead we resolve the field types of a class once,
+# the first time it is encoded or decoded, and cache one encoder and one
+# decoder function per class. Consecutive fixed size fields are packed and
+# unpacked with a single precompiled struct.Struct.
+
+_struct_encoders = {}
+_struct_decoders = {}
+
+
+def _fixed_size_field(uatype):
+    """
+    return (struct format char, encode converter, decode converter) if
+    uatype has a fixed size binary representation, else None
+    """
+    if hasattr(Primitives1, uatype):
+        return getattr(Primitives1, uatype).format[1:], None, None
+    if uatype == "DateTime":
+        return "q", ua.datetime_to_win_epoch, ua.win_epoch_to_datetime
+    if hasattr(ua.VariantType, uatype) or hasattr(Primitives, uatype):
+        return None
+    klass = getattr(ua, uatype, None)
+    if isinstance(klass, type) and issubclass(klass, Enum):
+        if issubclass(klass, IntEnum):
+            return "I", None, klass
+        return "I", _enum_value, klass
+    return None
+
+
+def _enum_value(val):
+    return val.value
+
+
+def _create_field_encoder(uatype):
+    """
+    return a function writing a value of type uatype, see to_writer
+    """
+    if uatype.startswith("ListOf"):
+        return _create_list_encoder(uatype[6:])
+    if hasattr(ua.VariantType, uatype):
+        vtype = getattr(ua.VariantType, uatype)
+        if hasattr(Primitives, vtype.name):
+            return getattr(Primitives, vtype.name).write
+        elif vtype == ua.VariantType.ExtensionObject:
+            return extensionobject_to_writer
+        elif vtype in (ua.VariantType.NodeId, ua.VariantType.ExpandedNodeId):
+            return nodeid_to_writer
+        elif vtype == ua.VariantType.Variant:
+            return variant_to_writer
+        return struct_to_writer
+    if hasattr(Primitives, uatype):
+        return getattr(Primitives, uatype).write
+
+    def encode(writer, val):
+        to_writer(writer, uatype, val)
+    return encode
+
+
+def _create_list_encoder(uatype):
+    if hasattr(Primitives1, uatype):
+        return getattr(Primitives1, uatype).write_array
+    encode_element = _create_field_encoder(uatype)
+
+    def encode(writer, val):
+        if val is None:
+            Primitives.Int32.write(writer, -1)
+            return
+        Primitives.Int32.write(writer, len(val))
+        for el in val:
+            encode_element(writer, el)
+    return encode
+
+
+def _create_field_decoder(uatype):
+    """
+    return a function unpacking a value of type uatype, see from_binary
+    """
+    if uatype.startswith("ListOf"):
+        return _create_list_decoder(uatype[6:])
+    if hasattr(ua.VariantType, uatype):
+        vtype = getattr(ua.VariantType, uatype)
+        if hasattr(Primitives, vtype.name):
+            return getattr(Primitives, vtype.name).unpack
+        elif vtype == ua.VariantType.ExtensionObject:
+            return extensionobject_from_binary
+        elif vtype in (ua.VariantType.NodeId, ua.VariantType.ExpandedNodeId):
+            return nodeid_from_binary
+        elif vtype == ua.VariantType.Variant:
+            return variant_from_binary
+    elif hasattr(Primitives, uatype):
+        return getattr(Primitives, uatype).unpack
+    klass = getattr(ua, uatype, None)
+    if not isinstance(klass, type):
+        # class may be registered later on, resolve it when decoding
+
+        def decode(data):
+            return from_binary(uatype, data)
+        return decode
+    if issubclass(klass, Enum):
+
+        def decode_enum(data):
+            return klass(Primitives.UInt32.unpack(data))
+        return decode_enum
+
+    # do not resolve decoder of klass here, structs may be recursive
+    def decode_struct(data):
+        return struct_from_binary(klass, data)
+    return decode_struct
+
+
+def _create_list_decoder(uatype):
+    if hasattr(ua.VariantType, uatype):
+        vtype = getattr(ua.VariantType, uatype)
+
+        def decode_array(data):
+            return unpack_uatype_array(vtype, data)
+        return decode_array
+    decode_element = _create_field_decoder(uatype)
+
+    def decode(data):
+        size = Primitives.Int32.unpack(data)
+        return [decode_element(data) for _ in range(size)]
+    return decode
+
+
+def _group_fields(objtype):
+    """
+    split ua_types of objtype in a list of fields, where runs of fixed size
+    fields are merged. Each element is either
+    ('fixed', [(name, fmt, enc, dec), ...]) or ('field', name, uatype)
+    """
+    switches = getattr(objtype, "ua_switches", {})
+    groups = []
+    run = []
+    for name, uatype in objtype.ua_types:
+        fixed = None
+        if name not in switches:
+            fixed = _fixed_size_field(uatype)
+        if fixed is not None:
+            run.append((name,) + fixed)
+            continue
+        if run:
+            groups.append(("fixed", run))
+            run = []
+        groups.append(("field", name, uatype))
+    if run:
+        groups.append(("fixed", run))
+    return groups
+
+
+def _make_fixed_encoder(run):
+    st = struct.Struct("<" + "".join(fmt for _, fmt, _, _ in run))
+    names = [name for name, _, _, _ in run]
+    converters = [enc for _, _, enc, _ in run]
+    if not any(converters):
+        if len(names) == 1:
+            name = names[0]
+
+            def encode_one(writer, obj):
+                writer.pack(st, getattr(obj, name))
+            return encode_one
+
+        def encode(writer, obj):
+            writer.pack(st, *[getattr(obj, name) for name in names])
+        return encode
+    fields = list(zip(names, converters))
+
+    def encode_converted(writer, obj):
+        vals = []
+        for name, enc in fields:
+            val = getattr(obj, name)
+            vals.append(enc(val) if enc else val)
+        writer.pack(st, *vals)
+    return encode_converted
+
+
+def _make_field_encoder(name, uatype, switches):
+    encode_field = _create_field_encoder(uatype)
+    if name in switches:
+
+        def encode_optional(writer, obj):
+            val = getattr(obj, name)
+            if val is not None:
+                encode_field(writer, val)
+        return encode_optional
+
+    def encode(writer, obj):
+        encode_field(writer, getattr(obj, name))
+    return encode
+
+
+def _create_struct_encoder(objtype):
+    """
+    compile and register an encoder for class objtype
+    """
+    if not hasattr(objtype, "ua_types"):
+        raise UaError("No known way to pack {0} to ua binary".format(objtype))
+    switches = getattr(objtype, "ua_switches", {})
+    switch_bits = [(name, container_name, 1 << idx) for name, (container_name, idx) in switches.items()]
+    ops = []
+    for group in _group_fields(objtype):
+        if group[0] == "fixed":
+            ops.append(_make_fixed_encoder(group[1]))
+        else:
+            ops.append(_make_field_encoder(group[1], group[2], switches))
+
+    if switch_bits:
+        def encoder(writer, obj):
+            for name, container_name, mask in switch_bits:
+                if getattr(obj, name) is not None:
+                    setattr(obj, container_name, getattr(obj, container_name) | mask)
+            for op in ops:
+                op(writer, obj)
+    elif len(ops) == 1:
+        encoder = ops[0]
+    else:
+        def encoder(writer, obj):
+            for op in ops:
+                op(writer, obj)
+    _struct_encoders[objtype] = encoder
+    return encoder
+
+
+def _make_fixed_decoder(run):
+    st = struct.Struct("<" + "".join(fmt for _, fmt, _, _ in run))
+    fields = [(name, dec) for name, _, _, dec in run]
+    if not any(dec for _, dec in fields):
+        names = [name for name, _ in fields]
+
+        def decode(obj, data):
+            for name, val in zip(names, _unpack(st, data)):
+                setattr(obj, name, val)
+        return decode
+
+    def decode_converted(obj, data):
+        for (name, dec), val in zip(fields, _unpack(st, data)):
+            setattr(obj, name, dec(val) if dec else val)
+    return decode_converted
+
+
+def _make_field_decoder(name, uatype, switches):
+    decode_field = _create_field_decoder(uatype)
+    if name in switches:
+        container_name, idx = switches[name]
+        mask = 1 << idx
+
+        def decode_optional(obj, data):
+            # if our member has a switch and it is not set we skip it
+            if getattr(obj, container_name) & mask:
+                setattr(obj, name, decode_field(data))
+        return decode_optional
+
+    def decode(obj, data):
+        setattr(obj, name, decode_field(data))
+    return decode
+
+
+def _create_struct_decoder(objtype):
+    """
+    compile and register a decoder for class objtype
+    """
+    if issubclass(objtype, Enum):
+        def decoder(data):
+            return objtype(Primitives.UInt32.unpack(data))
+    else:
+        switches = getattr(objtype, "ua_switches", {})
+        ops = []
+        for group in _group_fields(objtype):
+            if group[0] == "fixed":
+                ops.append(_make_fixed_decoder(group[1]))
+            else:
+                ops.append(_make_field_decoder(group[1], group[2], switches))
+
+        def decoder(data):
+            obj = objtype()
+            for op in ops:
+                op(obj, data)
+            return obj
+    _struct_decoders[objtype] = decoder
+    return decoder
+
+
+_header_struct = struct.Struct("<3ssI")
+_secure_header_struct = struct.Struct("<3ssII")
+
+
 def header_to_binary(hdr):
-    b = []
-    b.append(struct.pack("<3ss", hdr.MessageType, hdr.ChunkType))
+    return _to_bytes(header_to_writer, hdr)
+
+
+def header_to_writer(writer, hdr):
     size = hdr.body_size + 8
     if hdr.MessageType in (ua.MessageType.SecureOpen, ua.MessageType.SecureClose, ua.MessageType.SecureMessage):
         size += 4
-    b.append(Primitives.UInt32.pack(size))
-    if hdr.MessageType in (ua.MessageType.SecureOpen, ua.MessageType.SecureClose, ua.MessageType.SecureMessage):
-        b.append(Primitives.UInt32.pack(hdr.ChannelId))
-    return b"".join(b)
+        writer.pack(_secure_header_struct, hdr.MessageType, hdr.ChunkType, size, hdr.ChannelId)
+    else:
+        writer.pack(_header_struct, hdr.MessageType, hdr.ChunkType, size)
 
 
 def header_from_binary(data):
@@ -535,6 +939,10 @@ def uatcp_to_binary(message_type, message):
     The only supported types are Hello, Acknowledge and ErrorMessage
     """
     header = ua.Header(message_type, ua.ChunkType.Single)
-    binmsg = struct_to_binary(message)
-    header.body_size = len(binmsg)
-    return header_to_binary(header) + binmsg
+    writer = Writer()
+    header_to_writer(writer, header)
+    start = writer.tell()
+    struct_to_writer(writer, message)
+    header.body_size = writer.tell() - start
+    writer.write_at(0, header_to_binary(header))
+    return writer.getvalue()
@@ -13,7 +13,6 @@ import itertools
 from datetime import datetime, timedelta, MAXYEAR, tzinfo
 
 from my_opcua.ua import status_codes
-from my_opcua.ua import ObjectIds
 from my_opcua.ua.uaerrors import UaError
 from my_opcua.ua.uaerrors import UaStatusCodeError
 from my_opcua.ua.uaerrors import UaStringParsingError
@@ -486,6 +485,9 @@ class QualifiedName(FrozenClass):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash((self.NamespaceIndex, self.Name))
+
     def __lt__(self, other):
         if not isinstance(other, QualifiedName):
             raise TypeError("Cannot compare QualifiedName and {0}".format(other))
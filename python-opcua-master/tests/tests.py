@@ -6,7 +6,7 @@ sys.path.insert(0, ".")
 
 
 from tests_cmd_lines import TestCmdLines
-from tests_server import TestServer, TestServerCaching, TestServerStartError
+from tests_server import TestServer, TestServerCaching, TestServerSnapshot, TestServerStartError
 from tests_client import TestClient
 from tests_standard_address_space import StandardAddressSpaceTests
 from tests_unit import TestUnit, TestMaskEnum
@@ -126,6 +126,14 @@ class TestClient(unittest.TestCase, CommonTests, SubscriptionTests, XmlTests):
         uaclt.disconnect_socket()
         self.assertFalse(uaclt._thread.is_alive())
 
+    def test_prepared_call_method(self):
+        o = self.clt.get_objects_node()
+        call = o.prepare_call_method("2:ServerMethod", 2.1)
+        self.assertEqual(call.call(), 4.2)
+        self.assertEqual(call.call(), 4.2)
+        call = o.prepare_call_method("2:ServerMethodArray", "sin", ua.Variant(0.0))
+        self.assertEqual(call.call(), 0.0)
+
     def test_custom_enum_struct(self):
         self.ro_clt.load_type_definitions()
         ns = self.ro_clt.get_namespace_index('http://yourorganisation.org/struct_enum_example/')
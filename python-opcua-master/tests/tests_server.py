@@ -1,12 +1,13 @@
 import unittest
 import os
-import shelve
+import sys
 import time
+import threading
 from enum import Enum, EnumMeta
 
 from tests_common import CommonTests, add_server_methods
 from tests_xml import XmlTests
-from tests_subscriptions import SubscriptionTests
+from tests_subscriptions import SubscriptionTests, MySubHandler2
 from datetime import timedelta, datetime
 from tempfile import NamedTemporaryFile
 
@@ -18,6 +19,8 @@ from opcua import uamethod
 from opcua.common.event_objects import BaseEvent, AuditEvent, AuditChannelEvent, AuditSecurityEvent, AuditOpenSecureChannelEvent
 from opcua.common import ua_utils
 from opcua.server.registration_service import RegistrationService
+from opcua.server.change_journal import ChangeReader
+from opcua.server.standard_address_space import standard_address_space
 
 
 port_num = 48540
@@ -191,6 +194,322 @@ class TestServer(unittest.TestCase, CommonTests, SubscriptionTests, XmlTests):
         self.assertTrue(o in nodes)
         self.assertEqual(m.get_parent(), o)
 
+    def test_value_callback_outside_lock(self):
+        aspace = self.srv.iserver.aspace
+        var = self.opc.get_objects_node().add_variable(3, 'CallbackVariable', 1.0)
+        results = []
+
+        def read_from_thread():
+            results.append(aspace.get_attribute_value(var.nodeid, ua.AttributeIds.DisplayName))
+
+        def value_callback():
+            # address space must be readable and writable from other threads while a callback runs
+            thread = threading.Thread(target=read_from_thread)
+            thread.start()
+            thread.join(2)
+            return ua.DataValue(ua.Variant(2.0))
+
+        aspace[var.nodeid].attributes[ua.AttributeIds.Value].value_callback = value_callback
+        self.assertEqual(var.get_value(), 2.0)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].Value.Value.Text, 'CallbackVariable')
+
+    def test_value_callback_sampling(self):
+        var = self.opc.get_objects_node().add_variable(3, 'SampledVariable', 0)
+        values = [0]
+        threads = []
+
+        def value_callback():
+            threads.append(threading.current_thread())
+            return ua.DataValue(ua.Variant(values[0], ua.VariantType.Int64))
+
+        self.opc.set_attribute_value_callback(var.nodeid, value_callback)
+        handler = MySubHandler2()
+        sub = self.opc.create_subscription(20, handler)
+        sub.subscribe_data_change(var)
+
+        def wait_for(nb):
+            for _ in range(100):
+                if len(handler.results) >= nb:
+                    break
+                time.sleep(0.02)
+
+        # no write, the new values are found by sampling the callback
+        for val in (1, 2):
+            wait_for(val)
+            values[0] = val
+        wait_for(3)
+        time.sleep(0.1)
+        self.assertEqual([val for _, val in handler.results], [0, 1, 2])
+        sub.delete()
+        self.assertEqual(self.srv.iserver.subscription_service.sampler._groups, {})
+        # the first value is read when the item is created, then samples are read off the loop
+        self.assertGreater(len(threads), 3)
+        self.assertNotIn(self.srv.iserver.loop, threads[1:])
+
+    def test_datachange_coalesced(self):
+        objects = self.opc.get_objects_node()
+        latest = objects.add_variable(3, 'CoalescedVariable', 0)
+        every = objects.add_variable(3, 'QueuedVariable', 0)
+        handler = MySubHandler2()
+        sub = self.opc.create_subscription(200, handler)
+        sub.subscribe_data_change(latest, queuesize=1)
+        sub.subscribe_data_change(every)
+
+        def results(node):
+            return [val for n, val in handler.results if n == node]
+
+        for _ in range(100):
+            if len(handler.results) >= 2:
+                break
+            time.sleep(0.02)
+        for val in range(1, 21):
+            latest.set_value(val)
+            every.set_value(val)
+        for _ in range(100):
+            if results(latest)[-1:] == [20] and results(every)[-1:] == [20]:
+                break
+            time.sleep(0.02)
+        # writes between two publish ticks are coalesced to the latest value
+        self.assertLessEqual(len(results(latest)), 3)
+        self.assertEqual(results(latest), sorted(results(latest)))
+        self.assertEqual(results(every), list(range(21)))
+        sub.delete()
+        for node in (latest, every):
+            self.assertIsNone(self.srv.iserver.aspace.get(node.nodeid).attributes[ua.AttributeIds.Value].journal)
+
+    def test_datachange_deadband(self):
+        def make_range(low, high):
+            rng = ua.Range()
+            rng.Low, rng.High = low, high
+            return rng
+
+        objects = self.opc.get_objects_node()
+        analog = objects.add_variable(3, 'DeadbandAnalog', 0.0)
+        eurange = analog.add_property(0, 'EURange', make_range(0, 200))
+        array = objects.add_variable(3, 'DeadbandArray', [0.0, 0.0])
+        handler = MySubHandler2()
+        sub = self.opc.create_subscription(20, handler)
+        # 1% of the EURange
+        sub.deadband_monitor(analog, 1, deadbandtype=ua.DeadbandType.Percent)
+        sub.deadband_monitor(array, 1)
+        with self.assertRaises(ua.UaStatusCodeError):
+            sub.deadband_monitor(array, 1, deadbandtype=ua.DeadbandType.Percent)
+
+        def wait_for(node, values):
+            for _ in range(100):
+                if [val for n, val in handler.results if n == node] == values:
+                    break
+                time.sleep(0.02)
+            self.assertEqual([val for n, val in handler.results if n == node], values)
+
+        # changes are compared to the last reported value
+        for val in (1.0, 2.5, 3.0, 5.0):
+            analog.set_value(val)
+        wait_for(analog, [0.0, 2.5, 5.0])
+        eurange.set_value(make_range(0, 1000))
+        for val in (10.0, 16.0):
+            analog.set_value(val)
+        wait_for(analog, [0.0, 2.5, 5.0, 16.0])
+        for val in ([0.5, 0.0], [0.5, 1.5], [0.5, 1.5, 0.0]):
+            array.set_value(val)
+        wait_for(array, [[0.0, 0.0], [0.5, 1.5], [0.5, 1.5, 0.0]])
+        sub.delete()
+        self.assertEqual(eurange.get_value().High, 1000)
+
+        # the EURange property, or the whole variable, is deleted while monitored
+        sub = self.opc.create_subscription(20, handler)
+        sub.deadband_monitor(analog, 1, deadbandtype=ua.DeadbandType.Percent)
+        eurange.delete()
+        analog.set_value(20.0)
+        wait_for(analog, [0.0, 2.5, 5.0, 16.0, 16.0, 20.0])
+        sub.delete()
+        deleted = objects.add_variable(3, 'DeadbandDeleted', 0.0)
+        deleted.add_property(0, 'EURange', make_range(0, 200))
+        sub = self.opc.create_subscription(20, handler)
+        sub.deadband_monitor(deleted, 1, deadbandtype=ua.DeadbandType.Percent)
+        self.opc.delete_nodes([deleted], recursive=True)
+        sub.delete()
+
+    def test_browse_new_reference_subtype(self):
+        objects = self.opc.get_objects_node()
+        folder = objects.add_folder(3, "RefTypeFolder")
+        children = [folder.add_variable(3, "Child{0}".format(i), i) for i in range(5)]
+        # subtype closure of Organizes is cached by the first browse
+        self.assertEqual(folder.get_children(refs=ua.ObjectIds.Organizes), [])
+        reftype = self.opc.get_node(ua.ObjectIds.Organizes).add_reference_type(3, "MyOrganizes")
+        target = objects.add_object(3, "RefTypeTarget")
+        folder.add_reference(target, reftype)
+        self.assertEqual(folder.get_children(refs=ua.ObjectIds.Organizes), [target])
+        # references of different types keep the order they were added in
+        self.assertEqual(folder.get_children(), children + [target])
+
+    def test_modify_event_filter_invalid(self):
+        sub = self.opc.create_subscription(100, MySubHandler2())
+        handle = sub.subscribe_events()
+        mdata = self.srv.iserver.subscription_service.subscriptions[sub.subscription_id].monitored_item_srv._monitored_items[handle]
+        evfilter, select_fields = mdata.filter, mdata.select_fields
+        invalid = ua.EventFilter()
+        element = ua.ContentFilterElement()
+        element.FilterOperator = ua.FilterOperator.Equals
+        invalid.WhereClause.Elements = [element]
+        item = ua.MonitoredItemModifyRequest()
+        item.MonitoredItemId = handle
+        item.RequestedParameters.Filter = invalid
+        params = ua.ModifyMonitoredItemsParameters()
+        params.SubscriptionId = sub.subscription_id
+        params.ItemsToModify = [item]
+        [result] = self.srv.iserver.subscription_service.modify_monitored_items(params)
+        self.assertEqual(result.StatusCode.value, ua.StatusCodes.BadFilterOperandCountMismatch)
+        # the item keeps its previous filter
+        self.assertIs(mdata.filter, evfilter)
+        self.assertIs(mdata.select_fields, select_fields)
+        sub.delete()
+
+    def test_service_counters(self):
+        before = self.srv.iserver.service_counters()["Read"]
+        other = self.discovery.iserver.service_counters()["Read"]
+        client = Client(self.srv.endpoint.geturl())
+        client.connect()
+        try:
+            client.get_objects_node().get_browse_name()
+        finally:
+            client.disconnect()
+        # counters are kept per server
+        self.assertEqual(self.srv.iserver.service_counters()["Read"], before + 1)
+        self.assertEqual(self.discovery.iserver.service_counters()["Read"], other)
+
+    def test_concurrent_browse_add_references(self):
+        objects = self.opc.get_objects_node()
+        folder = objects.add_folder(3, "ConcurrentFolder")
+        targets = [objects.add_object(3, "ConcurrentTarget{0}".format(i)) for i in range(300)]
+        reftypes = [ua.ObjectIds.Organizes, ua.ObjectIds.HasComponent, ua.ObjectIds.HasProperty,
+                    ua.ObjectIds.HasNotifier, ua.ObjectIds.HasEventSource, ua.ObjectIds.FromState]
+        errors = []
+        done = threading.Event()
+
+        def write():
+            try:
+                for i, target in enumerate(targets):
+                    folder.add_reference(target, reftypes[i % len(reftypes)], bidirectional=False)
+                    if i % 3 == 2:
+                        folder.delete_reference(targets[i - 1], reftypes[(i - 1) % len(reftypes)], bidirectional=False)
+            finally:
+                done.set()
+
+        def read():
+            while not done.is_set():
+                try:
+                    folder.get_referenced_nodes(direction=ua.BrowseDirection.Forward)
+                    folder.get_children()
+                except Exception as ex:
+                    errors.append(ex)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        # switch threads as often as possible to interleave browsing with the writes
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+        expected = set(target.nodeid for i, target in enumerate(targets) if i % 3 != 1)
+        nodeids = set(node.nodeid for node in folder.get_referenced_nodes(direction=ua.BrowseDirection.Forward))
+        self.assertEqual(nodeids & set(target.nodeid for target in targets), expected)
+
+    def test_translate_browse_path_reference_type(self):
+        objects = self.opc.get_objects_node()
+        obj = objects.add_object(3, "PathObject")
+        var = obj.add_variable(3, "PathVariable", 1)
+        self.assertEqual(objects.get_child(["3:PathObject", "3:PathVariable"]), var)
+        # a cached path is dropped when references change
+        self.assertEqual(objects.get_child(["3:PathObject", "3:PathVariable"]), var)
+        var.delete()
+        with self.assertRaises(ua.UaStatusCodeError):
+            objects.get_child(["3:PathObject", "3:PathVariable"])
+        # non hierarchical references are not followed by get_child
+        target = objects.add_object(3, "PathTarget")
+        obj.add_reference(target, ua.ObjectIds.GeneratesEvent, bidirectional=False)
+        with self.assertRaises(ua.UaStatusCodeError):
+            obj.get_child("3:PathTarget")
+        # neither are inverse references, unless requested
+        var = obj.add_variable(3, "PathVariable", 1)
+        with self.assertRaises(ua.UaStatusCodeError):
+            var.get_child("3:PathObject")
+        path = ua.BrowsePath()
+        path.StartingNode = var.nodeid
+        path.RelativePath = var._make_relative_path(["3:PathObject"])
+        path.RelativePath.Elements[0].IsInverse = True
+        result = self.opc.iserver.view_service.translate_browsepaths_to_nodeids([path])[0]
+        self.assertEqual(result.Targets[0].TargetId, obj.nodeid)
+        path.RelativePath.Elements[0].ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasComponent)
+        path.RelativePath.Elements[0].IncludeSubtypes = False
+        result = self.opc.iserver.view_service.translate_browsepaths_to_nodeids([path])[0]
+        self.assertEqual(result.Targets[0].TargetId, obj.nodeid)
+        path.RelativePath.Elements[0].ReferenceTypeId = ua.NodeId(ua.ObjectIds.Aggregates)
+        result = self.opc.iserver.view_service.translate_browsepaths_to_nodeids([path])[0]
+        self.assertEqual(result.StatusCode.value, ua.StatusCodes.BadNoMatch)
+
+    def test_delete_subtree_references(self):
+        objects = self.opc.get_objects_node()
+        fold = objects.add_folder(3, "SubtreeFolder")
+        obj = fold.add_object(3, "SubtreeObject")
+        var = obj.add_variable(3, "SubtreeVariable", 1)
+        other = objects.add_object(3, "SubtreeOther")
+        other.add_reference(var, ua.ObjectIds.GeneratesEvent, bidirectional=False)
+        aspace = self.opc.iserver.aspace
+        self.assertIn(other.nodeid, aspace.get_referencing_nodes(var.nodeid))
+        self.assertIn(obj.nodeid, aspace.get_referencing_nodes(var.nodeid))
+        results = self.opc.delete_nodes([fold], recursive=True)
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].is_good())
+        for node in (fold, obj, var):
+            self.assertNotIn(node.nodeid, aspace)
+            self.assertEqual(aspace.get_referencing_nodes(node.nodeid), [])
+        self.assertNotIn(fold, objects.get_children())
+        self.assertNotIn(var.nodeid, [ref.NodeId for ref in other.get_references()])
+
+    def test_add_references_bulk(self):
+        objects = self.opc.get_objects_node()
+        source = objects.add_object(3, "BulkSource")
+        target = objects.add_object(3, "BulkTarget")
+
+        def addref(forward):
+            ref = ua.AddReferencesItem()
+            ref.SourceNodeId = source.nodeid
+            ref.TargetNodeId = target.nodeid
+            ref.ReferenceTypeId = ua.NodeId(ua.ObjectIds.GeneratesEvent)
+            ref.IsForward = forward
+            return ref
+
+        isession = self.opc.iserver.isession
+        results = isession.add_references([addref(True), addref(True)])
+        self.assertEqual([result.value for result in results], [ua.StatusCodes.Good, ua.StatusCodes.Good])
+        results = isession.add_references([addref(False)])
+        self.assertEqual(results[0].value, ua.StatusCodes.BadReferenceNotAllowed)
+        self.assertEqual(source.get_referenced_nodes(ua.ObjectIds.GeneratesEvent), [target])
+        # with bulk, duplicates and conflicts are dropped once the batch is added
+        results = isession.add_references([addref(False), addref(True), addref(True)], bulk=True)
+        self.assertEqual([result.value for result in results], [ua.StatusCodes.Good] * 3)
+        self.assertEqual(source.get_referenced_nodes(ua.ObjectIds.GeneratesEvent), [target])
+        self.assertEqual(source.get_referenced_nodes(ua.ObjectIds.GeneratesEvent, ua.BrowseDirection.Inverse), [])
+
+    def test_generate_nodeid(self):
+        aspace = self.opc.iserver.aspace
+        idx = 11  # namespace not used by other tests
+        objects = self.opc.get_objects_node()
+        objects.add_object(ua.NodeId(1000, idx), "GeneratedNodeIdMax")
+        nodeid = aspace.generate_nodeid(idx)
+        self.assertEqual(nodeid, ua.NodeId(1001, idx))
+        nodeids = aspace.reserve_nodeids(3, idx)
+        self.assertEqual(nodeids, [ua.NodeId(i, idx) for i in (1002, 1003, 1004)])
+        # reserved ids are not returned again, even if they are not used
+        self.assertEqual(objects.add_object(idx, "GeneratedNodeId").nodeid, ua.NodeId(1005, idx))
+
     # This should work for following BaseEvent tests to work (maybe to write it a bit differentlly since they are not independent)
     def test_get_event_from_type_node_BaseEvent(self):
         ev = opcua.common.events.get_event_obj_from_type_node(opcua.Node(self.opc.iserver.isession, ua.NodeId(ua.ObjectIds.BaseEventType)))
@@ -587,7 +906,6 @@ def check_custom_type(test, type, base_type):
 
 class TestServerCaching(unittest.TestCase):
     def runTest(self):
-        return # FIXME broken
         tmpfile = NamedTemporaryFile()
         path = tmpfile.name
         tmpfile.close()
@@ -595,19 +913,88 @@ class TestServerCaching(unittest.TestCase):
         # create cache file
         server = Server(shelffile=path)
 
-        # modify cache content
+        # modify a standard node and add user nodes, then write them back
         id = ua.NodeId(ua.ObjectIds.Server_ServerStatus_SecondsTillShutdown)
-        s = shelve.open(path, "w", writeback=True)
-        s[id.to_string()].attributes[ua.AttributeIds.Value].value = ua.DataValue(123)
-        s.close()
+        server.get_node(id).set_value(123)
+        idx = server.register_namespace("http://cache.test")
+        obj = server.get_objects_node().add_object(idx, "CachedObject")
+        var = obj.add_variable(idx, "CachedVariable", 7.5)
+        server.iserver.sync_address_space()
 
         # ensure that we are actually loading from the cache
         server = Server(shelffile=path)
+        self.assertEqual(type(server.iserver.aspace._nodes).__name__, "NodeStore")
+        self.assertEqual(server.get_node(id).get_value(), 123)
+        self.assertEqual(server.get_node(var.nodeid).get_value(), 7.5)
+        self.assertIn(var, server.get_node(obj.nodeid).get_children())
+        self.assertIn(obj.nodeid, list(server.iserver.aspace.keys()))
+
+        # callbacks and journals of the running server are not written, nor unchanged nodes
+        server.set_attribute_value_callback(var.nodeid, lambda: ua.DataValue(7.5))
+        server.iserver.aspace.watch_attribute(id, ua.AttributeIds.Value, ChangeReader())
+        server.get_node(id).set_value(123)
+        server.iserver.sync_address_space()
+        size = os.path.getsize(path)
+        for _ in range(3):
+            server.get_node(id).get_value()
+            server.iserver.sync_address_space()
+        self.assertEqual(os.path.getsize(path), size)
+
+        # deleted nodes stay deleted, dump sees all nodes
+        server.delete_nodes([obj], recursive=True)
+        server.iserver.sync_address_space()
+        server.iserver.aspace._nodes.compact()
+        server = Server(shelffile=path)
+        self.assertNotIn(var.nodeid, server.iserver.aspace)
+        self.assertEqual(server.get_node(id).get_value(), 123)
+        self.assertIsNone(server.iserver.aspace.get(id).attributes[ua.AttributeIds.Value].journal)
+        dump = path + ".dump"
+        server.iserver.dump_address_space(dump)
+        server.iserver.load_address_space(dump)
         self.assertEqual(server.get_node(id).get_value(), 123)
 
+        os.remove(dump)
         os.remove(path)
 
 
+class TestServerSnapshot(unittest.TestCase):
+    def runTest(self):
+        tmpfile = NamedTemporaryFile()
+        path = tmpfile.name
+        tmpfile.close()
+
+        # create snapshot file
+        server = Server(snapshotfile=path)
+        self.assertTrue(os.path.isfile(path))
+
+        # modify snapshot content
+        id = ua.NodeId(ua.ObjectIds.Server_ServerStatus_SecondsTillShutdown)
+        server.get_node(id).set_value(123, ua.VariantType.UInt32)
+        schema = standard_address_space.schema_hash()
+        server.iserver.aspace.make_snapshot(path, schema)
+
+        # ensure that we are actually loading from the snapshot
+        server = Server(snapshotfile=path)
+        self.assertEqual(type(server.iserver.aspace._nodes).__name__, "SnapshotNodes")
+        self.assertEqual(server.get_node(id).get_value(), 123)
+        obj = server.get_objects_node().add_object(2, "SnapshotObject")
+        self.assertEqual(server.get_objects_node().get_child("2:SnapshotObject"), obj)
+        server.delete_nodes([obj])
+        self.assertNotIn(obj.nodeid, server.iserver.aspace)
+
+        # a snapshot of another schema is rebuilt
+        server.iserver.aspace.make_snapshot(path, b"another schema")
+        server = Server(snapshotfile=path)
+        self.assertNotEqual(server.get_node(id).get_value(), 123)
+        server = Server(snapshotfile=path)
+        self.assertEqual(type(server.iserver.aspace._nodes).__name__, "SnapshotNodes")
+
+        os.remove(path)
+
+        # without snapshotfile, the address space is built from the generated code
+        self.assertEqual(type(Server().iserver.aspace._nodes), dict)
+
+
 class TestServerStartError(unittest.TestCase):
 
     def test_port_in_use(self):
@@ -2,8 +2,15 @@
 #! /usr/bin/env python
 import logging
 import io
+import os
+import sys
+import subprocess
+import struct
+import threading
+import time
 from datetime import datetime
 import unittest
+from unittest.mock import patch
 from collections import namedtuple
 import uuid
 
@@ -12,14 +19,23 @@ from opcua.ua.ua_binary import extensionobject_from_binary
 from opcua.ua.ua_binary import extensionobject_to_binary
 from opcua.ua.ua_binary import nodeid_to_binary, variant_to_binary, _reshape, variant_from_binary, nodeid_from_binary
 from opcua.ua.ua_binary import struct_to_binary, struct_from_binary
+from opcua.ua.ua_binary import header_from_binary, uatcp_to_binary
+from opcua.ua.ua_binary import _struct_to_binary_interpreted, _struct_from_binary_interpreted
 from opcua.ua import flatten, get_shape
-from opcua.server.internal_subscription import WhereClauseEvaluator
+from opcua.server.internal_subscription import WhereClauseEvaluator, MonitoredItemQueue
+from opcua.server.event_filter import compile_where_clause, compile_select_clauses
 from opcua.common.event_objects import BaseEvent
 from opcua.common.ua_utils import string_to_variant, variant_to_string, string_to_val, val_to_string
 from opcua.common.xmlimporter import XmlImporter
 from opcua.ua.uatypes import _MaskEnum
 from opcua.common.structures import StructGenerator
 from opcua.common.connection import MessageChunk
+from opcua.client.ua_client import PreparedRequest
+from opcua.server.uaprocessor import UaProcessor, new_service_table, register_service
+from opcua.server.binary_server_asyncio import OPCUAProtocol
+from opcua.server.timing_wheel import TimingWheel
+from opcua.server.change_journal import ChangeJournal, ChangeReader
+from opcua.common.utils import ThreadLoop
 
 
 class TestUnit(unittest.TestCase):
@@ -48,6 +64,54 @@ class TestUnit(unittest.TestCase):
         self.assertEqual(v, v2)
         self.assertTrue(v2.is_array)
 
+    def test_lazy_imports(self):
+        # run in a new interpreter, modules are already imported here
+        code = "import sys, opcua; from opcua import Client; print(' '.join(sys.modules))"
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        modules = subprocess.check_output([sys.executable, "-c", code], env=env).decode().split()
+        self.assertTrue(any(m.endswith("client.client") for m in modules))
+        # server, crypto and xml modules are slow to import and not needed until used
+        for name in ("server.server", "server.internal_server", "crypto.uacrypto", "cryptography",
+                     "asyncio", "lxml.objectify", "common.xmlimporter", "IPython"):
+            self.assertFalse(any(m == name or m.endswith("." + name) for m in modules), name)
+
+        code = "import sys, opcua.ua; print(' '.join(sys.modules))"
+        modules = subprocess.check_output([sys.executable, "-c", code], env=env).decode().split()
+        for name in ("ua.object_ids", "ua.uaprotocol_auto", "ua.uaprotocol_hand"):
+            self.assertFalse(any(m.endswith(name) for m in modules), name)
+        self.assertEqual(ua.ObjectIds.Server, 2253)
+        # uaprotocol_hand classes override uaprotocol_auto ones
+        self.assertTrue(ua.ObjectAttributes.__module__.endswith("uaprotocol_hand"))
+        self.assertIn("ReadRequest", dir(ua))
+        with self.assertRaises(AttributeError):
+            ua.NotAProtocolClass
+        # submodules are reached as attributes, as when the package imported them all
+        code = "from opcua import ua; print(ua.ua_binary.Primitives.Int32.size)"
+        self.assertEqual(subprocess.check_output([sys.executable, "-c", code], env=env).split(), [b"4"])
+
+    def test_lazy_imports_call_method(self):
+        # nothing imports common.methods as a side effect in a new interpreter
+        code = "\n".join([
+            "from opcua import Server, Client, ua",
+            "server = Server()",
+            "server.set_endpoint('opc.tcp://127.0.0.1:48560')",
+            "server.start()",
+            "client = Client('opc.tcp://127.0.0.1:48560')",
+            "client.connect()",
+            "try:",
+            "    def mul(parent, x):",
+            "        return [ua.Variant(x.Value * 2, ua.VariantType.Double)]",
+            "    server.get_objects_node().add_method(2, 'mul', mul, [ua.VariantType.Double], [ua.VariantType.Double])",
+            "    o = client.get_objects_node()",
+            "    print(o.call_method('2:mul', 2.0), o.prepare_call_method('2:mul', 3.0).call())",
+            "finally:",
+            "    client.disconnect()",
+            "    server.stop()",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        out = subprocess.check_output([sys.executable, "-c", code], env=env).decode().split()
+        self.assertEqual(out[-2:], ["4.0", "6.0"])
+
     def test_structs_save_and_import(self):
         xmlpath = "tests/example.bsd"
         c = StructGenerator()
@@ -531,6 +595,257 @@ class TestUnit(unittest.TestCase):
         t4 = struct_from_binary(ua.LocalizedText, ua.utils.Buffer(struct_to_binary(t1)))
         self.assertEqual(t1, t4)
 
+    def test_compiled_struct_codecs(self):
+        # generated classes whose constructor fails: their default Guid is not defined in
+        # uaprotocol_auto, or 0 is not a member of the enum of one of their fields
+        no_default = set([
+            "DataSetMetaDataType", "DataSetReaderDataType", "DataSetWriterDataType", "FieldMetaData",
+            "FieldTargetDataType", "IdentityMappingRuleType", "JsonDataSetReaderMessageDataType",
+            "JsonDataSetWriterMessageDataType", "JsonWriterGroupMessageDataType", "ModificationInfo",
+            "PublishedDataSetDataType", "UadpDataSetReaderMessageDataType", "UadpDataSetWriterMessageDataType",
+            "UadpWriterGroupMessageDataType", "UpdateDataDetails", "UpdateEventDetails",
+            "UpdateStructureDataDetails",
+        ])
+        # hand written header whose fields have no default value
+        unpackable = set(["SequenceHeader"])
+        checked = set()
+        # all generated and hand written protocol classes
+        for name in dir(ua):
+            klass = getattr(ua, name)
+            if not isinstance(klass, type) or not hasattr(klass, "ua_types"):
+                continue
+            checked.add(name)
+            if name in no_default:
+                with self.assertRaises((NameError, ValueError), msg=name):
+                    klass()
+                continue
+            obj = klass()
+            if name in unpackable:
+                with self.assertRaises(struct.error, msg=name):
+                    struct_to_binary(obj)
+                continue
+            data = _struct_to_binary_interpreted(obj)
+            self.assertEqual(struct_to_binary(obj), data, name)
+            obj2 = struct_from_binary(klass, ua.utils.Buffer(data))
+            obj3 = _struct_from_binary_interpreted(klass, ua.utils.Buffer(data))
+            self.assertEqual(struct_to_binary(obj2), data, name)
+            self.assertEqual(_struct_to_binary_interpreted(obj3), data, name)
+        self.assertLessEqual(no_default | unpackable, checked)
+
+    def test_compiled_struct_codecs_values(self):
+        dv = ua.DataValue(ua.Variant(1.5, ua.VariantType.Double))
+        dv.SourceTimestamp = datetime.utcnow()
+        dv.ServerPicoseconds = 7
+        resp = ua.ReadResponse()
+        resp.Results = [dv, ua.DataValue(ua.Variant([1, 2], ua.VariantType.Int32))]
+        resp.ResponseHeader.ServiceResult = ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+        data = struct_to_binary(resp)
+        self.assertEqual(data, _struct_to_binary_interpreted(resp))
+        resp2 = struct_from_binary(ua.ReadResponse, ua.utils.Buffer(data))
+        self.assertEqual(resp2.ResponseHeader.Timestamp, resp.ResponseHeader.Timestamp)
+        self.assertEqual(resp2.ResponseHeader.ServiceResult.value, ua.StatusCodes.BadNodeIdUnknown)
+        self.assertEqual(resp2.Results[0].Value, dv.Value)
+        self.assertEqual(resp2.Results[0].SourceTimestamp, dv.SourceTimestamp)
+        self.assertEqual(resp2.Results[0].ServerPicoseconds, 7)
+        self.assertIsNone(resp2.Results[0].ServerTimestamp)
+        self.assertEqual(resp2.Results[1].Value.Value, [1, 2])
+
+        attrs = ua.VariableAttributes()
+        attrs.DisplayName = ua.LocalizedText("test")
+        attrs.ValueRank = -1
+        attrs2 = struct_from_binary(ua.VariableAttributes, ua.utils.Buffer(struct_to_binary(attrs)))
+        self.assertEqual(attrs2.DisplayName, attrs.DisplayName)
+        self.assertEqual(attrs2.ValueRank, -1)
+        self.assertEqual(attrs2.AccessLevel, attrs.AccessLevel)
+
+        desc = ua.ReferenceDescription()
+        desc.NodeClass = ua.NodeClass.Variable
+        desc2 = struct_from_binary(ua.ReferenceDescription, ua.utils.Buffer(struct_to_binary(desc)))
+        self.assertEqual(desc2.NodeClass, ua.NodeClass.Variable)
+        self.assertIsInstance(desc2.NodeClass, ua.NodeClass)
+
+    def test_buffer(self):
+        buf = ua.utils.Buffer(b'\x01\x02\x03\x04abcdef')
+        self.assertEqual(buf.unpack(struct.Struct("<HH")), (0x0201, 0x0403))
+        buf2 = buf.copy(3)
+        buf.skip(3)
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf2.read(3), b'abc')
+        self.assertEqual(bytes(buf.read_view(3)), b'def')
+        with self.assertRaises(ua.utils.NotEnoughData):
+            buf.read(1)
+        data = struct_to_binary(ua.QualifiedName('name', 2))
+        qname = struct_from_binary(ua.QualifiedName, ua.utils.Buffer(memoryview(data)))
+        self.assertEqual(qname, ua.QualifiedName('name', 2))
+
+    def test_writer(self):
+        w = ua.utils.Writer(size=2)
+        w.pack(struct.Struct("<H"), 0)
+        w.write(b'abcdef')
+        w.pack_at(0, struct.Struct("<H"), 6)
+        self.assertEqual(w.getvalue(), b'\x06\x00abcdef')
+        self.assertEqual(bytes(w.view(2)), b'abcdef')
+        with self.assertRaises(ua.utils.NotEnoughData):
+            w.write_at(6, b'xyz')
+        w.truncate(4)
+        self.assertEqual(w.getvalue(), b'\x06\x00ab')
+
+    def test_socket_wrapper(self):
+        class FakeSocket(object):
+            def __init__(self, data, step):
+                self.data = data
+                self.step = step
+                self.calls = 0
+
+            def recv_into(self, buf):
+                self.calls += 1
+                size = min(len(buf), self.step, len(self.data))
+                buf[:size] = self.data[:size]
+                self.data = self.data[size:]
+                return size
+
+        data = bytes(bytearray(range(256))) * 4
+        sock = FakeSocket(data, 100)
+        wrapper = ua.utils.SocketWrapper(sock, buffer_size=64)
+        views = [wrapper.read_view(24) for _ in range(30)]
+        self.assertEqual(wrapper.read(4), data[720:724])
+        # buffer was replaced several times, views must still be valid
+        self.assertEqual(b''.join(bytes(v) for v in views), data[:720])
+        big = wrapper.read_view(200)
+        self.assertEqual(bytes(big), data[724:924])
+        with self.assertRaises(ua.utils.SocketClosedException):
+            wrapper.read(101)
+
+        # many small messages are received with one call
+        sock = FakeSocket(data, 1024)
+        wrapper = ua.utils.SocketWrapper(sock)
+        for i in range(0, len(data), 8):
+            self.assertEqual(wrapper.read(8), data[i:i + 8])
+        self.assertEqual(sock.calls, 1)
+
+    def test_extension_object_length_patch(self):
+        obj = ua.UserNameIdentityToken()
+        obj.UserName = "admin"
+        obj.Password = b"pass" * 100
+        data = extensionobject_to_binary(obj)
+        buf = ua.utils.Buffer(data)
+        nodeid_from_binary(buf)
+        self.assertEqual(ua.ua_binary.Primitives.Byte.unpack(buf), 1)
+        self.assertEqual(ua.ua_binary.Primitives.Int32.unpack(buf), len(struct_to_binary(obj)))
+        obj2 = extensionobject_from_binary(ua.utils.Buffer(data))
+        self.assertEqual(obj2.Password, obj.Password)
+
+    def test_prepared_request(self):
+        request = ua.CallRequest()
+        method = ua.CallMethodRequest()
+        method.MethodId = ua.NodeId("rfr310.Scan", 4)
+        method.InputArguments = [ua.Variant(12)]
+        request.Parameters.MethodsToCall = [method]
+        prepared = PreparedRequest(request, timeout=500)
+        token = ua.NodeId(b'token', 0, ua.NodeIdType.ByteString)
+        for handle in (7, 8):
+            buf = ua.utils.Buffer(prepared.to_binary(token, handle))
+            self.assertEqual(nodeid_from_binary(buf), request.TypeId)
+            hdr = struct_from_binary(ua.RequestHeader, buf)
+            self.assertEqual(hdr.RequestHandle, handle)
+            self.assertEqual(hdr.AuthenticationToken, token)
+            self.assertEqual(hdr.TimeoutHint, 500)
+            params = struct_from_binary(ua.CallParameters, buf)
+            self.assertEqual(params.MethodsToCall[0].MethodId, method.MethodId)
+            self.assertEqual(params.MethodsToCall[0].InputArguments, method.InputArguments)
+            self.assertEqual(len(buf), 0)
+
+    def test_uaprocessor_service_table(self):
+        read = UaProcessor.default_services[ua.ObjectIds.ReadRequest_Encoding_DefaultBinary]
+        self.assertEqual(read.name, "Read")
+
+        class FakeSocket(object):
+            def get_extra_info(self, name):
+                return None
+
+        class FakeServer(object):
+            def __init__(self):
+                self.services = new_service_table()
+
+        calls = []
+
+        def handler(processor, requesthdr, algohdr, seqhdr, body):
+            calls.append((processor, requesthdr))
+            return False
+
+        server, other = FakeServer(), FakeServer()
+        typeid = ua.NodeId(1000, 2)
+        register_service(server.services, typeid, "Vendor", handler)
+        proc = UaProcessor(server, FakeSocket())
+        hdr = ua.RequestHeader()
+        self.assertFalse(proc._process_message(ua.NodeId(1000, 2), hdr, None, None, None))
+        self.assertEqual(calls, [(proc, hdr)])
+        self.assertEqual(server.services[typeid].count, 1)
+        with self.assertRaises(ua.utils.ServiceError):
+            proc._process_message(ua.NodeId(1001, 2), hdr, None, None, None)
+        # registrations and counters belong to one server
+        self.assertNotIn(typeid, UaProcessor.default_services)
+        with self.assertRaises(ua.utils.ServiceError):
+            UaProcessor(other, FakeSocket())._process_message(typeid, hdr, None, None, None)
+        self.assertIsNot(server.services[ua.ObjectIds.ReadRequest_Encoding_DefaultBinary], read)
+
+        def process():
+            for _ in range(1000):
+                proc._process_message(typeid, hdr, None, None, None)
+
+        threads = [threading.Thread(target=process) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(server.services[typeid].count, 4001)
+
+    def test_server_protocol_buffer(self):
+        class FakeTransport(object):
+            def __init__(self):
+                self.written = []
+                self.closed = False
+
+            def get_extra_info(self, name):
+                return None
+
+            def write(self, data):
+                self.written.append(data)
+
+            def close(self):
+                self.closed = True
+
+        class FakeServer(object):
+            asyncio_transports = []
+            services = new_service_table()
+
+        def feed(proto, data, step):
+            while data:
+                buf = proto.get_buffer(-1)
+                size = min(step, len(buf), len(data))
+                buf[:size] = data[:size]
+                data = data[size:]
+                proto.buffer_updated(size)
+
+        protocol = type('OPCUAProtocol', (OPCUAProtocol,), dict(
+            iserver=FakeServer(), logger=logging.getLogger(), policies=[], clients=[], buffer_size=16))
+        proto = protocol()
+        transport = FakeTransport()
+        proto.connection_made(transport)
+        hello = ua.Hello()
+        hello.EndpointUrl = "opc.tcp://localhost:4840/" + "x" * 100
+        feed(proto, uatcp_to_binary(ua.MessageType.Hello, hello) * 3, 7)
+        self.assertEqual(len(transport.written), 3)
+        ack = ua.utils.Buffer(transport.written[0])
+        self.assertEqual(header_from_binary(ack).MessageType, ua.MessageType.Acknowledge)
+
+        proto.max_message_size = 64
+        feed(proto, uatcp_to_binary(ua.MessageType.Hello, hello), 1000)
+        self.assertTrue(transport.closed)
+        err = ua.utils.Buffer(transport.written[-1])
+        self.assertEqual(header_from_binary(err).MessageType, ua.MessageType.Error)
+        self.assertEqual(struct_from_binary(ua.ErrorMessage, err).Error.value, ua.StatusCodes.BadTcpMessageTooLarge)
+
     def test_message_chunk(self):
         pol = ua.SecurityPolicy()
         chunks = MessageChunk.message_to_chunks(pol, b'123', 65536)
@@ -554,6 +869,42 @@ class TestUnit(unittest.TestCase):
             chunk.SequenceHeader.SequenceNumber = seq
             self.assertTrue(len(chunk.to_binary()) <= 28)
 
+    def test_message_chunk_buffers(self):
+        pol = ua.SecurityPolicy()
+        body = memoryview(b'0123456789' * 10)
+        chunks = MessageChunk.message_to_chunks(pol, body, 56)
+        self.assertEqual(len(chunks), 4)
+        for seq, chunk in enumerate(chunks):
+            chunk.SequenceHeader.SequenceNumber = seq
+            buffers = chunk.to_buffers()
+            self.assertEqual(len(buffers), 2)
+            self.assertIsInstance(buffers[1], memoryview)
+            self.assertEqual(b''.join(buffers), chunk.to_binary())
+
+    def test_socket_wrapper_writelines(self):
+        class FakeSocket(object):
+            def __init__(self):
+                self.data = b''
+
+            def sendmsg(self, buffers):
+                # send at most 5 bytes per call
+                data = b''.join(bytes(buf) for buf in buffers)[:5]
+                self.data += data
+                return len(data)
+
+        sock = FakeSocket()
+        ua.utils.SocketWrapper(sock).writelines([b'abc', b'', memoryview(b'defghijk'), b'l'])
+        self.assertEqual(sock.data, b'abcdefghijkl')
+
+        class FakeSocketNoSendmsg(object):
+            def sendall(self, data):
+                self.data = data
+
+        # without sendmsg, the buffers are joined
+        sock = FakeSocketNoSendmsg()
+        ua.utils.SocketWrapper(sock).writelines([b'abc', b'', memoryview(b'defghijk'), b'l'])
+        self.assertEqual(sock.data, b'abcdefghijkl')
+
     def test_null(self):
         n = ua.NodeId(b'000000', 0, nodeidtype=ua.NodeIdType.Guid)
         self.assertTrue(n.is_null())
@@ -608,6 +959,219 @@ class TestUnit(unittest.TestCase):
 
         self.assertTrue(wce.eval(ev))
 
+    def test_where_clause_operators(self):
+        def attribute(name):
+            op = ua.SimpleAttributeOperand()
+            op.BrowsePath.append(ua.QualifiedName(name, 0))
+            return op
+
+        def literal(val):
+            op = ua.LiteralOperand()
+            op.Value = ua.Variant(val)
+            return op
+
+        def element(index):
+            op = ua.ElementOperand()
+            op.Index = index
+            return op
+
+        def matches(*elements):
+            cf = ua.ContentFilter()
+            for operator, operands in elements:
+                el = ua.ContentFilterElement()
+                el.FilterOperator = operator
+                el.FilterOperands = list(operands)
+                cf.Elements.append(el)
+            return compile_where_clause(cf)(ev)
+
+        ev = BaseEvent(sourcenode=ua.NodeId(85), message="Pump 12 stopped", severity=500)
+        ev.SourceName = "Pump12"
+        op = ua.FilterOperator
+        severity = attribute("Severity")
+        self.assertTrue(matches((op.Equals, [severity, literal(500)])))
+        self.assertTrue(matches((op.IsNull, [attribute("Missing")])))
+        self.assertTrue(matches((op.GreaterThan, [severity, literal(100)])))
+        self.assertFalse(matches((op.LessThan, [severity, literal(100)])))
+        self.assertTrue(matches((op.GreaterThanOrEqual, [severity, literal(500)])))
+        self.assertTrue(matches((op.LessThanOrEqual, [severity, literal(500)])))
+        self.assertTrue(matches((op.Like, [attribute("Message"), literal("Pump [0-9]_ %")])))
+        self.assertFalse(matches((op.Like, [attribute("Message"), literal("Pump [^0-9]%")])))
+        self.assertTrue(matches((op.Between, [severity, literal(100), literal(600)])))
+        self.assertTrue(matches((op.InList, [severity, literal(1), literal(500)])))
+        self.assertTrue(matches((op.Equals, [element(1), severity]),
+                                (op.Cast, [literal("500"), literal(ua.NodeId(ua.ObjectIds.UInt16))])))
+        self.assertTrue(matches((op.OfType, [literal(ua.NodeId(ua.ObjectIds.BaseEventType))])))
+        self.assertTrue(matches((op.Equals, [element(1), literal(4)]),
+                                (op.BitwiseAnd, [severity, literal(6)])))
+        self.assertTrue(matches((op.Equals, [element(1), literal(501)]),
+                                (op.BitwiseOr, [severity, literal(1)])))
+        # elements using the following ones, with the three-valued logic of the spec
+        self.assertTrue(matches((op.And, [element(1), element(2)]),
+                                (op.Equals, [severity, literal(500)]),
+                                (op.Not, [element(3)]),
+                                (op.Equals, [attribute("SourceName"), literal("Other")])))
+        self.assertFalse(matches((op.Or, [element(1), element(2)]),
+                                 (op.Equals, [attribute("Missing"), literal(1)]),
+                                 (op.LessThan, [severity, literal(100)])))
+        self.assertFalse(matches((op.Not, [element(1)]),
+                                 (op.Equals, [attribute("Missing"), literal(1)])))
+        with self.assertRaises(ua.UaStatusCodeError):
+            matches((op.Not, [element(0)]))
+        with self.assertRaises(ua.UaStatusCodeError):
+            matches((op.Equals, [severity]))
+        # RelatedTo between type definitions is not supported rather than wrongly evaluated
+        typedef = ua.AttributeOperand()
+        typedef.NodeId = ua.NodeId(ua.ObjectIds.BaseEventType)
+        typedef.AttributeId = ua.AttributeIds.NodeId
+        with self.assertRaises(ua.UaStatusCodeError) as cm:
+            matches((op.RelatedTo, [typedef, literal(ua.NodeId(ua.ObjectIds.BaseObjectType)),
+                                    literal(ua.NodeId(ua.ObjectIds.HasEventSource)), literal(0),
+                                    literal(True), literal(True)]))
+        self.assertEqual(cm.exception.code, ua.StatusCodes.BadFilterOperatorUnsupported)
+
+    def test_select_clauses(self):
+        ev = BaseEvent(message="Message", severity=500)
+        clauses = []
+        for name in ("Severity", "Message", "Missing"):
+            op = ua.SimpleAttributeOperand()
+            op.BrowsePath.append(ua.QualifiedName(name, 0))
+            clauses.append(op)
+        self.assertEqual(compile_select_clauses(clauses)(ev), ev.to_event_fields(clauses))
+
+    def test_timing_wheel(self):
+        loop = ThreadLoop()
+        loop.start()
+        # a small wheel, so that timers go through both levels and beyond the last one
+        wheel = TimingWheel(resolution=2, slots=4, levels=2)
+        wheel.set_loop(loop)
+        fired = []
+        done = threading.Event()
+        start = time.time()
+
+        def fire(delay):
+            fired.append((delay, time.time() - start))
+            if delay == 100:
+                done.set()
+
+        try:
+            for delay in (100, 5, 30, 12, 2):
+                wheel.call_later(delay, lambda delay=delay: fire(delay))
+            wheel.call_later(20, lambda: fire(20)).cancel()
+            self.assertTrue(done.wait(5))
+        finally:
+            loop.stop()
+        self.assertEqual([delay for delay, _ in fired], [2, 5, 12, 30, 100])
+        for delay, elapsed in fired:
+            self.assertGreaterEqual(elapsed, delay / 1000.0 - 0.002)
+
+    def test_timing_wheel_clock_jump(self):
+        loop = ThreadLoop()
+        loop.start()
+        wheel = TimingWheel(resolution=10)
+        wheel.set_loop(loop)
+        fired = []
+
+        def periodic():
+            fired.append(time.time())
+            wheel.call_later(10, periodic)
+
+        real_time = time.time
+        try:
+            wheel.call_later(10, periodic)
+            time.sleep(0.1)
+            # setting the wall clock one day forward or back does not change the schedule
+            for shift in (86400, -86400):
+                with patch("time.time", lambda: real_time() + shift):
+                    nb = len(fired)
+                    time.sleep(0.1)
+                    self.assertGreater(len(fired), nb)
+                    self.assertLess(len(fired), nb + 20)
+            # a loop held up for a day fires a periodic timer once, not once per missed tick
+            with wheel._lock:
+                wheel._start -= 86400
+            nb = len(fired)
+            time.sleep(0.1)
+            self.assertGreater(len(fired), nb)
+            self.assertLess(len(fired), nb + 20)
+        finally:
+            loop.stop()
+
+    def test_monitored_item_queue(self):
+        def notification(val):
+            notif = ua.MonitoredItemNotification()
+            notif.Value = ua.DataValue(val)
+            return notif
+
+        def values(queue):
+            notifs = []
+            queue.drain(notifs)
+            return [(notif.Value.Value.Value, notif.Value.StatusCode.value) for notif in notifs]
+
+        overflow = MonitoredItemQueue.overflow_bits
+        queue = MonitoredItemQueue(3, overflow=True)
+        notifs = [notification(val) for val in range(5)]
+        for notif in notifs:
+            queue.append(notif)
+        self.assertEqual(values(queue), [(2, overflow), (3, 0), (4, 0)])
+        # enqueued values are not modified
+        self.assertEqual(notifs[2].Value.StatusCode.value, 0)
+        queue = MonitoredItemQueue(3, discard_oldest=False, overflow=True)
+        for val in range(5):
+            queue.append(notification(val))
+        self.assertEqual(values(queue), [(0, 0), (1, 0), (4, overflow)])
+        queue = MonitoredItemQueue(1, overflow=True)
+        for val in range(5):
+            queue.append(notification(val))
+        self.assertEqual(values(queue), [(4, 0)])
+        queue = MonitoredItemQueue(0, overflow=True)
+        for val in range(5):
+            queue.append(notification(val))
+        self.assertEqual(len(queue), 5)
+        self.assertEqual(values(queue), [(val, 0) for val in range(5)])
+        self.assertEqual(len(queue), 0)
+        # a modified monitored item resizes its queued notifications
+        for policy, expected in ((True, [(3, overflow), (4, 0)]), (False, [(0, 0), (4, overflow)])):
+            queue = MonitoredItemQueue(0, overflow=True)
+            for val in range(5):
+                queue.append(notification(val))
+            queue.resize(2, discard_oldest=policy)
+            self.assertEqual(values(queue), expected)
+        queue.append(notification(0))
+        queue.resize(3)
+        for val in range(1, 5):
+            queue.append(notification(val))
+        self.assertEqual(values(queue), [(2, overflow), (3, 0), (4, 0)])
+
+
+    def test_change_journal_readers(self):
+        busy, quiet = ChangeJournal(), ChangeJournal()
+        first, second = ChangeReader(), ChangeReader()
+        busy.add_reader(first)
+        quiet.add_reader(second)
+        for val in range(ChangeJournal.max_size * 2):
+            busy.append(val)
+        quiet.append(-1)
+        quiet.append(-2)
+        # a reader only reads the journals it watches, and those of busy attributes keep the latest changes
+        self.assertEqual(second.read(), [(quiet, [-1, -2], False)])
+        [(journal, changes, lost)] = first.read()
+        self.assertIs(journal, busy)
+        self.assertTrue(lost)
+        self.assertEqual(changes[-1], ChangeJournal.max_size * 2 - 1)
+        self.assertLessEqual(len(changes), ChangeJournal.max_size + ChangeJournal.min_trim_size)
+        self.assertEqual(first.read(), [])
+        busy.append("next")
+        self.assertEqual(first.read(), [(busy, ["next"], False)])
+        self.assertTrue(busy.remove_reader(first))
+        # a removed reader is not marked dirty any more, however often it read the journal
+        quiet.add_reader(first)
+        quiet.read(first)
+        quiet.read(first)
+        self.assertFalse(quiet.remove_reader(first))
+        quiet.append(-3)
+        self.assertNotIn(quiet, first._dirty)
+        self.assertEqual(second.read(), [(quiet, [-3], False)])
+
 
 class TestMaskEnum(unittest.TestCase):
     class MyEnum(_MaskEnum):
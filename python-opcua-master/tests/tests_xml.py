@@ -5,6 +5,8 @@ import logging
 from opcua import ua
 from opcua import uamethod
 from opcua.ua import uaerrors
+from opcua.common.xmlexporter import XmlExporter
+from opcua.common.xmlparser import XMLParser
 
 
 logger = logging.getLogger("opcua.common.xmlimporter")
@@ -195,6 +197,28 @@ class XmlTests(object):
         self.assertEqual(dtype, o2.get_data_type())
         self.assertEqual(dv.Value, o2.get_data_value().Value)
 
+    def test_xml_export_batches(self):
+        o = self.opc.nodes.objects.add_object(2, "xmlexportbatches")
+        nodes = [o]
+        for i in range(5):
+            nodes.append(o.add_variable(2, "xmlexportbatches{0}".format(i), i * 1.5))
+        exp = XmlExporter(self.opc)
+        exp.batch_size = 2
+        exp.export_xml(nodes, "tmp_test_export-batches.xml")
+        exp = XmlExporter(self.opc)
+        exp.build_etree(nodes)
+        exp.write_xml("tmp_test_export-batches-etree.xml")
+        with open("tmp_test_export-batches.xml") as f1, open("tmp_test_export-batches-etree.xml") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+        self.opc.delete_nodes(nodes)
+        new_nodes = self.opc.import_xml("tmp_test_export-batches.xml")
+        self.assertEqual(len(new_nodes), 6)
+        for i in range(5):
+            var = o.get_child("2:xmlexportbatches{0}".format(i))
+            self.assertEqual(var.get_value(), i * 1.5)
+            self.assertEqual(var.get_parent(), o)
+
     def test_xml_bool(self):
         o = self.opc.nodes.objects.add_variable(2, "xmlbool", True)
         self._test_xml_var_type(o, "bool")
@@ -355,6 +379,95 @@ class XmlTests(object):
         self.assertEqual(var_string.get_value(), None)
         self.assertEqual(var_bool.get_value(), None)
 
+    def test_xml_import_children_first(self):
+        # nodes are written before their parent, they must be reordered
+        xml = """
+        <UANodeSet xmlns="http://opcfoundation.org/UA/2011/03/UANodeSet.xsd" xmlns:uax="http://opcfoundation.org/UA/2008/02/Types.xsd">
+          <Aliases>
+            <Alias Alias="Double">i=11</Alias>
+          </Aliases>
+          <UAVariable BrowseName="2:OrderVariable" DataType="Double" NodeId="ns=2;s=test_xml.order.variable">
+            <DisplayName>OrderVariable</DisplayName>
+            <References>
+              <Reference IsForward="false" ReferenceType="HasComponent">ns=2;s=test_xml.order.child</Reference>
+              <Reference ReferenceType="HasTypeDefinition">i=63</Reference>
+            </References>
+            <Value>
+              <uax:Double>4.5</uax:Double>
+            </Value>
+          </UAVariable>
+          <UAObject BrowseName="2:OrderChild" NodeId="ns=2;s=test_xml.order.child">
+            <DisplayName>OrderChild</DisplayName>
+            <References>
+              <Reference IsForward="false" ReferenceType="Organizes">ns=2;s=test_xml.order.parent</Reference>
+              <Reference ReferenceType="HasTypeDefinition">i=61</Reference>
+            </References>
+          </UAObject>
+          <UAObject BrowseName="2:OrderParent" NodeId="ns=2;s=test_xml.order.parent">
+            <DisplayName>OrderParent</DisplayName>
+            <References>
+              <Reference IsForward="false" ReferenceType="Organizes">i=85</Reference>
+              <Reference ReferenceType="HasTypeDefinition">i=61</Reference>
+            </References>
+          </UAObject>
+        </UANodeSet>
+        """
+        new_nodes = self.opc.import_xml(xmlstring=xml)
+        self.assertEqual(len(new_nodes), 3)
+        var = self.opc.get_objects_node().get_child(["2:OrderParent", "2:OrderChild", "2:OrderVariable"])
+        self.assertEqual(var.nodeid, ua.NodeId("test_xml.order.variable", 2))
+        self.assertEqual(var.get_value(), 4.5)
+
+    def test_xml_import_failed_node(self):
+        # the second node reuses the NodeId of the first one
+        xml = """
+        <UANodeSet xmlns="http://opcfoundation.org/UA/2011/03/UANodeSet.xsd">
+          <UAObject BrowseName="2:FailFirst" NodeId="ns=2;s=test_xml.fail.first">
+            <DisplayName>FailFirst</DisplayName>
+            <References>
+              <Reference IsForward="false" ReferenceType="Organizes">i=85</Reference>
+              <Reference ReferenceType="HasTypeDefinition">i=61</Reference>
+            </References>
+          </UAObject>
+          <UAObject BrowseName="2:FailDuplicate" NodeId="ns=2;s=test_xml.fail.first">
+            <DisplayName>FailDuplicate</DisplayName>
+            <References>
+              <Reference IsForward="false" ReferenceType="Organizes">i=85</Reference>
+              <Reference ReferenceType="HasNotifier">i=2253</Reference>
+            </References>
+          </UAObject>
+          <UAObject BrowseName="2:FailLast" NodeId="ns=2;s=test_xml.fail.last">
+            <DisplayName>FailLast</DisplayName>
+            <References>
+              <Reference IsForward="false" ReferenceType="Organizes">i=85</Reference>
+            </References>
+          </UAObject>
+        </UANodeSet>
+        """
+        with self.assertRaises(uaerrors.UaStatusCodeError):
+            self.opc.import_xml(xmlstring=xml)
+        # the import stops at the failed node, which does not get its references
+        first = self.opc.get_node(ua.NodeId("test_xml.fail.first", 2))
+        self.assertEqual(first.get_browse_name(), ua.QualifiedName("FailFirst", 2))
+        self.assertEqual(first.get_referenced_nodes(ua.ObjectIds.HasNotifier), [])
+        self.assertIn(first, self.opc.get_objects_node().get_children())
+        last = self.opc.get_node(ua.NodeId("test_xml.fail.last", 2))
+        with self.assertRaises(uaerrors.BadNodeIdUnknown):
+            last.get_browse_name()
+        self.opc.delete_nodes([first])
+
+    def test_xml_parser_single_use(self):
+        parser = XMLParser("tests/custom_nodes.xml")
+        self.assertTrue(parser.get_node_datas())
+        # the file is closed once read, and it is not read again
+        self.assertTrue(parser._source.closed)
+        with self.assertRaises(ua.UaError):
+            parser.get_node_datas()
+        parser = XMLParser("tests/custom_nodes.xml")
+        parser.get_used_namespaces()
+        parser.close()
+        self.assertTrue(parser._source.closed)
+
     def _test_xml_var_type(self, node, typename, test_equality=True):
         dtype = node.get_data_type()
         dv = node.get_data_value()
@@ -23,6 +23,18 @@ from my_opcua.ua.uaerrors import UaStatusCodeError
 from contextlib import suppress
 
 
+# binary encoded ScanSettings structure of the rf310 Scan method
+SCAN_SETTINGS_TYPEID = ua.FourByteNodeId(5015, 3)
+SCAN_SETTINGS = b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x34\x40\x14\x00\x00\x00\x00'
+
+
+def scan_settings():
+    settings = ua.ExtensionObject()
+    settings.TypeId = SCAN_SETTINGS_TYPEID
+    settings.Body = SCAN_SETTINGS
+    return ua.Variant(settings, ua.VariantType.ExtensionObject)
+
+
 def add_minimum_args(parser):
     parser.add_argument("-u",
                         "--url",
@@ -234,7 +246,7 @@ def prepare():
     client.connect()
     try:
         node = get_node(client, args)
-        val = (_val_to_variant('magicwordxx', args),)
+        val = (scan_settings(),)
 
         # determine method to call: Either explicitly given or automatically select the method of the selected node.
         methods = node.get_methods()
@@ -264,13 +276,13 @@ def prepare():
 
         # for _ in range(1):
         #    with suppress(Exception):
-        return client, node, method_id, val
+        return client, node.prepare_call_method(method_id, *val)
     finally:
         pass
 
 
-def call_read(node, method_id, val):
-    result_variants = node.call_method(method_id, *val)
+def call_read(call):
+    result_variants = call.call()
     ids = []
     for res in result_variants[0]:
         ids.append(res.Body.hex()[50:][:24])
@@ -278,10 +290,10 @@ def call_read(node, method_id, val):
 
 
 if __name__ == "__main__":
-    client, node, method_id, val = prepare()
+    client, call = prepare()
 
     try:
-        ids = call_read(node, method_id, val)
+        ids = call_read(call)
         print(ids)
     finally:
         client.disconnect()